@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of the CMAB arm lookup: hash index (ArmIndex) against masking the
+full configuration table (MaskArmIndex).
+
+Run from the repository root:
+    python -m benchmarks.arm_lookup
+"""
+
+import time
+
+import numpy as np
+
+from models.arm_index import ArmIndex, MaskArmIndex
+from models.cmab import EpsilonGreedy
+from models.event_log import WARNING, log
+from use_cases.experiment import swim_fm_variant
+
+# (dimmer, requestArrivalRate) interval sizes
+INTERVAL_SIZES = [(0.2, 25), (0.05, 5), (0.02, 2), (0.01, 1)]
+
+
+def time_cycles(cmab: EpsilonGreedy, configurations: list, repetitions: int) -> float:
+    # one cycle = update of the current arm + selection of the next one
+    start = time.perf_counter()
+    with log.at_level(WARNING):
+        for _ in range(repetitions):
+            for configuration in configurations:
+                cmab.update_arm(configuration, 1.0)
+                cmab.select_arm(configuration)
+    return (time.perf_counter() - start) / (repetitions * len(configurations))
+
+
+def run(num_configurations: int = 20, repetitions: int = 5):
+    print(
+        "{:>8} {:>10} {:>14} {:>14} {:>8}".format(
+            "arms", "contexts", "mask [ms]", "index [ms]", "speedup"
+        )
+    )
+    rng = np.random.default_rng(0)
+    for dimmer_interval, arrival_rate_interval in INTERVAL_SIZES:
+        feature_model = swim_fm_variant(
+            dimmer_interval, arrival_rate_interval, cache_dir=None
+        )
+        space = feature_model.configuration_space
+        configurations = [
+            space.decode(int(row_id))
+            for row_id in rng.integers(len(space), size=num_configurations)
+        ]
+
+        index = ArmIndex(space)
+        mask_cmab = EpsilonGreedy(
+            feature_model,
+            epsilon=0.5,
+            learning_rate=0.1,
+            arm_index=MaskArmIndex(feature_model),
+        )
+        index_cmab = EpsilonGreedy(
+            feature_model, epsilon=0.5, learning_rate=0.1, arm_index=index
+        )
+
+        mask_time = time_cycles(mask_cmab, configurations, repetitions)
+        index_time = time_cycles(index_cmab, configurations, repetitions)
+        print(
+            "{:>8} {:>10} {:>14.3f} {:>14.3f} {:>8.1f}".format(
+                len(space),
+                len(index),
+                mask_time * 1000,
+                index_time * 1000,
+                mask_time / index_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,128 @@
+"""
+Benchmark of the DeltaIoT clients against the local stub server: one round trip
+per QoS request against one pipelined batch, over one persistent connection. The
+stub writes its responses in small chunks, so every response is decoded from many
+reads.
+
+Run from the repository root:
+    python -m benchmarks.deltaiot_pipelining
+"""
+
+import asyncio
+import threading
+import time
+
+from use_cases.deltaiot.deltaiot_client import (
+    AsyncDeltaIoTClient,
+    DeltaIoTClient,
+    latest_qos,
+    qos_request,
+)
+from use_cases.deltaiot.deltaiot_stub_server import DeltaIoTStubServer
+
+# bytes per write of the stub server
+CHUNK_SIZE = 16
+
+
+def start_server(stub: DeltaIoTStubServer) -> tuple[str, int]:
+    # serves in a background thread, returns the address
+    started = threading.Event()
+    address = []
+
+    async def serve():
+        server = await stub.start("localhost", 0)
+        address.extend(server.sockets[0].getsockname()[:2])
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    started.wait()
+    return address[0], address[1]
+
+
+def check(responses: list, first_period: int) -> None:
+    # every response holds one more period than the one before
+    for offset, response in enumerate(responses):
+        if len(response) != first_period + offset + 1:
+            raise ValueError("Response out of order", offset, len(response))
+        packet_loss, energy_consumption = latest_qos(response)
+        if not (0 <= packet_loss <= 1 and energy_consumption > 0):
+            raise ValueError("Invalid QoS", packet_loss, energy_consumption)
+
+
+def time_sync(stub: DeltaIoTStubServer, client: DeltaIoTClient, batch_size: int):
+    stub.periods = {}
+    start = time.perf_counter()
+    responses = [client.get_qos() for _ in range(batch_size)]
+    sequential = time.perf_counter() - start
+    check(responses, 0)
+
+    # same response sizes as the sequential requests
+    stub.periods = {}
+    start = time.perf_counter()
+    responses = client.send_requests([qos_request()] * batch_size)
+    pipelined = time.perf_counter() - start
+    check(responses, 0)
+    return sequential, pipelined
+
+
+async def time_async(
+    stub: DeltaIoTStubServer, client: AsyncDeltaIoTClient, batch_size: int
+):
+    stub.periods = {}
+    start = time.perf_counter()
+    responses = [await client.get_qos() for _ in range(batch_size)]
+    sequential = time.perf_counter() - start
+    check(responses, 0)
+
+    # same response sizes as the sequential requests
+    stub.periods = {}
+    start = time.perf_counter()
+    responses = await client.send_requests([qos_request()] * batch_size)
+    pipelined = time.perf_counter() - start
+    check(responses, 0)
+    return sequential, pipelined
+
+
+async def run_async(stub, address, batch_sizes):
+    client = AsyncDeltaIoTClient()
+    await client.connect(*address)
+    try:
+        return [await time_async(stub, client, size) for size in batch_sizes]
+    finally:
+        await client.disconnect()
+
+
+def run(batch_sizes=(1, 10, 100)):
+    stub = DeltaIoTStubServer(chunk_size=CHUNK_SIZE, seed=0)
+    address = start_server(stub)
+
+    client = DeltaIoTClient()
+    client.connect(*address)
+    try:
+        sync_times = [time_sync(stub, client, size) for size in batch_sizes]
+    finally:
+        client.disconnect()
+    async_times = asyncio.run(run_async(stub, address, batch_sizes))
+
+    print(
+        "{:>8} {:>8} {:>16} {:>16} {:>8}".format(
+            "client", "requests", "sequential [ms]", "pipelined [ms]", "speedup"
+        )
+    )
+    for name, times in [("sync", sync_times), ("async", async_times)]:
+        for batch_size, (sequential, pipelined) in zip(batch_sizes, times):
+            print(
+                "{:>8} {:>8} {:>16.2f} {:>16.2f} {:>8.1f}".format(
+                    name,
+                    batch_size,
+                    sequential * 1000,
+                    pipelined * 1000,
+                    sequential / pipelined,
+                )
+            )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,59 @@
+"""
+Benchmark of the NumericalFM start up: compiling the feature model against loading
+it from the compiled feature model cache.
+
+Run from the repository root:
+    python -m benchmarks.fm_cache
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fm_enumeration import synthetic_fm_json
+from models.feature_model import NumericalFM
+
+
+def timed_load(json_file: str, cache_dir: str | None, repetitions: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        NumericalFM(json_file, cache_dir=cache_dir)
+    return (time.perf_counter() - start) / repetitions
+
+
+def run(groups=(2, 4, 6, 8), repetitions: int = 3):
+    print(
+        "{:>8} {:>10} {:>14} {:>14} {:>8}".format(
+            "features", "valid", "compile [ms]", "cached [ms]", "speedup"
+        )
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        cache_dir = os.path.join(directory, "cache")
+        for num_groups in groups:
+            fm_json = synthetic_fm_json(num_groups)
+            # a numerical context feature, expanded into its intervals
+            fm_json["context"].append(["load", "real", 0, 100, "mandatory"])
+            fm_json["structure"][-1][1].append("load")
+            fm_json["interval size"]["load"] = 5
+            json_file = os.path.join(directory, "fm{}.json".format(num_groups))
+            with open(json_file, "w") as file:
+                json.dump(fm_json, file)
+
+            compile_time = timed_load(json_file, None, repetitions)
+            # first start fills the cache
+            feature_model = NumericalFM(json_file, cache_dir=cache_dir)
+            cached_time = timed_load(json_file, cache_dir, repetitions)
+            print(
+                "{:>8} {:>10} {:>14.2f} {:>14.2f} {:>8.1f}".format(
+                    len(feature_model.features),
+                    len(feature_model.configuration_space.valid_table),
+                    compile_time * 1000,
+                    cached_time * 1000,
+                    compile_time / cached_time,
+                )
+            )
+
+
+if __name__ == "__main__":
+    run()
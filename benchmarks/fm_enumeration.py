@@ -0,0 +1,112 @@
+"""
+Benchmark of the configuration enumeration engines on synthetic feature models.
+
+Run from the repository root:
+    python -m benchmarks.fm_enumeration
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from models.enumeration import CNF_ENGINE, SYMPY
+from models.feature_model import FM
+
+# sympy evaluates all 2^n rows, skip it above this number of features
+SYMPY_MAX_FEATURES = 16
+
+
+def synthetic_fm_json(num_groups: int, group_size: int = 3) -> dict:
+    # every group is a mandatory system feature with alternative children plus one
+    # optional context feature, i.e. 3 + num_groups * (group_size + 2) features
+    fm_json = {
+        "system": [],
+        "context": [],
+        "structure": [],
+        "cross tree constraints": [],
+        "interval size": {},
+    }
+    system_children = []
+    context_children = []
+    for group in range(num_groups):
+        group_name = "group{}".format(group)
+        fm_json["system"].append([group_name, "bool", 1, 1, "mandatory"])
+        system_children.append(group_name)
+        children = []
+        for child in range(group_size):
+            child_name = "{}_option{}".format(group_name, child)
+            fm_json["system"].append([child_name, "bool", 1, 1, "optional"])
+            children.append(child_name)
+        fm_json["structure"].append([group_name, children, "alternative"])
+
+        context_name = "context{}".format(group)
+        fm_json["context"].append([context_name, "bool", 1, 1, "optional"])
+        context_children.append(context_name)
+
+    fm_json["structure"].append(["system", system_children, "no_group"])
+    fm_json["structure"].append(["context", context_children, "no_group"])
+    return fm_json
+
+
+def load_fm(fm_json: dict, engine: str) -> FM:
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+        json.dump(fm_json, file)
+    try:
+        return FM(file.name, enumeration_engine=engine)
+    finally:
+        os.remove(file.name)
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def check_swim_fm():
+    file_path = os.path.join("use_cases", "swim", "swim_fm.json")
+    sympy_rows = FM(file_path, enumeration_engine=SYMPY).generate_truth_table()
+    cnf_rows = FM(file_path, enumeration_engine=CNF_ENGINE).generate_truth_table()
+    assert sympy_rows == cnf_rows, "CNF engine differs from sympy on swim_fm.json"
+    print("swim_fm.json: {} valid configurations, engines agree".format(len(cnf_rows)))
+
+
+def run(max_enumeration_groups: int = 7, count_groups=(10, 20, 40, 80)):
+    check_swim_fm()
+    print(
+        "{:>8} {:>10} {:>12} {:>14} {:>12}".format(
+            "features", "valid", "sympy [s]", "cnf enum [s]", "cnf count [s]"
+        )
+    )
+    for num_groups in range(1, max_enumeration_groups + 1):
+        fm_json = synthetic_fm_json(num_groups)
+        fm = load_fm(fm_json, CNF_ENGINE)
+        num_features = len(fm.features)
+
+        cnf_rows, cnf_time = timed(fm.generate_truth_table)
+        count, count_time = timed(fm.count_valid_configurations)
+        assert count == len(cnf_rows)
+
+        sympy_time = float("nan")
+        if num_features <= SYMPY_MAX_FEATURES:
+            sympy_fm = load_fm(fm_json, SYMPY)
+            sympy_rows, sympy_time = timed(sympy_fm.generate_truth_table)
+            assert sympy_rows == cnf_rows
+
+        print(
+            "{:>8} {:>10} {:>12.4f} {:>14.4f} {:>12.4f}".format(
+                num_features, count, sympy_time, cnf_time, count_time
+            )
+        )
+
+    # counting does not enumerate, so it scales beyond the enumerable models
+    print("{:>8} {:>26} {:>12}".format("features", "valid", "cnf count [s]"))
+    for num_groups in count_groups:
+        fm = load_fm(synthetic_fm_json(num_groups), CNF_ENGINE)
+        count, count_time = timed(fm.count_valid_configurations)
+        print("{:>8} {:>26} {:>12.4f}".format(len(fm.features), count, count_time))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the compact ordinal encoding (OrdinalTable) against the one-hot
+configuration table (NumericalFM.valid_configurations_numerical): memory and the
+evaluation of masks over context and full configurations.
+
+Run from the repository root:
+    python -m benchmarks.ordinal_encoding
+"""
+
+import time
+
+import numpy as np
+
+from models.arm_index import MaskArmIndex
+from use_cases.experiment import swim_fm_variant
+
+# (dimmer, requestArrivalRate) interval sizes
+INTERVAL_SIZES = [(0.2, 25), (0.05, 5), (0.02, 2), (0.01, 1)]
+
+
+def time_masks(match, configurations: list, repetitions: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for configuration in configurations:
+            match(configuration)
+    return (time.perf_counter() - start) / (repetitions * len(configurations))
+
+
+def run(num_configurations: int = 20, repetitions: int = 5):
+    print(
+        "{:>8} {:>14} {:>14} {:>14} {:>14} {:>8}".format(
+            "arms",
+            "one-hot [MB]",
+            "ordinal [MB]",
+            "mask [ms]",
+            "ordinal [ms]",
+            "speedup",
+        )
+    )
+    rng = np.random.default_rng(0)
+    for dimmer_interval, arrival_rate_interval in INTERVAL_SIZES:
+        feature_model = swim_fm_variant(
+            dimmer_interval, arrival_rate_interval, cache_dir=None
+        )
+        space = feature_model.configuration_space
+        one_hot = feature_model.valid_configurations_numerical
+        ordinal = feature_model.valid_configurations_ordinal
+        mask_index = MaskArmIndex(feature_model)
+
+        configurations = [
+            space.decode(int(row_id))
+            for row_id in rng.integers(len(space), size=num_configurations)
+        ]
+        # the masks of an arm lookup: the context, then the full configuration
+        masks = [
+            configuration.loc[space.context_columns] for configuration in configurations
+        ] + configurations
+        for configuration in masks:
+            if not np.array_equal(
+                mask_index.context_rows(configuration),
+                ordinal.matching_rows(configuration),
+            ):
+                raise ValueError("Masks differ", configuration)
+
+        mask_time = time_masks(mask_index.context_rows, masks, repetitions)
+        ordinal_time = time_masks(ordinal.matching_rows, masks, repetitions)
+        print(
+            "{:>8} {:>14.3f} {:>14.3f} {:>14.3f} {:>14.3f} {:>8.1f}".format(
+                len(space),
+                one_hot.memory_usage(index=True).sum() / 2**20,
+                ordinal.nbytes / 2**20,
+                mask_time * 1000,
+                ordinal_time * 1000,
+                mask_time / ordinal_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    run()
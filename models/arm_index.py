@@ -0,0 +1,161 @@
+import numpy as np
+import pandas
+
+from models.configuration_space import ConfigurationSpace
+from models.feature_model import NumericalFM
+
+
+class ArmIndex:
+    """
+    Hash index of the arms (configuration rows) of a feature model, built once from
+    the configuration space. Maps every context to the rows of its valid arms and
+    every full configuration to its row id. Contexts are numbered in the order of
+    their first row.
+    """
+
+    def __init__(self, configuration_space: ConfigurationSpace) -> None:
+        self.configuration_space = configuration_space
+        self.context_columns = configuration_space.context_columns
+        context_positions = configuration_space.columns.get_indexer(
+            self.context_columns
+        )
+
+        arms = {}
+        for boolean_row_index in range(len(configuration_space.radices)):
+            offset = configuration_space.row_offsets[boolean_row_index]
+            ranks = configuration_space.block_ranks(boolean_row_index)
+
+            # rows of the block sharing the same context digits share the context
+            context_code = configuration_space.context_codes(boolean_row_index, ranks)
+            _, first_rows, inverse = np.unique(
+                context_code, return_index=True, return_inverse=True
+            )
+            rows_per_context = np.split(
+                np.argsort(inverse, kind="stable"), np.cumsum(np.bincount(inverse))[:-1]
+            )
+
+            for first_row, rows in zip(first_rows, rows_per_context):
+                row = configuration_space.row(offset + int(first_row))
+                key = tuple(row[position] for position in context_positions)
+                arms.setdefault(key, []).append(offset + rows)
+
+        context_arms = {key: np.concatenate(rows) for key, rows in arms.items()}
+        keys = sorted(context_arms, key=lambda key: context_arms[key][0])
+        self.context_ids = {key: context_id for context_id, key in enumerate(keys)}
+        self.context_arms = [context_arms[key] for key in keys]
+
+        # arms of every context, left aligned and padded with -1
+        max_arms = max((len(rows) for rows in self.context_arms), default=0)
+        self.arm_matrix = np.full((len(self.context_arms), max_arms), -1, np.int64)
+        # context id of every row
+        self.row_contexts = np.empty(len(configuration_space), dtype=np.int64)
+        for context_id, rows in enumerate(self.context_arms):
+            self.arm_matrix[context_id, : len(rows)] = rows
+            self.row_contexts[rows] = context_id
+
+    def __len__(self) -> int:
+        # number of contexts
+        return len(self.context_arms)
+
+    def context_id(self, context: pandas.Series) -> int:
+        try:
+            return self.context_ids[tuple(context.loc[self.context_columns])]
+        except KeyError:
+            raise ValueError("Context is not part of the feature model", context)
+
+    def context_rows(self, context: pandas.Series) -> np.ndarray:
+        return self.context_arms[self.context_id(context)]
+
+    def context_ids_of(self, contexts: pandas.DataFrame) -> np.ndarray:
+        # one context (or configuration) per row
+        try:
+            return np.array(
+                [
+                    self.context_ids[key]
+                    for key in contexts[self.context_columns].itertuples(
+                        index=False, name=None
+                    )
+                ],
+                dtype=np.int64,
+            )
+        except KeyError as err:
+            raise ValueError("Context is not part of the feature model", err.args[0])
+
+    def row_id(self, configuration: pandas.Series) -> int:
+        return self.configuration_space.encode(configuration)
+
+    def row_ids(self, configurations: pandas.DataFrame) -> np.ndarray:
+        return self.configuration_space.encode_rows(configurations)
+
+
+class MaskArmIndex:
+    """
+    Arm lookup by masking the full configuration table on every call, O(rows x
+    columns). Reference implementation to compare ArmIndex against, with the same
+    context ids.
+    """
+
+    def __init__(self, feature_model: NumericalFM) -> None:
+        self.valid_configurations = feature_model.valid_configurations_numerical
+        self.context_columns = feature_model.context_feature_names
+        # contexts in the order of their first row, as in ArmIndex
+        contexts = self.valid_configurations[self.context_columns].drop_duplicates()
+        self.context_ids = {
+            key: context_id
+            for context_id, key in enumerate(
+                contexts.itertuples(index=False, name=None)
+            )
+        }
+        self._arm_matrix = None
+
+    def __len__(self) -> int:
+        # number of contexts
+        return len(self.context_ids)
+
+    def context_rows(self, context: pandas.Series) -> np.ndarray:
+        columns_to_check = context.index
+        mask = (self.valid_configurations[columns_to_check] == context).all(axis=1)
+        return np.flatnonzero(mask.to_numpy())
+
+    def context_ids_of(self, contexts: pandas.DataFrame) -> np.ndarray:
+        # one context (or configuration) per row
+        try:
+            return np.array(
+                [
+                    self.context_ids[key]
+                    for key in contexts[self.context_columns].itertuples(
+                        index=False, name=None
+                    )
+                ],
+                dtype=np.int64,
+            )
+        except KeyError as err:
+            raise ValueError("Context is not part of the feature model", err.args[0])
+
+    @property
+    def arm_matrix(self) -> np.ndarray:
+        # arms of every context, left aligned and padded with -1, masked on first use
+        if self._arm_matrix is None:
+            context_arms = [
+                self.context_rows(pandas.Series(key, index=self.context_columns))
+                for key in self.context_ids
+            ]
+            max_arms = max((len(rows) for rows in context_arms), default=0)
+            arm_matrix = np.full((len(context_arms), max_arms), -1, np.int64)
+            for context_id, rows in enumerate(context_arms):
+                arm_matrix[context_id, : len(rows)] = rows
+            self._arm_matrix = arm_matrix
+        return self._arm_matrix
+
+    def row_id(self, configuration: pandas.Series) -> int:
+        columns_to_check = configuration.index
+        mask = (self.valid_configurations[columns_to_check] == configuration).all(
+            axis=1
+        )
+        return int(mask.idxmax())
+
+    def row_ids(self, configurations: pandas.DataFrame) -> np.ndarray:
+        row_ids = [
+            self.row_id(configuration) for _, configuration in configurations.iterrows()
+        ]
+        return np.array(row_ids, dtype=np.int64)
@@ -0,0 +1,206 @@
+import os
+
+import numpy as np
+import pandas
+
+from models.configuration_space import ArmMapping
+
+REWARD = "R"
+NUMBER_PULLS = "N"
+
+
+class ArmStore:
+    """
+    Class used to store the learned statistics of the arms of a CMAB in contiguous
+    arrays indexed by arm id (row id of the configuration space)
+    """
+
+    def __init__(self, num_arms: int) -> None:
+        """
+        num_arms: int
+            number of arms, i.e. rows of the configuration space
+        """
+        # learned reward (moving average or sample mean), number of pulls
+        self.rewards = np.zeros(num_arms, dtype=np.float64)
+        self.pulls = np.zeros(num_arms, dtype=np.int64)
+        # sufficient statistics of the observed rewards
+        self.reward_sums = np.zeros(num_arms, dtype=np.float64)
+        self.reward_squared_sums = np.zeros(num_arms, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.rewards)
+
+    def update(
+        self, arm_id: int, reward: float, learning_rate: float | None = None
+    ) -> None:
+        """
+        learning_rate: float or None
+            step size of the learned reward, None for the sample mean
+        """
+        self.pulls[arm_id] += 1
+        if learning_rate is None:
+            learning_rate = 1 / self.pulls[arm_id]
+        r = self.rewards[arm_id]
+        self.rewards[arm_id] = r + learning_rate * (reward - r)
+        self.reward_sums[arm_id] += reward
+        self.reward_squared_sums[arm_id] += reward * reward
+
+    def update_many(
+        self,
+        arm_ids: np.ndarray,
+        rewards: np.ndarray,
+        learning_rate: float | None = None,
+    ) -> None:
+        """
+        Same result as calling update for every (arm_id, reward) in order. Repeated
+        arms are applied in rounds, one occurrence per round.
+        """
+        arm_ids = np.asarray(arm_ids, dtype=np.int64)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        while len(arm_ids) > 0:
+            round_arms, first = np.unique(arm_ids, return_index=True)
+            round_rewards = rewards[first]
+
+            self.pulls[round_arms] += 1
+            if learning_rate is None:
+                step = 1 / self.pulls[round_arms]
+            else:
+                step = learning_rate
+            r = self.rewards[round_arms]
+            self.rewards[round_arms] = r + step * (round_rewards - r)
+            self.reward_sums[round_arms] += round_rewards
+            self.reward_squared_sums[round_arms] += round_rewards * round_rewards
+
+            remaining = np.ones(len(arm_ids), dtype=bool)
+            remaining[first] = False
+            arm_ids = arm_ids[remaining]
+            rewards = rewards[remaining]
+
+    def gather(self, values: np.ndarray, arm_ids: np.ndarray, fill=0) -> np.ndarray:
+        # values of the given arm ids, fill where the arm id is -1 (padding)
+        return np.where(arm_ids >= 0, values[arm_ids], fill)
+
+    def means(self, arm_ids: np.ndarray) -> np.ndarray:
+        # sample mean of the observed rewards, 0 for arms never pulled or padding
+        pulls = self.gather(self.pulls, arm_ids)
+        return np.divide(
+            self.gather(self.reward_sums, arm_ids),
+            pulls,
+            out=np.zeros(np.shape(arm_ids), dtype=np.float64),
+            where=pulls > 0,
+        )
+
+    def noise_variance(
+        self, arm_matrix: np.ndarray, default: float = 1.0
+    ) -> np.ndarray:
+        """
+        Pooled within-arm variance of the rewards of every row of arms (padded with
+        -1). Falls back to the variance over all rewards of the row and to default
+        when there are too few pulls.
+        """
+        pulls = self.gather(self.pulls, arm_matrix)
+        sums = self.gather(self.reward_sums, arm_matrix)
+        squared_sums = self.gather(self.reward_squared_sums, arm_matrix)
+        total_pulls = pulls.sum(axis=1)
+        total_sums = sums.sum(axis=1)
+        total_squared_sums = squared_sums.sum(axis=1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            squared_means = np.where(pulls > 0, sums**2 / pulls, 0.0).sum(axis=1)
+            within_degrees = total_pulls - np.count_nonzero(pulls, axis=1)
+            within = (total_squared_sums - squared_means) / within_degrees
+            total = (total_squared_sums - total_sums**2 / total_pulls) / (
+                total_pulls - 1
+            )
+        variance = np.where(
+            (within_degrees > 0) & (within > 0),
+            within,
+            np.where((total_pulls > 1) & (total > 0), total, default),
+        )
+        return variance
+
+    def copy(self) -> "ArmStore":
+        arm_store = ArmStore(0)
+        arm_store.rewards = self.rewards.copy()
+        arm_store.pulls = self.pulls.copy()
+        arm_store.reward_sums = self.reward_sums.copy()
+        arm_store.reward_squared_sums = self.reward_squared_sums.copy()
+        return arm_store
+
+    def migrate(self, arm_mapping: ArmMapping) -> "ArmStore":
+        """
+        Statistics for the arms of a recompiled feature model. An old arm's
+        statistics are copied to every new arm it maps to, a new arm with many old
+        arms pools them (pulls and reward sums add up, the learned reward is their
+        pull weighted mean). New arms without an old arm start unexplored.
+        """
+        if len(self) != arm_mapping.num_old_arms:
+            raise ValueError(
+                "Arm mapping does not match the number of arms",
+                len(self),
+                arm_mapping.num_old_arms,
+            )
+        old_ids = arm_mapping.old_ids
+        new_ids = arm_mapping.new_ids
+        num_arms = arm_mapping.num_new_arms
+
+        def pooled(values):
+            return np.bincount(new_ids, weights=values[old_ids], minlength=num_arms)
+
+        arm_store = ArmStore(num_arms)
+        arm_store.pulls = pooled(self.pulls).astype(np.int64)
+        arm_store.reward_sums = pooled(self.reward_sums)
+        arm_store.reward_squared_sums = pooled(self.reward_squared_sums)
+        weighted_rewards = pooled(self.rewards * self.pulls)
+        np.divide(
+            weighted_rewards,
+            arm_store.pulls,
+            out=arm_store.rewards,
+            where=arm_store.pulls > 0,
+        )
+        return arm_store
+
+    def save(self, path: str, structure_hash: str) -> None:
+        """
+        Write a binary snapshot (.npz). The file is replaced atomically, so readers
+        never see a partially written checkpoint.
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(
+                file,
+                structure_hash=np.array(structure_hash),
+                rewards=self.rewards,
+                pulls=self.pulls,
+                reward_sums=self.reward_sums,
+                reward_squared_sums=self.reward_squared_sums,
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, structure_hash: str | None = None) -> "ArmStore":
+        """
+        structure_hash: str
+            hash of the feature model the store is loaded for, a checkpoint of a
+            different feature model raises a ValueError
+        """
+        with np.load(path) as snapshot:
+            if (
+                structure_hash is not None
+                and str(snapshot["structure_hash"]) != structure_hash
+            ):
+                raise ValueError(
+                    "Checkpoint does not match the feature model structure", path
+                )
+            arm_store = cls(0)
+            arm_store.rewards = snapshot["rewards"]
+            arm_store.pulls = snapshot["pulls"]
+            arm_store.reward_sums = snapshot["reward_sums"]
+            arm_store.reward_squared_sums = snapshot["reward_squared_sums"]
+        return arm_store
+
+    def total_pulls(self) -> int:
+        return int(self.pulls.sum())
+
+    def to_dataframe(self) -> pandas.DataFrame:
+        return pandas.DataFrame({REWARD: self.rewards, NUMBER_PULLS: self.pulls})
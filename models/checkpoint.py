@@ -0,0 +1,50 @@
+import queue
+import threading
+
+from models.arm_store import ArmStore
+from models.event_log import log
+
+
+class CheckpointWriter:
+    """
+    Writes ArmStore snapshots from a background thread. submit only copies the
+    arrays, the file is written by the thread. If the thread is still busy, a newer
+    snapshot replaces the pending one.
+    """
+
+    def __init__(self, path: str, structure_hash: str) -> None:
+        self.path = path
+        self.structure_hash = structure_hash
+        self.num_written = 0
+
+        self._pending = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, arm_store: ArmStore) -> None:
+        snapshot = arm_store.copy()
+        while True:
+            try:
+                self._pending.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self._pending.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def close(self) -> None:
+        # waits until the last submitted snapshot is written
+        self._pending.put(None)
+        self._thread.join()
+
+    def _write_loop(self) -> None:
+        while True:
+            snapshot = self._pending.get()
+            if snapshot is None:
+                return
+            try:
+                snapshot.save(self.path, self.structure_hash)
+                self.num_written += 1
+            except OSError as err:
+                log.error("checkpoint_not_written", error=err, path=self.path)
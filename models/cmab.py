@@ -1,79 +1,143 @@
 import numpy as np
 import pandas
 
+from models.arm_index import ArmIndex, MaskArmIndex
+from models.arm_store import ArmStore
+from models.configuration_space import ArmMapping
+from models.event_log import log
 from models.feature_model import NumericalFM
 
-REWARD = "R"
-NUMBER_PULLS = "N"
+# epsilon decays
+LINEAR = "linear"
+EXPONENTIAL = "exponential"
+INVERSE = "inverse"
 
 
 class CMAB:
     # Contextual Multi Armed Bandit
 
-    def __init__(self, feature_model: NumericalFM):
-        self.valid_configurations = feature_model.valid_configurations_numerical
+    def __init__(
+        self,
+        feature_model: NumericalFM,
+        arm_index: ArmIndex | MaskArmIndex | None = None,
+        arm_store: ArmStore | None = None,
+    ):
+        self.feature_model = feature_model
+        self.configuration_space = feature_model.configuration_space
         self.context_features = feature_model.context_feature_names
+        if arm_index is None:
+            arm_index = ArmIndex(self.configuration_space)
+        self.arm_index = arm_index
+        if arm_store is None:
+            arm_store = ArmStore(len(self.configuration_space))
+        self.arm_store = arm_store
+        # None: learned reward is the sample mean
+        self.learning_rate = None
+
+    def migrate(self, arm_mapping: ArmMapping) -> None:
+        """
+        Follows an incremental recompilation of the feature model (e.g.
+        NumericalFM.set_interval_size): rebuilds the arm index and keeps the learned
+        statistics of the arms through arm_mapping instead of discarding them. In an
+        adaptation loop use AdaptationLogic.migrate, which also updates the
+        simulator interface.
+        """
+        self.configuration_space = self.feature_model.configuration_space
+        self.context_features = self.feature_model.context_feature_names
+        if isinstance(self.arm_index, MaskArmIndex):
+            self.arm_index = MaskArmIndex(self.feature_model)
+        else:
+            self.arm_index = ArmIndex(self.configuration_space)
+        self.arm_store = self.arm_store.migrate(arm_mapping)
 
     def select_arm(self, configuration: pandas.Series) -> pandas.Series:
-        pass
+        # extract context
+        context = configuration.loc[self.context_features]
+        arms = self.arm_index.context_rows(context)
+        return self.configuration_space.decode(int(self.choose_arm(arms)))
 
-    def update_arm(self, configuration: pandas.Series, reward: float):
+    def select_arms(self, contexts: pandas.DataFrame | np.ndarray) -> pandas.DataFrame:
+        """
+        Select one arm per row of contexts in one vectorized pass.
+
+        contexts: pandas.DataFrame or numpy.ndarray
+            DataFrame containing the context features (e.g. the monitored
+            configurations of many managed systems), or array of context ids
+        """
+        if isinstance(contexts, pandas.DataFrame):
+            context_ids = self.arm_index.context_ids_of(contexts)
+        else:
+            context_ids = np.asarray(contexts, dtype=np.int64)
+        arm_ids = self.choose_arms(self.arm_index.arm_matrix[context_ids])
+        return self.configuration_space.decode_rows(arm_ids)
+
+    def choose_arm(self, arms: np.ndarray) -> int:
+        # pick one of the arm ids of a context
+        return self.choose_arms(arms[np.newaxis, :])[0]
+
+    def choose_arms(self, arm_matrix: np.ndarray) -> np.ndarray:
+        # pick one arm id per row of arm ids, rows are padded with -1
         pass
 
+    def update_arm(self, configuration: pandas.Series, reward: float) -> None:
+        index_of_config = self.arm_index.row_id(configuration)
+        self.arm_store.update(index_of_config, reward, self.learning_rate)
+
+    def update_arms(
+        self,
+        configurations: pandas.DataFrame | np.ndarray,
+        rewards: np.ndarray,
+    ) -> None:
+        """
+        configurations: pandas.DataFrame or numpy.ndarray
+            configurations (one per row) or their row ids
+        rewards: numpy.ndarray
+            reward of every configuration
+        """
+        if isinstance(configurations, pandas.DataFrame):
+            arm_ids = self.arm_index.row_ids(configurations)
+        else:
+            arm_ids = np.asarray(configurations, dtype=np.int64)
+        self.arm_store.update_many(arm_ids, rewards, self.learning_rate)
+
 
 class EpsilonGreedy(CMAB):
 
     def __init__(
-        self, feature_model: NumericalFM, epsilon: float, learning_rate: float
+        self,
+        feature_model: NumericalFM,
+        epsilon: float,
+        learning_rate: float,
+        arm_index: ArmIndex | MaskArmIndex | None = None,
+        arm_store: ArmStore | None = None,
     ):
 
-        super().__init__(feature_model)
+        super().__init__(feature_model, arm_index, arm_store)
         self.epsilon = epsilon
         self.learning_rate = learning_rate
 
-        self.valid_configurations[REWARD] = pandas.Series(
-            [0.0] * self.valid_configurations.shape[0]
-        )
-        self.valid_configurations[NUMBER_PULLS] = pandas.Series(
-            [0] * self.valid_configurations.shape[0]
-        )
-
-    def select_arm(self, configuration):
-        # extract context
-        context = configuration.loc[self.context_features]
-
-        columns_to_check = context.index
-        mask = (self.valid_configurations[columns_to_check] == context).all(axis=1)
-        matching_configs = self.valid_configurations[mask]
-
+    def choose_arm(self, arms: np.ndarray) -> int:
         if np.random.rand() < self.epsilon:
-            print("CMAB random")
-            return matching_configs.sample().iloc[0]
-        else:
-            print("CMAB max")
-            best_config = matching_configs.loc[matching_configs[REWARD].idxmax()].drop(
-                ["R", "N"]
-            )
-            return best_config
+            log.debug("cmab_choice", choice="random")
+            return np.random.choice(arms)
+        log.debug("cmab_choice", choice="max")
+        return arms[np.argmax(self.arm_store.rewards[arms])]
 
-    def update_arm(self, configuration: pandas.Series, reward: float) -> None:
-
-        columns_to_check = configuration.index
-        mask = (self.valid_configurations[columns_to_check] == configuration).all(
-            axis=1
-        )
-        index_of_config = mask.idxmax()
+    def choose_arms(self, arm_matrix: np.ndarray) -> np.ndarray:
+        rows = np.arange(len(arm_matrix))
+        num_arms = np.count_nonzero(arm_matrix >= 0, axis=1)
 
-        # TODO update R and N
-        r = self.valid_configurations.loc[index_of_config, "R"]
-        self.valid_configurations.loc[index_of_config, "R"] = r + self.learning_rate * (
-            reward - r
+        random_arms = arm_matrix[
+            rows, (np.random.rand(len(rows)) * num_arms).astype(int)
+        ]
+        rewards = self.arm_store.gather(self.arm_store.rewards, arm_matrix, -np.inf)
+        best_arms = arm_matrix[rows, np.argmax(rewards, axis=1)]
+        return np.where(
+            np.random.rand(len(rows)) < self.epsilon, random_arms, best_arms
         )
-        n = self.valid_configurations.loc[index_of_config, "N"]
-        self.valid_configurations.loc[index_of_config, "N"] = n + 1
 
 
-class AdaptiveEpsilonGreedy(CMAB):
+class AdaptiveEpsilonGreedy(EpsilonGreedy):
 
     def __init__(
         self,
@@ -81,36 +145,131 @@ class AdaptiveEpsilonGreedy(CMAB):
         epsilon_start: float,
         epsilon_min: float,
         decay_constant: float,
+        learning_rate: float = 0.1,
+        decay: str = LINEAR,
+        arm_index: ArmIndex | MaskArmIndex | None = None,
+        arm_store: ArmStore | None = None,
     ):
-
-        super().__init__(feature_model)
+        """
+        decay: str
+            LINEAR: epsilon_start - decay_constant * t
+            EXPONENTIAL: epsilon_start * exp(-decay_constant * t)
+            INVERSE: epsilon_start / (1 + decay_constant * t)
+            with t the number of arm pulls, bounded below by epsilon_min
+        """
+        super().__init__(
+            feature_model, epsilon_start, learning_rate, arm_index, arm_store
+        )
+        if decay not in (LINEAR, EXPONENTIAL, INVERSE):
+            raise ValueError("Invalid epsilon decay", decay)
         self.epsilon_start = epsilon_start
         self.epsilon_min = epsilon_min
         self.decay_constant = decay_constant
+        self.decay = decay
+
+        # a shared or restored arm store already counts earlier pulls
+        self.arm_pulls = self.arm_store.total_pulls()
+        self.epsilon = self.decayed_epsilon(self.arm_pulls)
 
-    def select_arm(self, configuration: pandas.Series):
-        return super().select_arm(configuration)
+    def decayed_epsilon(self, arm_pulls: int) -> float:
+        if self.decay == LINEAR:
+            epsilon = self.epsilon_start - self.decay_constant * arm_pulls
+        elif self.decay == EXPONENTIAL:
+            epsilon = self.epsilon_start * np.exp(-self.decay_constant * arm_pulls)
+        else:
+            epsilon = self.epsilon_start / (1 + self.decay_constant * arm_pulls)
+        return max(self.epsilon_min, epsilon)
 
     def update_arm(self, configuration: pandas.Series, reward: float):
         super().update_arm(configuration, reward)
         self.arm_pulls += 1
+        self.epsilon = self.decayed_epsilon(self.arm_pulls)
 
-        # Linear decay
-        self.epsilon = max(
-            self.epsilon_min,
-            self.epsilon_start - self.decay_constant * sum(self.valid_configurations),
-        )
-
-        # TODO implement other decays
+    def update_arms(self, configurations, rewards: np.ndarray):
+        super().update_arms(configurations, rewards)
+        self.arm_pulls += len(rewards)
+        self.epsilon = self.decayed_epsilon(self.arm_pulls)
 
 
 class ThompsonSampling(CMAB):
+    """
+    Thompson sampling with a Gaussian posterior of the mean reward of every arm
+    """
 
-    def __init__(self, feature_model: NumericalFM):
-        super().__init__(feature_model)
+    def __init__(
+        self,
+        feature_model: NumericalFM,
+        prior_mean: float = 0.0,
+        prior_std: float | None = None,
+        noise_std: float | None = None,
+        arm_index: ArmIndex | MaskArmIndex | None = None,
+        arm_store: ArmStore | None = None,
+    ):
+        """
+        prior_mean, prior_std: float
+            Gaussian prior of the mean reward, prior_std None for a flat prior
+            (arms never pulled are tried first)
+        noise_std: float
+            standard deviation of the rewards of an arm, None to estimate it from the
+            rewards observed in the context
+        """
+        super().__init__(feature_model, arm_index, arm_store)
+        self.prior_mean = prior_mean
+        self.prior_std = prior_std
+        self.noise_std = noise_std
 
-    def select_arm(self, context: pandas.Series):
-        pass
+    def posterior(self, arm_matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # posterior mean and standard deviation of every arm, -inf for padding
+        pulls = self.arm_store.gather(self.arm_store.pulls, arm_matrix)
+        sums = self.arm_store.gather(self.arm_store.reward_sums, arm_matrix)
+        if self.noise_std is None:
+            noise_variance = self.arm_store.noise_variance(arm_matrix)[:, np.newaxis]
+        else:
+            noise_variance = self.noise_std**2
 
-    def update_arm(self, configuration: pandas.Series, reward: float):
-        pass
+        precision = pulls / noise_variance
+        weighted_sum = sums / noise_variance
+        if self.prior_std is not None:
+            precision = precision + 1 / self.prior_std**2
+            weighted_sum = weighted_sum + self.prior_mean / self.prior_std**2
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(precision > 0, weighted_sum / precision, np.inf)
+            std = np.where(precision > 0, 1 / np.sqrt(precision), 0.0)
+        mean = np.where(arm_matrix >= 0, mean, -np.inf)
+        return mean, std
+
+    def choose_arms(self, arm_matrix: np.ndarray) -> np.ndarray:
+        mean, std = self.posterior(arm_matrix)
+        samples = np.random.normal(mean, std)
+        return arm_matrix[np.arange(len(arm_matrix)), np.argmax(samples, axis=1)]
+
+
+class UCB1(CMAB):
+    """
+    Upper confidence bound, the rewards of a context are assumed to spread over a range
+    of about exploration_factor
+    """
+
+    def __init__(
+        self,
+        feature_model: NumericalFM,
+        exploration_factor: float = 1.0,
+        arm_index: ArmIndex | MaskArmIndex | None = None,
+        arm_store: ArmStore | None = None,
+    ):
+        super().__init__(feature_model, arm_index, arm_store)
+        self.exploration_factor = exploration_factor
+
+    def scores(self, arm_matrix: np.ndarray) -> np.ndarray:
+        pulls = self.arm_store.gather(self.arm_store.pulls, arm_matrix)
+        context_pulls = np.maximum(pulls.sum(axis=1, keepdims=True), 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bonus = self.exploration_factor * np.sqrt(2 * np.log(context_pulls) / pulls)
+        # arms never pulled are tried first
+        scores = np.where(pulls > 0, self.arm_store.means(arm_matrix) + bonus, np.inf)
+        return np.where(arm_matrix >= 0, scores, -np.inf)
+
+    def choose_arms(self, arm_matrix: np.ndarray) -> np.ndarray:
+        rows = np.arange(len(arm_matrix))
+        return arm_matrix[rows, np.argmax(self.scores(arm_matrix), axis=1)]
@@ -0,0 +1,502 @@
+import bisect
+import hashlib
+import json
+import math
+
+import numpy as np
+import pandas
+
+from models.ordinal_table import OrdinalTable
+
+
+class ConfigurationSpace:
+    """
+    Class used to represent the valid configurations of a NumericalFM without
+    materializing them.
+
+    Every valid boolean configuration is expanded by the intervals of its active
+    numerical features. The rows of a boolean configuration form a mixed radix
+    number, the first numerical feature being the most significant digit, which is
+    the row order of NumericalFM.generate_numerical_truth_table.
+
+    Rows violating numerical cross-tree constraints can be pruned (row_mask), row
+    ids then number the remaining rows in the same order.
+    """
+
+    def __init__(
+        self,
+        valid_table: list[list[int]] | np.ndarray,
+        columns: list[str],
+        numerical_features: list[tuple[int, int]],
+        context_columns: list[str],
+        row_mask: np.ndarray | None = None,
+    ) -> None:
+        """
+        valid_table: list of list of int or numpy.ndarray
+            valid boolean configurations, one entry per feature
+        columns: list of str
+            feature names followed by the numerical sub-feature names
+        numerical_features: list of tuple
+            (feature index, number of intervals) of every numerical feature, in the
+            order of their sub-feature columns
+        context_columns: list of str
+            columns describing the context of a configuration
+        row_mask: numpy.ndarray
+            whether to keep every row of the unpruned configuration space, None keeps
+            all rows
+        """
+        self.columns = pandas.Index(columns)
+        self.numerical_features = numerical_features
+        self.context_columns = context_columns
+        self.num_features = len(valid_table[0]) if len(valid_table) else 0
+
+        self.column_offsets = []
+        offset = self.num_features
+        for _, num_intervals in numerical_features:
+            self.column_offsets.append(offset)
+            offset += num_intervals
+
+        # whether the intervals of a numerical feature are part of the context
+        context_positions = set(self.columns.get_indexer(context_columns))
+        self.context_digits = [
+            any(offset + interval in context_positions for interval in range(size))
+            for (_, size), offset in zip(numerical_features, self.column_offsets)
+        ]
+
+        # array views for the vectorized encoding / decoding of many rows
+        self._boolean_matrix = np.array(valid_table, dtype=np.int64).reshape(
+            len(valid_table), self.num_features
+        )
+        # radix of every numerical feature per boolean configuration, 1 if inactive
+        self._radix_matrix = np.where(
+            self._boolean_matrix[:, [index for index, _ in numerical_features]] == 1,
+            np.array([size for _, size in numerical_features], dtype=np.int64),
+            1,
+        ).reshape(len(valid_table), len(numerical_features))
+        block_sizes = np.prod(self._radix_matrix, axis=1)
+        self._row_offset_array = (np.cumsum(block_sizes) - block_sizes).astype(
+            np.int64
+        )
+        # row id in the unpruned configuration space of every row, None if unpruned
+        self._full_row_ids = None
+        self._full_row_offset_array = self._row_offset_array
+        if row_mask is not None:
+            self._full_row_ids = np.flatnonzero(row_mask).astype(np.int64)
+            boolean_rows = (
+                np.searchsorted(self._row_offset_array, self._full_row_ids, "right")
+                - 1
+            )
+            block_sizes = np.bincount(boolean_rows, minlength=len(block_sizes))
+            self._row_offset_array = (np.cumsum(block_sizes) - block_sizes).astype(
+                np.int64
+            )
+        self._block_sizes = block_sizes
+        self.num_rows = int(block_sizes.sum())
+
+        self.radices = self._radix_matrix.tolist()
+        self.row_offsets = self._row_offset_array.tolist()
+        # built on first use, expensive for large models loaded from the cache
+        self._valid_table = valid_table if isinstance(valid_table, list) else None
+        self._boolean_rows = None
+
+    @property
+    def boolean_matrix(self) -> np.ndarray:
+        # valid boolean configurations as array, one row per configuration
+        return self._boolean_matrix
+
+    @property
+    def valid_table(self) -> list[list[int]]:
+        if self._valid_table is None:
+            self._valid_table = self._boolean_matrix.tolist()
+        return self._valid_table
+
+    def _boolean_row_lookup(self) -> dict:
+        # valid boolean configuration (tuple) -> boolean row index
+        if self._boolean_rows is None:
+            self._boolean_rows = {
+                tuple(entry): boolean_row_index
+                for boolean_row_index, entry in enumerate(self.valid_table)
+            }
+        return self._boolean_rows
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def structure_hash(self) -> str:
+        # identifies the row layout, arm statistics are only valid for equal hashes
+        structure = [
+            list(self.columns),
+            self.valid_table,
+            self.numerical_features,
+            self.context_columns,
+        ]
+        if self._full_row_ids is not None:
+            structure.append(hashlib.sha256(self._full_row_ids.tobytes()).hexdigest())
+        return hashlib.sha256(json.dumps(structure).encode("utf-8")).hexdigest()
+
+    def __getitem__(self, row_id: int) -> pandas.Series:
+        return self.decode(row_id)
+
+    def _locate(self, row_id: int) -> tuple[int, list[int]]:
+        # boolean row index and interval index (digit) of every numerical feature
+        if row_id < 0 or row_id >= self.num_rows:
+            raise IndexError("Configuration row out of range", row_id)
+        boolean_row_index = bisect.bisect_right(self.row_offsets, row_id) - 1
+        rank = int(self._ranks(boolean_row_index, row_id))
+        digits = []
+        for radix in reversed(self.radices[boolean_row_index]):
+            rank, digit = divmod(rank, radix)
+            digits.append(digit)
+        digits.reverse()
+        return boolean_row_index, digits
+
+    def row(self, row_id: int) -> list[int]:
+        boolean_row_index, digits = self._locate(row_id)
+        entry = self._boolean_matrix[boolean_row_index].tolist()
+        row = list(entry) + [0] * (len(self.columns) - self.num_features)
+        for (feature_index, _), offset, digit in zip(
+            self.numerical_features, self.column_offsets, digits
+        ):
+            if entry[feature_index] == 1:
+                row[offset + digit] = 1
+        return row
+
+    def decode(self, row_id: int) -> pandas.Series:
+        return pandas.Series(self.row(row_id), index=self.columns, name=row_id)
+
+    def encode(self, configuration: pandas.Series) -> int:
+        """
+        Row id of a configuration given as a Series over the columns
+        """
+        values = configuration.loc[self.columns].to_numpy()
+        try:
+            boolean_row_index = self._boolean_row_lookup()[
+                tuple(int(value) for value in values[: self.num_features])
+            ]
+        except KeyError:
+            raise ValueError("Configuration is not valid", configuration)
+
+        entry = self._boolean_matrix[boolean_row_index]
+        rank = 0
+        for (feature_index, num_intervals), offset, radix in zip(
+            self.numerical_features,
+            self.column_offsets,
+            self.radices[boolean_row_index],
+        ):
+            intervals = values[offset : offset + num_intervals]
+            active = np.flatnonzero(intervals)
+            if entry[feature_index] == 1 and len(active) == 1:
+                digit = int(active[0])
+            elif entry[feature_index] == 0 and len(active) == 0:
+                digit = 0
+            else:
+                raise ValueError("Configuration is not valid", configuration)
+            rank = rank * radix + digit
+        row_id = int(self._rows_of_ranks(boolean_row_index, rank))
+        if row_id < 0:
+            raise ValueError("Configuration is pruned by a constraint", configuration)
+        return row_id
+
+    def boolean_row_index(self, boolean_configuration: list[int]) -> int:
+        key = tuple(int(value) for value in boolean_configuration)
+        try:
+            return self._boolean_row_lookup()[key]
+        except KeyError:
+            raise ValueError("Configuration is not valid", boolean_configuration)
+
+    def row_ids_of_digits(
+        self, boolean_row_index: int, digits: np.ndarray
+    ) -> np.ndarray:
+        """
+        Row ids of the configurations of one boolean configuration given the interval
+        index (digit) of every numerical feature, one row of digits per configuration
+        (0 for inactive numerical features)
+        """
+        radices = self._radix_matrix[boolean_row_index]
+        digits = np.asarray(digits, dtype=np.int64).reshape(-1, len(radices))
+        if np.any((digits < 0) | (digits >= radices)):
+            raise ValueError("Interval index out of range", digits)
+        # place value of every digit, the first numerical feature is most significant
+        places = np.ones(len(radices), dtype=np.int64)
+        places[:-1] = np.cumprod(radices[::-1])[::-1][1:]
+        return self._valid_rows(self._rows_of_ranks(boolean_row_index, digits @ places))
+
+    def row_ids_of(self, boolean_rows: np.ndarray, digits: np.ndarray) -> np.ndarray:
+        """
+        Vectorized row_ids_of_digits, one boolean row index per row of digits
+        """
+        return self._valid_rows(self._row_ids_of(boolean_rows, digits))
+
+    def _row_ids_of(self, boolean_rows: np.ndarray, digits: np.ndarray) -> np.ndarray:
+        # row_ids_of, -1 for pruned rows
+        boolean_rows = np.asarray(boolean_rows, dtype=np.int64)
+        radices = self._radix_matrix[boolean_rows]
+        digits = np.asarray(digits, dtype=np.int64).reshape(radices.shape)
+        if np.any((digits < 0) | (digits >= radices)):
+            raise ValueError("Interval index out of range", digits)
+        places = np.ones_like(radices)
+        places[:, :-1] = np.cumprod(radices[:, ::-1], axis=1)[:, ::-1][:, 1:]
+        return self._rows_of_ranks(boolean_rows, (digits * places).sum(axis=1))
+
+    def _ranks(self, boolean_rows, row_ids):
+        # rank (mixed radix number of the digits) of rows in their boolean row
+        if self._full_row_ids is None:
+            return row_ids - self._row_offset_array[boolean_rows]
+        return (
+            self._full_row_ids[row_ids] - self._full_row_offset_array[boolean_rows]
+        )
+
+    def _rows_of_ranks(self, boolean_rows, ranks):
+        # row ids of ranks in their boolean row, -1 for pruned rows
+        if self._full_row_ids is None:
+            return self._row_offset_array[boolean_rows] + ranks
+        full_row_ids = self._full_row_offset_array[boolean_rows] + ranks
+        positions = np.searchsorted(self._full_row_ids, full_row_ids)
+        found = np.minimum(positions, max(len(self._full_row_ids) - 1, 0))
+        kept = (len(self._full_row_ids) > 0) & (
+            self._full_row_ids[found] == full_row_ids
+        )
+        return np.where(kept, positions, -1)
+
+    def row_id_of_rank(self, boolean_row_index: int, rank: int) -> int:
+        # row id of a rank of one boolean configuration, -1 if pruned
+        if self._full_row_ids is None:
+            return self.row_offsets[boolean_row_index] + rank
+        return int(self._rows_of_ranks(boolean_row_index, rank))
+
+    def _valid_rows(self, row_ids: np.ndarray) -> np.ndarray:
+        if np.any(row_ids < 0):
+            raise ValueError("Configuration is pruned by a constraint", row_ids)
+        return row_ids
+
+    def block_ranks(self, boolean_row_index: int) -> np.ndarray:
+        # ranks of the rows of one boolean configuration, in row order
+        if self._full_row_ids is None:
+            return np.arange(self._block_sizes[boolean_row_index], dtype=np.int64)
+        offset = self.row_offsets[boolean_row_index]
+        return (
+            self._full_row_ids[offset : offset + self._block_sizes[boolean_row_index]]
+            - self._full_row_offset_array[boolean_row_index]
+        )
+
+    def context_codes(self, boolean_row_index: int, ranks: np.ndarray) -> np.ndarray:
+        # equal for the ranks of a boolean configuration sharing the context digits
+        radices = self.radices[boolean_row_index]
+        context_code = np.zeros(len(ranks), dtype=np.int64)
+        stride = math.prod(radices)
+        for radix, is_context in zip(radices, self.context_digits):
+            stride //= radix
+            if is_context:
+                context_code = context_code * radix + (ranks // stride) % radix
+        return context_code
+
+    def digits(self, row_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Boolean row index and interval index (digit) of every numerical feature of
+        many row ids, digits of inactive numerical features are 0
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if np.any((row_ids < 0) | (row_ids >= self.num_rows)):
+            raise IndexError("Configuration row out of range", row_ids)
+        boolean_rows = np.searchsorted(self._row_offset_array, row_ids, "right") - 1
+        ranks = self._ranks(boolean_rows, row_ids)
+
+        digits = np.zeros((len(row_ids), len(self.numerical_features)), np.int64)
+        for numerical_index in reversed(range(len(self.numerical_features))):
+            radices = self._radix_matrix[boolean_rows, numerical_index]
+            ranks, digits[:, numerical_index] = np.divmod(ranks, radices)
+        return boolean_rows, digits
+
+    def decode_rows(self, row_ids: np.ndarray) -> pandas.DataFrame:
+        """
+        Configurations of many row ids at once, indexed by row id
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        boolean_rows, digits = self.digits(row_ids)
+
+        table = np.zeros((len(row_ids), len(self.columns)), dtype=np.int64)
+        table[:, : self.num_features] = self._boolean_matrix[boolean_rows]
+        positions = np.arange(len(row_ids))
+        for numerical_index, (feature_index, _) in enumerate(self.numerical_features):
+            active = self._boolean_matrix[boolean_rows, feature_index] == 1
+            table[
+                positions[active],
+                self.column_offsets[numerical_index] + digits[active, numerical_index],
+            ] = 1
+        return pandas.DataFrame(table, columns=self.columns, index=row_ids)
+
+    def encode_rows(self, configurations: pandas.DataFrame) -> np.ndarray:
+        """
+        Row ids of many configurations given as a DataFrame over the columns
+        """
+        values = configurations[self.columns].to_numpy()
+        lookup = self._boolean_row_lookup()
+        try:
+            boolean_rows = np.array(
+                [
+                    lookup[tuple(int(value) for value in entry)]
+                    for entry in values[:, : self.num_features]
+                ],
+                dtype=np.int64,
+            )
+        except KeyError:
+            raise ValueError("Configurations are not valid", configurations)
+
+        ranks = np.zeros(len(values), dtype=np.int64)
+        for numerical_index, ((feature_index, num_intervals), offset) in enumerate(
+            zip(self.numerical_features, self.column_offsets)
+        ):
+            intervals = values[:, offset : offset + num_intervals]
+            active = self._boolean_matrix[boolean_rows, feature_index]
+            if np.any(np.count_nonzero(intervals, axis=1) != active):
+                raise ValueError("Configurations are not valid", configurations)
+            digits = np.argmax(intervals, axis=1)
+            ranks = ranks * self._radix_matrix[boolean_rows, numerical_index] + digits
+        return self._valid_rows(self._rows_of_ranks(boolean_rows, ranks))
+
+    def arm_mapping(
+        self, new_space: "ConfigurationSpace", digit_pairs: dict | None = None
+    ) -> "ArmMapping":
+        """
+        Maps every row to the rows of new_space (a recompiled configuration space)
+        with the same boolean configuration and the same interval indices. Rows of
+        boolean configurations which are no longer valid are not mapped.
+
+        digit_pairs: dict
+            numerical feature index -> (old digits, new digits), arrays of
+            overlapping intervals for numerical features whose intervals changed,
+            an old interval maps to all of its new intervals
+        """
+        lookup = new_space._boolean_row_lookup()
+        boolean_map = np.array(
+            [lookup.get(tuple(entry), -1) for entry in self.valid_table],
+            dtype=np.int64,
+        )
+        old_ids = np.arange(self.num_rows, dtype=np.int64)
+        boolean_rows, digits = self.digits(old_ids)
+        keep = boolean_map[boolean_rows] >= 0
+        old_ids, boolean_rows, digits = old_ids[keep], boolean_rows[keep], digits[keep]
+
+        for numerical_index, (old_digits, new_digits) in (digit_pairs or {}).items():
+            order = np.argsort(old_digits, kind="stable")
+            old_digits = np.asarray(old_digits, dtype=np.int64)[order]
+            new_digits = np.asarray(new_digits, dtype=np.int64)[order]
+            counts = np.bincount(
+                old_digits, minlength=self.numerical_features[numerical_index][1]
+            )
+            starts = np.cumsum(counts) - counts
+
+            # rows with the feature inactive keep digit 0
+            feature_index = self.numerical_features[numerical_index][0]
+            active = self._boolean_matrix[boolean_rows, feature_index] == 1
+            column = digits[:, numerical_index]
+            repeats = np.where(active, counts[column], 1)
+            within = np.arange(repeats.sum()) - np.repeat(
+                np.cumsum(repeats) - repeats, repeats
+            )
+            old_ids = np.repeat(old_ids, repeats)
+            boolean_rows = np.repeat(boolean_rows, repeats)
+            active = np.repeat(active, repeats)
+            column = np.repeat(column, repeats)
+            digits = np.repeat(digits, repeats, axis=0)
+            digits[active, numerical_index] = new_digits[
+                starts[column[active]] + within[active]
+            ]
+
+        # rows pruned in new_space are not mapped
+        new_ids = new_space._row_ids_of(boolean_map[boolean_rows], digits)
+        mapped = new_ids >= 0
+        return ArmMapping(
+            old_ids[mapped], new_ids[mapped], self.num_rows, new_space.num_rows
+        )
+
+    def contexts(self):
+        """
+        Yields every distinct context (Series over the context columns) in the order
+        of its first appearance in the configuration space
+        """
+        seen = set()
+        for boolean_row_index in range(len(self.radices)):
+            ranks = self.block_ranks(boolean_row_index)
+            _, first_rows = np.unique(
+                self.context_codes(boolean_row_index, ranks), return_index=True
+            )
+            for first_row in np.sort(first_rows):
+                context = self.decode(
+                    self.row_offsets[boolean_row_index] + int(first_row)
+                ).loc[self.context_columns]
+                key = tuple(context)
+                if key not in seen:
+                    seen.add(key)
+                    yield context
+
+    def to_dataframe(self) -> pandas.DataFrame:
+        blocks = []
+        for boolean_row_index, (entry, radices) in enumerate(
+            zip(self._boolean_matrix, self.radices)
+        ):
+            rows = self.block_ranks(boolean_row_index)
+            block = np.zeros((len(rows), len(self.columns)), dtype=np.int64)
+            block[:, : self.num_features] = entry
+            stride = math.prod(radices)
+            for (feature_index, _), offset, radix in zip(
+                self.numerical_features, self.column_offsets, radices
+            ):
+                stride //= radix
+                if entry[feature_index] == 1:
+                    block[np.arange(len(rows)), offset + (rows // stride) % radix] = 1
+            blocks.append(block)
+
+        if blocks:
+            table = np.concatenate(blocks)
+        else:
+            table = np.zeros((0, len(self.columns)), dtype=np.int64)
+        return pandas.DataFrame(table, columns=self.columns)
+
+    def to_ordinal(self, row_ids: np.ndarray | None = None) -> OrdinalTable:
+        """
+        Compact encoding of the configurations (default all rows), the same
+        configurations as to_dataframe / decode_rows without one-hot columns
+        """
+        if row_ids is None:
+            row_ids = np.arange(self.num_rows, dtype=np.int64)
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        boolean_rows, digits = self.digits(row_ids)
+        return OrdinalTable.from_boolean_matrix(
+            self._boolean_matrix[boolean_rows],
+            digits,
+            list(self.columns),
+            self.numerical_features,
+            row_ids,
+        )
+
+
+class ArmMapping:
+    """
+    Class used to represent the mapping of the arms (row ids) of a configuration
+    space to the arms of its recompiled version, as pairs of old and new arm ids.
+    An old arm maps to none (configuration no longer valid), one or many (interval
+    split) new arms, a new arm can have many old arms (intervals merged).
+    """
+
+    def __init__(
+        self,
+        old_ids: np.ndarray,
+        new_ids: np.ndarray,
+        num_old_arms: int,
+        num_new_arms: int,
+    ) -> None:
+        self.old_ids = old_ids
+        self.new_ids = new_ids
+        self.num_old_arms = num_old_arms
+        self.num_new_arms = num_new_arms
+
+    def __len__(self) -> int:
+        # number of (old, new) pairs
+        return len(self.old_ids)
+
+    def new_arms(self, old_id: int) -> np.ndarray:
+        return self.new_ids[self.old_ids == old_id]
+
+    def old_arms(self, new_id: int) -> np.ndarray:
+        return self.old_ids[self.new_ids == new_id]
@@ -0,0 +1,313 @@
+from sympy import And, Not, Or, Symbol
+from sympy.logic.boolalg import BooleanFalse, BooleanTrue, to_cnf, truth_table
+
+# enumeration engines
+SYMPY = "sympy"
+CNF_ENGINE = "cnf"
+
+
+class CNF:
+    """
+    Class used to represent a propositional formula in conjunctive normal form
+    """
+
+    def __init__(self, num_variables: int, clauses: list[list[int]]) -> None:
+        """
+        num_variables: int
+            number of variables, variables are numbered 1..num_variables
+        clauses: list of list of int
+            clauses as signed variable numbers (DIMACS convention), e.g. [1, -3]
+            stands for (x1 or not x3)
+        """
+        self.num_variables = num_variables
+        self.clauses = clauses
+
+    @classmethod
+    def from_formula(cls, formula, symbols: list[Symbol]) -> "CNF":
+        """
+        Compile a sympy formula into CNF. Every top level conjunct of a feature model
+        formula is a small implication, so it is converted on its own, which keeps the
+        conversion linear in the size of the feature model.
+        """
+        variables = {symbol: index + 1 for index, symbol in enumerate(symbols)}
+        clauses = []
+        for term in And.make_args(formula):
+            for clause in And.make_args(to_cnf(term, simplify=False)):
+                literals = cls._clause_to_literals(clause, variables)
+                if literals is not None:
+                    clauses.append(literals)
+        return cls(len(symbols), clauses)
+
+    @staticmethod
+    def _clause_to_literals(clause, variables: dict) -> list[int] | None:
+        # returns None for clauses which are always satisfied
+        literals = set()
+        for literal in Or.make_args(clause):
+            if isinstance(literal, BooleanTrue):
+                return None
+            if isinstance(literal, BooleanFalse):
+                continue
+            if isinstance(literal, Not):
+                sign = -1
+                literal = literal.args[0]
+            else:
+                sign = 1
+            try:
+                variable = variables[literal]
+            except KeyError:
+                raise ValueError("Formula contains an unknown symbol", literal)
+            if -sign * variable in literals:
+                return None
+            literals.add(sign * variable)
+        return sorted(literals, key=abs)
+
+
+class _DPLL:
+    """
+    Backtracking search with unit propagation over a CNF. Variables are decided in
+    ascending order, 0 before 1, so solutions are produced in the same order as the
+    rows of sympy's truth_table.
+    """
+
+    def __init__(self, cnf: CNF) -> None:
+        self.num_variables = cnf.num_variables
+        self.clauses = cnf.clauses
+        self.occurrences = [[] for _ in range(self.num_variables + 1)]
+        for clause_index, clause in enumerate(self.clauses):
+            for literal in clause:
+                self.occurrences[abs(literal)].append((clause_index, literal > 0))
+
+        self.values = [-1] * (self.num_variables + 1)
+        self.num_true = [0] * len(self.clauses)
+        self.num_false = [0] * len(self.clauses)
+        self.trail = []
+
+    def _propagate(self, variable: int, value: int) -> bool:
+        queue = [(variable, value)]
+        while queue:
+            variable, value = queue.pop()
+            if self.values[variable] != -1:
+                if self.values[variable] != value:
+                    return False
+                continue
+            self.values[variable] = value
+            self.trail.append(variable)
+
+            conflict = False
+            for clause_index, positive in self.occurrences[variable]:
+                if positive == bool(value):
+                    self.num_true[clause_index] += 1
+                    continue
+                self.num_false[clause_index] += 1
+                if self.num_true[clause_index] != 0:
+                    continue
+                clause = self.clauses[clause_index]
+                remaining = len(clause) - self.num_false[clause_index]
+                if remaining == 0:
+                    conflict = True
+                elif remaining == 1:
+                    for literal in clause:
+                        if self.values[abs(literal)] == -1:
+                            queue.append((abs(literal), 1 if literal > 0 else 0))
+                            break
+            if conflict:
+                return False
+        return True
+
+    def _undo(self, mark: int) -> None:
+        while len(self.trail) > mark:
+            variable = self.trail.pop()
+            value = self.values[variable]
+            for clause_index, positive in self.occurrences[variable]:
+                if positive == bool(value):
+                    self.num_true[clause_index] -= 1
+                else:
+                    self.num_false[clause_index] -= 1
+            self.values[variable] = -1
+
+    def _next_unassigned(self, variable: int) -> int:
+        while variable <= self.num_variables and self.values[variable] != -1:
+            variable += 1
+        return variable
+
+    def _backtrack(self, stack: list) -> int | None:
+        while stack:
+            frame = stack[-1]
+            self._undo(frame[1])
+            if frame[2] == 0:
+                frame[2] = 1
+                if self._propagate(frame[0], 1):
+                    return self._next_unassigned(frame[0] + 1)
+            stack.pop()
+        return None
+
+    def solutions(self):
+        """
+        Yields once per satisfying assignment, the assignment is available in
+        self.values[1:] until the generator is resumed.
+        """
+        if any(len(clause) == 0 for clause in self.clauses):
+            return
+        for clause in self.clauses:
+            if len(clause) == 1:
+                literal = clause[0]
+                if not self._propagate(abs(literal), 1 if literal > 0 else 0):
+                    return
+
+        stack = []
+        variable = self._next_unassigned(1)
+        while variable is not None:
+            if variable > self.num_variables:
+                yield
+                variable = self._backtrack(stack)
+                continue
+            stack.append([variable, len(self.trail), 0])
+            if self._propagate(variable, 0):
+                variable = self._next_unassigned(variable + 1)
+            else:
+                variable = self._backtrack(stack)
+
+
+def _condition(clauses: list[tuple], literal: int) -> list[tuple]:
+    conditioned = []
+    for clause in clauses:
+        if literal in clause:
+            continue
+        if -literal in clause:
+            clause = tuple(other for other in clause if other != -literal)
+        conditioned.append(clause)
+    return conditioned
+
+
+def _unit_propagate(clauses: list[tuple]) -> tuple[list[tuple], set] | None:
+    # returns None on conflict
+    assigned = set()
+    while True:
+        if any(len(clause) == 0 for clause in clauses):
+            return None
+        unit = next((clause[0] for clause in clauses if len(clause) == 1), None)
+        if unit is None:
+            return clauses, assigned
+        assigned.add(abs(unit))
+        clauses = _condition(clauses, unit)
+
+
+def _components(clauses: list[tuple]) -> list[list[tuple]]:
+    # group clauses which (transitively) share variables
+    parents = {}
+
+    def find(variable):
+        while parents[variable] != variable:
+            parents[variable] = parents[parents[variable]]
+            variable = parents[variable]
+        return variable
+
+    for clause in clauses:
+        for literal in clause:
+            parents.setdefault(abs(literal), abs(literal))
+        root = find(abs(clause[0]))
+        for literal in clause[1:]:
+            other = find(abs(literal))
+            if other != root:
+                parents[other] = root
+
+    components = {}
+    for clause in clauses:
+        components.setdefault(find(abs(clause[0])), []).append(clause)
+    return list(components.values())
+
+
+def _count_models(clauses: list[tuple], num_variables: int, cache: dict) -> int:
+    """
+    Number of assignments of num_variables variables satisfying the clauses.
+    Splits the formula into independent components whose counts multiply, and
+    caches the count of every component.
+    """
+    propagated = _unit_propagate(clauses)
+    if propagated is None:
+        return 0
+    clauses, assigned = propagated
+
+    constrained = {abs(literal) for clause in clauses for literal in clause}
+    count = 1 << (num_variables - len(assigned) - len(constrained))
+    for component in _components(clauses):
+        key = frozenset(component)
+        if key not in cache:
+            variables = {abs(literal) for clause in component for literal in clause}
+            variable = min(variables)
+            cache[key] = _count_models(
+                _condition(component, variable), len(variables) - 1, cache
+            ) + _count_models(_condition(component, -variable), len(variables) - 1, cache)
+        count *= cache[key]
+        if count == 0:
+            return 0
+    return count
+
+
+class ConfigurationEnumerator:
+    """
+    Base class of the engines enumerating the valid configurations of a feature model
+    formula. Configurations are lists of 0/1 ints in the order of the given symbols.
+    """
+
+    name = None
+
+    def enumerate(self, formula, symbols: list[Symbol]) -> list[list[int]]:
+        pass
+
+    def count(self, formula, symbols: list[Symbol]) -> int:
+        return len(self.enumerate(formula, symbols))
+
+
+class SympyEnumerator(ConfigurationEnumerator):
+    """
+    Evaluates the formula on the full truth table (2^n rows)
+    """
+
+    name = SYMPY
+
+    def enumerate(self, formula, symbols: list[Symbol]) -> list[list[int]]:
+        valid_table = []
+        table = truth_table(formula, symbols)
+        for line in table:
+            if line[-1]:
+                valid_table.append(line[0])
+
+        return valid_table
+
+
+class CNFEnumerator(ConfigurationEnumerator):
+    """
+    Compiles the formula into CNF and enumerates only the satisfying assignments
+    """
+
+    name = CNF_ENGINE
+
+    def enumerate(self, formula, symbols: list[Symbol]) -> list[list[int]]:
+        return self.enumerate_cnf(CNF.from_formula(formula, symbols))
+
+    def count(self, formula, symbols: list[Symbol]) -> int:
+        return self.count_cnf(CNF.from_formula(formula, symbols))
+
+    def enumerate_cnf(self, cnf: CNF) -> list[list[int]]:
+        search = _DPLL(cnf)
+        return [search.values[1:] for _ in search.solutions()]
+
+    def count_cnf(self, cnf: CNF) -> int:
+        clauses = [tuple(clause) for clause in cnf.clauses]
+        return _count_models(clauses, cnf.num_variables, {})
+
+
+ENUMERATION_ENGINES = {
+    SYMPY: SympyEnumerator,
+    CNF_ENGINE: CNFEnumerator,
+}
+
+
+def get_enumeration_engine(engine: str | ConfigurationEnumerator) -> ConfigurationEnumerator:
+    if isinstance(engine, ConfigurationEnumerator):
+        return engine
+    try:
+        return ENUMERATION_ENGINES[engine]()
+    except KeyError:
+        raise ValueError("Unknown enumeration engine", engine)
@@ -0,0 +1,222 @@
+import atexit
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+
+# levels, as in the logging module
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# event logs of the process, reset in forked children (see EventLog._after_fork)
+_event_logs = weakref.WeakSet()
+
+
+def _format_text(timestamp: float, level: int, name: str, fields: dict) -> str:
+    return " ".join(
+        [LEVEL_NAMES.get(level, str(level)), name]
+        + [f"{key}={value}" for key, value in fields.items()]
+    )
+
+
+def _json_value(value):
+    # numpy scalars as numbers, anything else (errors, Series) as text
+    if hasattr(value, "item") and getattr(value, "ndim", None) == 0:
+        return value.item()
+    return str(value)
+
+
+def _format_json(timestamp: float, level: int, name: str, fields: dict) -> str:
+    return json.dumps(
+        {
+            "time": timestamp,
+            "level": LEVEL_NAMES.get(level, level),
+            "event": name,
+            **fields,
+        },
+        default=_json_value,
+    )
+
+
+class EventLog:
+    """
+    Class used to represent a levelled stream of structured events (name and
+    fields, e.g. cycle, arm, reward). Events are appended to an in-memory ring
+    buffer and formatted and written by a background thread, the oldest events are
+    dropped when the writer falls behind by capacity events. Events below the level
+    are discarded with one comparison. Events which could not be written count as
+    dropped and are reported on stderr.
+
+    Without path the events are written as text lines to stdout, with path as JSON
+    lines appended to the file.
+    """
+
+    def __init__(
+        self,
+        level: int = INFO,
+        path: str | None = None,
+        capacity: int = 65536,
+        flush_interval: float = 0.2,
+    ) -> None:
+        """
+        level: int
+            minimum level of the recorded events (DEBUG, INFO, WARNING, ERROR)
+        capacity: int
+            size of the ring buffer
+        flush_interval: float
+            seconds between two writes of the background thread
+        """
+        self.level = level
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        # events dropped because the ring buffer was full or the write failed
+        self.dropped = 0
+
+        self._events = collections.deque(maxlen=capacity)
+        self._file = None
+        # serializes writes of the background thread and flush
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        _event_logs.add(self)
+
+    def configure(
+        self,
+        level: int | None = None,
+        path: str | None = None,
+        capacity: int | None = None,
+        flush_interval: float | None = None,
+    ) -> None:
+        # writes the pending events first, None keeps the setting
+        self.close()
+        if level is not None:
+            self.level = level
+        if path is not None:
+            self.path = path
+        if capacity is not None:
+            self.capacity = capacity
+            self._events = collections.deque(maxlen=capacity)
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+    def enabled(self, level: int) -> bool:
+        # check before building expensive fields
+        return level >= self.level
+
+    @contextlib.contextmanager
+    def at_level(self, level: int):
+        # temporarily records only events of at least level, e.g. WARNING
+        previous = self.level
+        self.level = level
+        try:
+            yield self
+        finally:
+            self.level = previous
+
+    def event(self, level: int, name: str, **fields) -> None:
+        if level < self.level:
+            return
+        if len(self._events) == self.capacity:
+            self.dropped += 1
+        self._events.append((time.time(), level, name, fields))
+        if self._thread is None:
+            self._start()
+
+    def debug(self, name: str, **fields) -> None:
+        if DEBUG >= self.level:
+            self.event(DEBUG, name, **fields)
+
+    def info(self, name: str, **fields) -> None:
+        if INFO >= self.level:
+            self.event(INFO, name, **fields)
+
+    def warning(self, name: str, **fields) -> None:
+        if WARNING >= self.level:
+            self.event(WARNING, name, **fields)
+
+    def error(self, name: str, **fields) -> None:
+        if ERROR >= self.level:
+            self.event(ERROR, name, **fields)
+
+    def flush(self) -> None:
+        # writes the buffered events now, called by the background thread
+        with self._lock:
+            lines = []
+            while self._events:
+                try:
+                    event = self._events.popleft()
+                except IndexError:
+                    break
+                if self.path is None:
+                    lines.append(_format_text(*event))
+                else:
+                    lines.append(_format_json(*event))
+            if not lines:
+                return
+            try:
+                if self.path is None:
+                    stream = sys.stdout
+                else:
+                    if self._file is None:
+                        self._file = open(self.path, "a")
+                    stream = self._file
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (OSError, ValueError) as err:
+                self.dropped += len(lines)
+                sys.stderr.write(f"{len(lines)} events could not be written: {err}\n")
+
+    def close(self) -> None:
+        # stops the background thread after writing the pending events, a later
+        # event starts it again
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._stop.clear()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, daemon=True)
+                self._thread.start()
+
+    def _write_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _after_fork(self) -> None:
+        # the child has no writer thread and may have inherited a held lock, the
+        # pending events are written by the parent. The next event starts a writer.
+        self._events.clear()
+        self._file = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+
+def _after_fork_in_child() -> None:
+    for event_log in list(_event_logs):
+        event_log._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+# event log of the adaptation loops, configure with log.configure(level, path).
+# Worker processes exit without atexit, they call log.close themselves.
+log = EventLog()
+atexit.register(log.close)
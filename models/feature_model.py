@@ -1,8 +1,23 @@
 from sympy import Symbol, Implies, And, Or, Not
-from sympy.logic.boolalg import truth_table
 
+from models.configuration_space import ArmMapping, ConfigurationSpace
+from models.enumeration import (
+    CNF_ENGINE,
+    ConfigurationEnumerator,
+    get_enumeration_engine,
+)
+from models.event_log import log
+from models.ordinal_table import OrdinalTable
+
+import bisect
+import hashlib
 import json
+import math
+import operator
 import os
+import re
+
+import numpy as np
 import pandas
 
 from pathlib import Path
@@ -22,6 +37,17 @@ ALTERNATIVE = "alternative"
 REQUIRES = "requires"
 EXCLUDES = "excludes"
 
+# range conditions of numerical features in cross tree constraints, e.g. "dimmer >= 0.6"
+COMPARISONS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+CONDITION_PATTERN = re.compile(r"^\s*(\w+)\s*(>=|<=|==|!=|>|<)\s*(\S+)\s*$")
+
 ROOT = "root"
 SYSTEM = "system"
 CONTEXT = "context"
@@ -29,6 +55,12 @@ STRUCTURE = "structure"
 CROSS_TREE_CONSTRAINTS = "cross tree constraints"
 INTERVAL_SIZE = "interval size"
 
+# cache of compiled feature models used by the scripts, one .npz per feature model
+# definition (see NumericalFM), relative to the working directory
+CACHE_DIR = ".fm_cache"
+# part of the cache key, increase when the layout of the cache files changes
+CACHE_VERSION = 1
+
 
 class Feature:
     """
@@ -86,24 +118,61 @@ class Structure:
         self.type = type
 
 
+class NumericalCondition:
+    """
+    Class used to represent a range condition on a numerical feature (e.g.
+    "dimmer >= 0.6") as operand of a Cross-Tree Constraint. A configuration
+    satisfies it if the feature is selected and the value of its interval (see
+    NumericalSubFeature.get_value) fulfills the comparison.
+    """
+
+    def __init__(self, feature: Feature, comparison: str, value: float) -> None:
+        """
+        comparison: str
+            key of COMPARISONS
+        """
+        self.feature = feature
+        self.comparison = comparison
+        self.value = value
+        self.name = "{} {} {}".format(feature.name, comparison, value)
+
+    def satisfied(self, values: np.ndarray) -> np.ndarray:
+        return COMPARISONS[self.comparison](values, self.value)
+
+
 class CrossTreeConstraint:
     """
     Class used to represent a Cross-Tree Constraint (requires, excludes)
     """
 
-    def __init__(self, feature_1: str, feature_2: str, constraint: str) -> None:
+    def __init__(
+        self,
+        feature_1: "Feature | NumericalCondition",
+        feature_2: "Feature | NumericalCondition",
+        constraint: str,
+    ) -> None:
         """
-        feature_1: Feature
+        feature_1: Feature or NumericalCondition
             first feature of the constraint
-        feature_2: Feature
+        feature_2: Feature or NumericalCondition
             second feature of the constraint
         constraint: str
             REQUIRES, EXCLUDES
         """
+        if constraint not in (REQUIRES, EXCLUDES):
+            raise ValueError("Invalid cross tree constraint type", constraint)
         self.feature_1 = feature_1
         self.feature_2 = feature_2
         self.constraint = constraint
 
+    @property
+    def numerical(self) -> bool:
+        # constraints on intervals are enforced by pruning the configuration space,
+        # the others are part of the propositional formula
+        return isinstance(self.feature_1, NumericalCondition) or isinstance(
+            self.feature_2, NumericalCondition
+        )
+
 
 class NumericalSubFeature:
 
@@ -124,12 +193,35 @@ class NumericalSubFeature:
         raise TypeError("Feature is neither INT nor REAL!?")
 
 
+def satisfies(
+    constraint: CrossTreeConstraint, operand_1: np.ndarray, operand_2: np.ndarray
+) -> np.ndarray:
+    # constraint evaluated on arrays of whether its operands hold
+    if constraint.constraint == REQUIRES:
+        return ~operand_1 | operand_2
+    return ~(operand_1 & operand_2)
+
+
 class FM:
 
-    def __init__(self, json_file: str) -> None:
+    def __init__(
+        self,
+        json_file: str,
+        enumeration_engine: str | ConfigurationEnumerator = CNF_ENGINE,
+    ) -> None:
+        """
+        json_file: str
+            path to the feature model definition
+        enumeration_engine: str or ConfigurationEnumerator
+            engine used to enumerate the valid configurations (CNF_ENGINE, SYMPY)
+        """
+        self.enumeration_engine = get_enumeration_engine(enumeration_engine)
 
         with open(json_file) as file:
             fm_json = json.load(file)
+        # definition, kept up to date by the incremental edits of NumericalFM
+        self.fm_json = fm_json
+        self.json_hash = self.definition_hash()
 
         self.features = {}
         self.numerical_sub_features = {}
@@ -164,16 +256,34 @@ class FM:
                 Structure(self.features[structure[0]], child_features, group_type)
             )
 
+        # [feature or range condition, feature or range condition, type], e.g.
+        # ["dimmer >= 0.6", "servers >= 2", "requires"]
         self.cross_tree_constraints = []
         for constraint in fm_json[CROSS_TREE_CONSTRAINTS]:
-            self.cross_tree_constraints.append(
-                self.features[constraint[0]],
-                self.features[constraint[1]],
-                constraint[2],
-            )
-
-        self.fm_pl = And(Implies(True, self.features[ROOT].symbol))
-        self.create_feature_relationships()
+            if len(constraint) != 3:
+                raise ValueError("Invalid cross tree constraint", constraint)
+            self.cross_tree_constraints.append(self.cross_tree_constraint(*constraint))
+
+        # propositional formula, built on first access (not needed if the valid
+        # configurations are loaded from the cache)
+        self._fm_pl = None
+
+    def definition_hash(self) -> str:
+        # identifies the definition independent of the formatting of the file
+        return hashlib.sha256(
+            json.dumps(self.fm_json, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    @property
+    def fm_pl(self):
+        if self._fm_pl is None:
+            self._fm_pl = And(Implies(True, self.features[ROOT].symbol))
+            self.create_feature_relationships()
+        return self._fm_pl
+
+    @fm_pl.setter
+    def fm_pl(self, fm_pl):
+        self._fm_pl = fm_pl
 
     def add_pl_term(self, term):
         self.fm_pl = And(self.fm_pl, term)
@@ -221,33 +331,179 @@ class FM:
                     "Invalid structure type", structure.parent.name, structure.type
                 )
 
+        for constraint in self.cross_tree_constraints:
+            if not constraint.numerical:
+                self.add_pl_term(self.constraint_term(constraint))
+
+    def cross_tree_constraint(
+        self, feature_1: str, feature_2: str, constraint: str
+    ) -> CrossTreeConstraint:
+        return CrossTreeConstraint(
+            self.constraint_operand(feature_1),
+            self.constraint_operand(feature_2),
+            constraint,
+        )
+
+    def constraint_operand(self, operand: str) -> Feature | NumericalCondition:
+        # feature name or range condition of a numerical feature
+        if operand in self.features:
+            return self.features[operand]
+        match = CONDITION_PATTERN.match(operand)
+        if match is not None:
+            feature_name, comparison, value = match.groups()
+            feature = self.features.get(feature_name)
+            if feature is not None and feature.type in (INT, REAL):
+                try:
+                    return NumericalCondition(feature, comparison, float(value))
+                except ValueError:
+                    pass
+        raise ValueError("Invalid cross tree constraint operand", operand)
+
+    def constraint_term(self, constraint: CrossTreeConstraint):
+        if constraint.numerical:
+            raise ValueError(
+                "Numerical cross tree constraints have no propositional term",
+                constraint.feature_1.name,
+                constraint.feature_2.name,
+            )
+        if constraint.constraint == REQUIRES:
+            return Implies(constraint.feature_1.symbol, constraint.feature_2.symbol)
+        if constraint.constraint == EXCLUDES:
+            return Not(And(constraint.feature_1.symbol, constraint.feature_2.symbol))
+        raise ValueError("Invalid cross tree constraint type", constraint.constraint)
+
+    def constraint_mask(
+        self, constraint: CrossTreeConstraint, table: np.ndarray
+    ) -> np.ndarray:
+        # whether every boolean configuration (row of table) satisfies the constraint
+        feature_names = list(self.features)
+        feature_1 = table[:, feature_names.index(constraint.feature_1.name)] == 1
+        feature_2 = table[:, feature_names.index(constraint.feature_2.name)] == 1
+        return satisfies(constraint, feature_1, feature_2)
+
     def generate_truth_table(self) -> list[list[int]]:
-        valid_table = []
-        table = truth_table(
+        return self.enumeration_engine.enumerate(
             self.fm_pl, [feature.symbol for feature in self.features.values()]
         )
-        for line in table:
-            if line[-1]:
-                valid_table.append(line[0])
 
-        return valid_table
+    def count_valid_configurations(self) -> int:
+        return self.enumeration_engine.count(
+            self.fm_pl, [feature.symbol for feature in self.features.values()]
+        )
 
 
 class NumericalFM(FM):
 
-    def __init__(self, json_file: str) -> None:
-        super().__init__(json_file)
+    def __init__(
+        self,
+        json_file: str,
+        enumeration_engine: str | ConfigurationEnumerator = CNF_ENGINE,
+        cache_dir: str | None = None,
+    ) -> None:
+        """
+        cache_dir: str
+            directory of the compiled feature model cache, keyed by the hash of the
+            definition (e.g. CACHE_DIR). The first start compiles and stores the
+            model, later starts (and worker processes) load it. None (default)
+            always compiles and writes nothing.
+        """
+        super().__init__(json_file, enumeration_engine)
 
         self.system_feature_names = []
         self.context_feature_names = []
-        self.valid_configurations_numerical = self.generate_numerical_truth_table()
+        # numerical sub feature name -> sub feature
+        self.sub_features_by_name = {}
+        # numerical feature name -> interval bounds (lb of every interval + last ub)
+        self.bin_edges = {}
+        self.cache_dir = cache_dir
+        self.configuration_space = self.load_configuration_space()
+        self._valid_configurations_numerical = None
+        self._valid_configurations_ordinal = None
+
+    @property
+    def valid_configurations_numerical(self) -> pandas.DataFrame:
+        # materialized on first access, prefer configuration_space for large models
+        if self._valid_configurations_numerical is None:
+            self._valid_configurations_numerical = (
+                self.configuration_space.to_dataframe()
+            )
+        return self._valid_configurations_numerical
+
+    @property
+    def valid_configurations_ordinal(self) -> OrdinalTable:
+        # compact encoding of valid_configurations_numerical, see OrdinalTable
+        if self._valid_configurations_ordinal is None:
+            self._valid_configurations_ordinal = self.configuration_space.to_ordinal()
+        return self._valid_configurations_ordinal
+
+    def cache_path(self) -> str:
+        return os.path.join(
+            self.cache_dir, "{}_v{}.npz".format(self.json_hash, CACHE_VERSION)
+        )
 
-    def generate_numerical_truth_table(self) -> pandas.DataFrame:
-        valid_table = self.generate_truth_table()
+    def load_configuration_space(self) -> ConfigurationSpace:
+        # from the cache if possible, otherwise compiled (and stored in the cache)
+        if self.cache_dir is None:
+            return self.generate_configuration_space()
+        path = self.cache_path()
+        try:
+            with np.load(path) as cached:
+                compiled = json.loads(str(cached["compiled"]))
+                compiled["valid_table"] = cached["valid_table"]
+            return self.apply_compiled(compiled)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as err:
+            log.warning("invalid_fm_cache", error=err, path=path, action="compiling")
+
+        compiled = self.compile()
+        self.store_compiled(compiled)
+        return self.apply_compiled(compiled)
+
+    def store_compiled(self, compiled: dict) -> None:
+        if self.cache_dir is None:
+            return
+        try:
+            self.save_compiled(compiled, self.cache_path())
+        except OSError as err:
+            log.warning("fm_cache_not_written", error=err)
+
+    def save_compiled(self, compiled: dict, path: str) -> None:
+        # replaced atomically, parallel processes may compile the same model
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = {key: value for key, value in compiled.items() if key != "valid_table"}
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as file:
+            np.savez(
+                file,
+                compiled=np.array(json.dumps(meta)),
+                valid_table=np.array(compiled["valid_table"], dtype=np.int8).reshape(
+                    len(compiled["valid_table"]), len(self.features)
+                ),
+            )
+        os.replace(temp_path, path)
+
+    def generate_configuration_space(self) -> ConfigurationSpace:
+        return self.apply_compiled(self.compile())
 
+    def compile(self) -> dict:
+        """
+        Enumerates the valid configurations and expands the numerical features into
+        their sub features (intervals). Returns plain lists:
+        valid_table, columns (feature names followed by the sub feature names),
+        numerical_features ((feature index, number of intervals) per numerical
+        feature), sub_features (feature name -> [name, lb, ub] per interval),
+        system_feature_names and context_feature_names.
+        """
+        return self.expand_numerical_features(self.generate_truth_table())
+
+    def expand_numerical_features(self, valid_table) -> dict:
+        # compiled model (see compile) of the given valid boolean configurations
         ordered_names = list(self.features.keys())
         system_names = []
         context_names = []
+        numerical_features = []
+        sub_features = {}
         # Handle numerical features
         for parent_feature_index, feature in enumerate(self.features.values()):
             if feature.type == INT or feature.type == REAL:
@@ -268,7 +524,7 @@ class NumericalFM(FM):
                 else:
                     range_ub += 1
 
-                numerical_sub_feature_list = []
+                sub_feature_list = []
                 for list_index, index_name in enumerate(
                     [val for val in range(range_lb, range_ub, range_interval_size)]
                 ):
@@ -276,79 +532,457 @@ class NumericalFM(FM):
                     ordered_names.append(sub_feature_name)
                     lower_bound = feature.lb + feature.interval_size * list_index
                     upper_bound = feature.lb + feature.interval_size * (list_index + 1)
-
-                    numerical_sub_feature_list.append(
-                        NumericalSubFeature(
-                            sub_feature_name,
-                            feature.branch,
-                            lower_bound,
-                            upper_bound,
-                            parent=feature,
-                        )
+                    sub_feature_list.append(
+                        [sub_feature_name, lower_bound, upper_bound]
                     )
                     if feature.branch == SYSTEM:
                         system_names.append(sub_feature_name)
                     elif feature.branch == CONTEXT:
                         context_names.append(sub_feature_name)
 
-                self.numerical_sub_features[feature.name] = numerical_sub_feature_list
-
-                temp_valid_table = []
-                for entry in valid_table:
-                    # check if feature is part of valid config
-                    if entry[parent_feature_index] == 1:
-
-                        for index_name in range(
-                            range_lb, range_ub, range_interval_size
-                        ):
-                            temp_valid_table.append(
-                                entry
-                                + [
-                                    1 if index == index_name else 0
-                                    for index in range(
-                                        range_lb, range_ub, range_interval_size
-                                    )
-                                ]
-                            )
-                    else:
-                        temp_valid_table.append(
-                            entry
-                            + [
-                                0
-                                for _ in range(range_lb, range_ub, range_interval_size)
-                            ]
-                        )
+                sub_features[feature.name] = sub_feature_list
+                numerical_features.append(
+                    [parent_feature_index, len(sub_feature_list)]
+                )
 
-                    valid_table = temp_valid_table
+        positions = {name: position for position, name in enumerate(ordered_names)}
+        return {
+            "valid_table": valid_table,
+            "columns": ordered_names,
+            "numerical_features": numerical_features,
+            "sub_features": sub_features,
+            "system_feature_names": sorted(system_names, key=positions.get),
+            "context_feature_names": sorted(context_names, key=positions.get),
+        }
+
+    def apply_compiled(self, compiled: dict) -> ConfigurationSpace:
+        # sets the numerical sub features and feature names of a compiled model
+        self.numerical_sub_features = {}
+        self.sub_features_by_name = {}
+        self.bin_edges = {}
+        for feature_name, sub_feature_list in compiled["sub_features"].items():
+            feature = self.features[feature_name]
+            numerical_sub_feature_list = [
+                NumericalSubFeature(name, feature.branch, lb, ub, parent=feature)
+                for name, lb, ub in sub_feature_list
+            ]
+            self.numerical_sub_features[feature_name] = numerical_sub_feature_list
+            for sub_feature in numerical_sub_feature_list:
+                self.sub_features_by_name[sub_feature.name] = sub_feature
+            if numerical_sub_feature_list:
+                self.bin_edges[feature_name] = [
+                    sub_feature.lb for sub_feature in numerical_sub_feature_list
+                ] + [numerical_sub_feature_list[-1].ub]
+
+        self.system_feature_names = compiled["system_feature_names"]
+        self.context_feature_names = compiled["context_feature_names"]
+        space = ConfigurationSpace(
+            compiled["valid_table"],
+            compiled["columns"],
+            [tuple(numerical) for numerical in compiled["numerical_features"]],
+            self.context_feature_names,
+        )
+        row_mask = self.numerical_constraint_mask(space)
+        if row_mask is None:
+            return space
+        return ConfigurationSpace(
+            space.boolean_matrix,
+            compiled["columns"],
+            space.numerical_features,
+            self.context_feature_names,
+            row_mask,
+        )
 
-        self.system_feature_names = sorted(
-            system_names, key=lambda x: ordered_names.index(x)
+    def numerical_constraint_mask(
+        self, space: ConfigurationSpace
+    ) -> np.ndarray | None:
+        """
+        Whether every row of the (unpruned) configuration space satisfies the
+        numerical cross tree constraints, None if there are none. Evaluated on the
+        interval indices of all rows at once.
+        """
+        constraints = [
+            constraint
+            for constraint in self.cross_tree_constraints
+            if constraint.numerical
+        ]
+        if not constraints:
+            return None
+        boolean_rows, digits = space.digits(np.arange(len(space)))
+        row_mask = np.ones(len(space), dtype=bool)
+        for constraint in constraints:
+            row_mask &= satisfies(
+                constraint,
+                self._operand_mask(constraint.feature_1, space, boolean_rows, digits),
+                self._operand_mask(constraint.feature_2, space, boolean_rows, digits),
+            )
+        return row_mask
+
+    def _operand_mask(
+        self,
+        operand: Feature | NumericalCondition,
+        space: ConfigurationSpace,
+        boolean_rows: np.ndarray,
+        digits: np.ndarray,
+    ) -> np.ndarray:
+        if isinstance(operand, NumericalCondition):
+            feature = operand.feature
+        else:
+            feature = operand
+        feature_index = list(self.features).index(feature.name)
+        selected = space.boolean_matrix[boolean_rows, feature_index] == 1
+        if not isinstance(operand, NumericalCondition):
+            return selected
+        numerical_index = [index for index, _ in space.numerical_features].index(
+            feature_index
         )
-        self.context_feature_names = sorted(
-            context_names, key=lambda x: ordered_names.index(x)
+        interval_satisfied = operand.satisfied(
+            np.array(
+                [
+                    sub_feature.get_value()
+                    for sub_feature in self.numerical_sub_features[feature.name]
+                ]
+            )
         )
-        return pandas.DataFrame(valid_table, columns=ordered_names)
+        return selected & interval_satisfied[digits[:, numerical_index]]
+
+    def set_interval_size(
+        self, feature_name: str, interval_size: int | float
+    ) -> ArmMapping:
+        """
+        Re-splits one numerical feature into intervals of interval_size. The valid
+        boolean configurations are kept (no enumeration), only the sub features of
+        the feature and the rows are rebuilt.
+
+        Returns the ArmMapping from the old to the new arms: an old arm maps to every
+        new arm whose interval of the feature overlaps its own, see
+        AdaptationLogic.migrate and CMAB.migrate.
+        """
+        feature = self.features.get(feature_name)
+        if feature is None or feature.type not in (INT, REAL):
+            raise ValueError("Numerical feature does not exist", feature_name)
+        old_space = self.configuration_space
+        old_sub_features = self.numerical_sub_features[feature_name]
+
+        feature.interval_size = interval_size
+        self.fm_json.setdefault(INTERVAL_SIZE, {})[feature_name] = interval_size
+        self.configuration_space = self._recompile(old_space.boolean_matrix)
+
+        # pairs of overlapping intervals, tolerant to rounding of the bounds
+        tolerance = 1e-9 * (feature.ub - feature.lb)
+        overlaps = [
+            (old_digit, new_digit)
+            for old_digit, old in enumerate(old_sub_features)
+            for new_digit, new in enumerate(self.numerical_sub_features[feature_name])
+            if min(old.ub, new.ub) - max(old.lb, new.lb) > tolerance
+        ]
+        # no overlap: the arms with the feature selected map to no old arm
+        old_digits = np.array([old_digit for old_digit, _ in overlaps], dtype=np.int64)
+        new_digits = np.array([new_digit for _, new_digit in overlaps], dtype=np.int64)
+        numerical_index = [
+            feature_index for feature_index, _ in old_space.numerical_features
+        ].index(list(self.features).index(feature_name))
+        return old_space.arm_mapping(
+            self.configuration_space,
+            {numerical_index: (old_digits, new_digits)},
+        )
+
+    def add_constraint(
+        self, feature_1: str, feature_2: str, constraint: str
+    ) -> ArmMapping:
+        """
+        Adds a cross tree constraint (REQUIRES, EXCLUDES) between features or range
+        conditions (e.g. "dimmer >= 0.6"). The boolean configurations violating it
+        are removed from the valid ones, no enumeration. Returns the ArmMapping from
+        the old to the new arms, arms of removed configurations are not mapped.
+        """
+        cross_tree_constraint = self.cross_tree_constraint(
+            feature_1, feature_2, constraint
+        )
+        old_space = self.configuration_space
+        valid_table = old_space.boolean_matrix
+        if not cross_tree_constraint.numerical:
+            valid_table = valid_table[
+                self.constraint_mask(cross_tree_constraint, valid_table)
+            ]
+            if self._fm_pl is not None:
+                self.add_pl_term(self.constraint_term(cross_tree_constraint))
+
+        self.cross_tree_constraints.append(cross_tree_constraint)
+        self.fm_json.setdefault(CROSS_TREE_CONSTRAINTS, []).append(
+            [feature_1, feature_2, constraint]
+        )
+        self.configuration_space = self._recompile(valid_table)
+        return old_space.arm_mapping(self.configuration_space)
+
+    def remove_constraint(
+        self, feature_1: str, feature_2: str, constraint: str
+    ) -> ArmMapping:
+        """
+        Removes a cross tree constraint. Only the boolean configurations violating
+        it are enumerated and merged into the valid ones (in enumeration order).
+        Returns the ArmMapping from the old to the new arms, the added arms have no
+        old arm.
+        """
+        removed = self._constraint_key(
+            self.cross_tree_constraint(feature_1, feature_2, constraint)
+        )
+        keys = [
+            self._constraint_key(cross_tree_constraint)
+            for cross_tree_constraint in self.cross_tree_constraints
+        ]
+        if removed not in keys:
+            raise ValueError(
+                "Cross tree constraint does not exist", feature_1, feature_2, constraint
+            )
+        cross_tree_constraint = self.cross_tree_constraints.pop(keys.index(removed))
+        definitions = self.fm_json[CROSS_TREE_CONSTRAINTS]
+        definitions.pop(
+            [
+                self._constraint_key(self.cross_tree_constraint(*definition))
+                for definition in definitions
+            ].index(removed)
+        )
+
+        old_space = self.configuration_space
+        if cross_tree_constraint.numerical:
+            valid_table = old_space.boolean_matrix
+        else:
+            self._fm_pl = None
+            added = self.enumeration_engine.enumerate(
+                And(self.fm_pl, Not(self.constraint_term(cross_tree_constraint))),
+                [feature.symbol for feature in self.features.values()],
+            )
+            # enumeration order is the lexicographic order of the configurations
+            valid_table = sorted(old_space.valid_table + added)
+        self.configuration_space = self._recompile(valid_table)
+        return old_space.arm_mapping(self.configuration_space)
+
+    @staticmethod
+    def _constraint_key(constraint: CrossTreeConstraint) -> tuple:
+        return (
+            constraint.feature_1.name,
+            constraint.feature_2.name,
+            constraint.constraint,
+        )
+
+    def _recompile(self, valid_table) -> ConfigurationSpace:
+        # configuration space of the edited model, stored under its new hash
+        compiled = self.expand_numerical_features(valid_table)
+        self.json_hash = self.definition_hash()
+        self.store_compiled(compiled)
+        self._valid_configurations_numerical = None
+        self._valid_configurations_ordinal = None
+        return self.apply_compiled(compiled)
+
+    def generate_numerical_truth_table(self) -> pandas.DataFrame:
+        return self.generate_configuration_space().to_dataframe()
+
+    def structure_hash(self) -> str:
+        return self.configuration_space.structure_hash()
 
     def numerical_feature_name_to_feature(self, numerical_feature_name):
-        for numerical_features in self.numerical_sub_features.values():
-            for sub_feature in numerical_features:
-                if sub_feature.name == numerical_feature_name:
-                    return sub_feature
-        raise ValueError("Numerical sub feature does not exist", numerical_feature_name)
+        try:
+            return self.sub_features_by_name[numerical_feature_name]
+        except KeyError:
+            raise ValueError(
+                "Numerical sub feature does not exist", numerical_feature_name
+            )
 
-    def numerical_feature_value_to_numerical_name(self, feature_name, value):
-        last_feature = None
-        for sub_feature in self.numerical_sub_features[feature_name]:
-            last_feature = sub_feature
-            if value >= sub_feature.lb and value < sub_feature.ub:
-                return sub_feature.name
-        if last_feature.ub == value and self.features[feature_name].type == REAL:
-            return last_feature.name
+    def numerical_feature_value_to_interval(self, feature_name, value) -> int:
+        # index of the sub feature (interval) containing value
+        edges = self.bin_edges[feature_name]
+        interval = bisect.bisect_right(edges, value) - 1
+        if 0 <= interval < len(edges) - 1:
+            return interval
+        if value == edges[-1] and self.features[feature_name].type == REAL:
+            return len(edges) - 2
         raise ValueError(
             "Value outside of valid range",
             "feature: {}, value: {}".format(feature_name, value),
         )
 
+    def numerical_feature_value_to_numerical_name(self, feature_name, value):
+        return self.numerical_sub_features[feature_name][
+            self.numerical_feature_value_to_interval(feature_name, value)
+        ].name
+
+    def numerical_feature_values_to_intervals(
+        self, feature_name: str, values
+    ) -> np.ndarray:
+        """
+        Vectorized numerical_feature_value_to_interval for an array of values
+        """
+        edges = np.asarray(self.bin_edges[feature_name], dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        intervals = np.searchsorted(edges, values, side="right") - 1
+        if self.features[feature_name].type == REAL:
+            intervals[values == edges[-1]] = len(edges) - 2
+        invalid = (intervals < 0) | (intervals >= len(edges) - 1)
+        if np.any(invalid):
+            raise ValueError(
+                "Value outside of valid range",
+                "feature: {}, values: {}".format(feature_name, values[invalid]),
+            )
+        return intervals
+
+    def numerical_feature_names(self) -> list[str]:
+        # in the order of the digits of the configuration space
+        feature_names = list(self.features)
+        return [
+            feature_names[feature_index]
+            for feature_index, _ in self.configuration_space.numerical_features
+        ]
+
+    def boolean_row_of(
+        self, feature_names: list[str], boolean_configuration: list[int] | None = None
+    ) -> int:
+        """
+        Boolean row index of boolean_configuration, if None of the only valid
+        boolean configuration whose active numerical features are feature_names
+        """
+        space = self.configuration_space
+        if boolean_configuration is not None:
+            return space.boolean_row_index(boolean_configuration)
+        numerical_features = dict(
+            zip(self.numerical_feature_names(), space.numerical_features)
+        )
+        boolean_rows = [
+            boolean_row_index
+            for boolean_row_index, entry in enumerate(space.valid_table)
+            if set(feature_names)
+            == {
+                name
+                for name, (feature_index, _) in numerical_features.items()
+                if entry[feature_index] == 1
+            }
+        ]
+        if len(boolean_rows) != 1:
+            raise ValueError(
+                "No unique boolean configuration for the features", feature_names
+            )
+        return boolean_rows[0]
+
+    def configuration_encoder(
+        self, feature_names: list[str], boolean_configuration: list[int] | None = None
+    ) -> "ConfigurationEncoder":
+        # see ConfigurationEncoder
+        return ConfigurationEncoder(self, feature_names, boolean_configuration)
+
+    def values_to_row_ids(
+        self, values: dict, boolean_configuration: list[int] | None = None
+    ) -> np.ndarray:
+        """
+        Configuration row ids of many raw sensor readings at once
+
+        values: dict
+            numerical feature name -> array of raw values, one per configuration
+        boolean_configuration: list of int
+            valid boolean configuration (0 / 1 per feature) shared by all readings,
+            if None the only one whose active numerical features are those of values
+        """
+        space = self.configuration_space
+        numerical_names = self.numerical_feature_names()
+        boolean_row_index = self.boolean_row_of(list(values), boolean_configuration)
+
+        num_values = len(next(iter(values.values()))) if values else 1
+        digits = np.zeros((num_values, len(numerical_names)), dtype=np.int64)
+        for numerical_index, name in enumerate(numerical_names):
+            if name in values:
+                digits[:, numerical_index] = self.numerical_feature_values_to_intervals(
+                    name, values[name]
+                )
+        return space.row_ids_of_digits(boolean_row_index, digits)
+
+
+class ConfigurationEncoder:
+    """
+    Class used to represent a prebuilt encoder of monitored values of numerical
+    features (e.g. arrival rate, servers, dimmer) into configurations of one
+    boolean configuration. Boolean row, bin edges, place values and the row
+    template are computed once, encoding costs O(number of values) independent of
+    the size of the configuration space. Build a new encoder after editing the
+    feature model (e.g. NumericalFM.set_interval_size).
+    """
+
+    def __init__(
+        self,
+        feature_model: NumericalFM,
+        feature_names: list[str],
+        boolean_configuration: list[int] | None = None,
+    ) -> None:
+        """
+        feature_names: list of str
+            numerical features of the values, in the order they are passed
+        boolean_configuration: list of int
+            see NumericalFM.values_to_row_ids
+        """
+        self.feature_model = feature_model
+        self.space = feature_model.configuration_space
+        self.feature_names = feature_names
+        self.boolean_row_index = feature_model.boolean_row_of(
+            feature_names, boolean_configuration
+        )
+
+        numerical_names = feature_model.numerical_feature_names()
+        entry = self.space.boolean_matrix[self.boolean_row_index]
+        active = {
+            name
+            for name, (feature_index, _) in zip(
+                numerical_names, self.space.numerical_features
+            )
+            if entry[feature_index] == 1
+        }
+        if active != set(feature_names):
+            raise ValueError(
+                "Values needed for the active numerical features", sorted(active)
+            )
+        radices = self.space.radices[self.boolean_row_index]
+        places = [math.prod(radices[index + 1 :]) for index in range(len(radices))]
+        positions = [numerical_names.index(name) for name in feature_names]
+        self.places = [places[position] for position in positions]
+        self.column_offsets = [
+            self.space.column_offsets[position] for position in positions
+        ]
+
+        # row of the boolean configuration without any interval
+        self.template = np.zeros(len(self.space.columns), dtype=np.int64)
+        self.template[: self.space.num_features] = self.space.boolean_matrix[
+            self.boolean_row_index
+        ]
+
+    def digits(self, values) -> list[int]:
+        # interval index of every value, values in the order of feature_names
+        return [
+            self.feature_model.numerical_feature_value_to_interval(name, value)
+            for name, value in zip(self.feature_names, values)
+        ]
+
+    def row_id(self, values) -> int:
+        """
+        Row id of the configuration of the values, -1 if it is pruned by a cross
+        tree constraint
+        """
+        rank = sum(
+            digit * place for digit, place in zip(self.digits(values), self.places)
+        )
+        return self.space.row_id_of_rank(self.boolean_row_index, rank)
+
+    def configuration(self, values) -> pandas.Series:
+        """
+        Configuration of the values, named by its row id like the configurations
+        of ConfigurationSpace.decode (None if pruned by a cross tree constraint)
+        """
+        digits = self.digits(values)
+        rank = sum(digit * place for digit, place in zip(digits, self.places))
+        row_id = self.space.row_id_of_rank(self.boolean_row_index, rank)
+
+        row = self.template.copy()
+        row[[offset + digit for offset, digit in zip(self.column_offsets, digits)]] = 1
+        return pandas.Series(
+            row, index=self.space.columns, name=row_id if row_id >= 0 else None
+        )
+
 
 if __name__ == "__main__":
     file_path = os.path.join(os.path.dirname(__file__), "..", "swim", "swim_fm.json")
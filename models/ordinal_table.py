@@ -0,0 +1,214 @@
+import numpy as np
+import pandas
+
+# interval index of an unselected numerical feature
+INACTIVE = -1
+
+
+def bin_dtype(num_intervals: int) -> np.dtype:
+    # smallest signed integer type for the interval indices and INACTIVE
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_intervals <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class OrdinalTable:
+    """
+    Class used to represent configurations in a compact ordinal encoding instead of
+    one-hot int64 columns: the boolean features bit packed (8 per byte) and one
+    small integer column per numerical feature holding the index of its interval
+    (INACTIVE if the feature is not selected).
+
+    The one-hot column layout (see ConfigurationSpace) is kept for the conversions
+    and to evaluate masks over one-hot column names.
+    """
+
+    def __init__(
+        self,
+        packed_booleans: np.ndarray,
+        bins: np.ndarray,
+        columns: list[str],
+        numerical_features: list[tuple[int, int]],
+        index: np.ndarray | None = None,
+    ) -> None:
+        """
+        packed_booleans: numpy.ndarray
+            boolean features of every configuration, np.packbits along axis 1
+        bins: numpy.ndarray
+            interval index of every numerical feature of every configuration
+        columns: list of str
+            one-hot columns, feature names followed by the numerical sub-features
+        numerical_features: list of tuple
+            (feature index, number of intervals) of every numerical feature, in the
+            order of their sub-feature columns
+        index: numpy.ndarray
+            row id of every configuration (default 0..n-1)
+        """
+        self.packed_booleans = packed_booleans
+        self.bins = bins
+        self.columns = pandas.Index(columns)
+        self.numerical_features = numerical_features
+        self.index = index if index is not None else np.arange(len(bins))
+        self.num_features = len(columns) - sum(
+            num_intervals for _, num_intervals in numerical_features
+        )
+
+        # sub-feature column -> (numerical feature, interval)
+        self.sub_feature_columns = {}
+        offset = self.num_features
+        for numerical_index, (_, num_intervals) in enumerate(numerical_features):
+            for interval in range(num_intervals):
+                self.sub_feature_columns[columns[offset + interval]] = (
+                    numerical_index,
+                    interval,
+                )
+            offset += num_intervals
+        # feature column -> bit position
+        self.feature_positions = {
+            name: position for position, name in enumerate(columns[: self.num_features])
+        }
+
+    def __len__(self) -> int:
+        return len(self.bins)
+
+    @property
+    def nbytes(self) -> int:
+        return self.packed_booleans.nbytes + self.bins.nbytes + self.index.nbytes
+
+    @classmethod
+    def from_boolean_matrix(
+        cls,
+        booleans: np.ndarray,
+        digits: np.ndarray,
+        columns: list[str],
+        numerical_features: list[tuple[int, int]],
+        index: np.ndarray | None = None,
+    ) -> "OrdinalTable":
+        """
+        booleans: numpy.ndarray
+            boolean features (0 / 1) of every configuration
+        digits: numpy.ndarray
+            interval index of every numerical feature, ignored where the feature is
+            not selected
+        """
+        bins = np.empty(
+            digits.shape,
+            dtype=bin_dtype(max((size for _, size in numerical_features), default=1)),
+        )
+        for numerical_index, (feature_index, _) in enumerate(numerical_features):
+            bins[:, numerical_index] = np.where(
+                booleans[:, feature_index] == 1, digits[:, numerical_index], INACTIVE
+            )
+        packed_booleans = np.packbits(booleans.astype(np.uint8), axis=1)
+        return cls(packed_booleans, bins, columns, numerical_features, index)
+
+    @classmethod
+    def from_one_hot(
+        cls,
+        configurations: pandas.DataFrame,
+        columns: list[str],
+        numerical_features: list[tuple[int, int]],
+    ) -> "OrdinalTable":
+        """
+        Compact encoding of one-hot configurations (e.g.
+        NumericalFM.valid_configurations_numerical), the index is kept
+        """
+        values = configurations[list(columns)].to_numpy()
+        num_features = len(columns) - sum(size for _, size in numerical_features)
+        booleans = values[:, :num_features]
+        digits = np.zeros((len(values), len(numerical_features)), dtype=np.int64)
+        offset = num_features
+        for numerical_index, (feature_index, num_intervals) in enumerate(
+            numerical_features
+        ):
+            intervals = values[:, offset : offset + num_intervals]
+            active = booleans[:, feature_index]
+            if np.any(np.count_nonzero(intervals, axis=1) != active):
+                raise ValueError(
+                    "Configurations are not one-hot", columns[feature_index]
+                )
+            digits[:, numerical_index] = np.argmax(intervals, axis=1)
+            offset += num_intervals
+        return cls.from_boolean_matrix(
+            booleans,
+            digits,
+            columns,
+            numerical_features,
+            configurations.index.to_numpy(),
+        )
+
+    def booleans(self) -> np.ndarray:
+        # unpacked boolean features, one row per configuration
+        return np.unpackbits(self.packed_booleans, axis=1, count=self.num_features)
+
+    def feature_column(self, name: str) -> np.ndarray:
+        # one boolean feature of every configuration, without unpacking the others
+        position = self.feature_positions[name]
+        return (self.packed_booleans[:, position // 8] >> (7 - position % 8)) & 1
+
+    def to_one_hot(self) -> pandas.DataFrame:
+        """
+        Same DataFrame as ConfigurationSpace.to_dataframe / decode_rows (int64 one-hot
+        columns)
+        """
+        table = np.zeros((len(self), len(self.columns)), dtype=np.int64)
+        table[:, : self.num_features] = self.booleans()
+        positions = np.arange(len(self))
+        offset = self.num_features
+        for numerical_index, (_, num_intervals) in enumerate(self.numerical_features):
+            bins = self.bins[:, numerical_index].astype(np.int64)
+            active = bins != INACTIVE
+            table[positions[active], offset + bins[active]] = 1
+            offset += num_intervals
+        return pandas.DataFrame(table, columns=self.columns, index=self.index)
+
+    def mask(self, configuration: pandas.Series) -> np.ndarray:
+        """
+        Whether every configuration matches the (partial) one-hot configuration,
+        e.g. a context. Only the bytes and bin columns of the given columns are read.
+        """
+        # bits to check and their expected values per packed byte
+        care = np.zeros(self.packed_booleans.shape[1], dtype=np.uint8)
+        expected = np.zeros(self.packed_booleans.shape[1], dtype=np.uint8)
+        # numerical feature -> (selected interval, excluded intervals)
+        intervals = {}
+        for column, value in configuration.items():
+            if column in self.sub_feature_columns:
+                numerical_index, interval = self.sub_feature_columns[column]
+                selected, excluded = intervals.get(numerical_index, (None, set()))
+                if value == 1:
+                    if selected is not None and selected != interval:
+                        return np.zeros(len(self), dtype=bool)
+                    selected = interval
+                else:
+                    excluded.add(interval)
+                intervals[numerical_index] = (selected, excluded)
+            elif column in self.feature_positions:
+                position = self.feature_positions[column]
+                bit = np.uint8(1 << (7 - position % 8))
+                care[position // 8] |= bit
+                if value == 1:
+                    expected[position // 8] |= bit
+            else:
+                raise ValueError("Column does not exist", column)
+
+        mask = np.ones(len(self), dtype=bool)
+        for byte in np.flatnonzero(care):
+            mask &= (self.packed_booleans[:, byte] & care[byte]) == expected[byte]
+        for numerical_index, (selected, excluded) in intervals.items():
+            bins = self.bins[:, numerical_index]
+            if selected is not None:
+                # the other intervals of a selected one are 0
+                if selected in excluded:
+                    return np.zeros(len(self), dtype=bool)
+                mask &= bins == selected
+            elif len(excluded) == self.numerical_features[numerical_index][1]:
+                mask &= bins == INACTIVE
+            else:
+                mask &= ~np.isin(bins, list(excluded))
+        return mask
+
+    def matching_rows(self, configuration: pandas.Series) -> np.ndarray:
+        # row ids of the configurations matching, see mask
+        return self.index[self.mask(configuration)]
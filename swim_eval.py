@@ -1,17 +1,51 @@
-from models.feature_model import NumericalFM
+import argparse
+import os
+
+from models.arm_store import ArmStore
+from models.feature_model import CACHE_DIR, NumericalFM
 from models.cmab import EpsilonGreedy
+from models.event_log import log
 from use_cases.swim.swim_adaptation_logic import (
     SWIMAdapatationLogic,
     SWIMSimulatorInterface,
 )
+from use_cases.trace import TraceWriter
+
+CHECKPOINT = "swim_checkpoint.npz"
+
+parser = argparse.ArgumentParser(description="CASCADA against the SWIM simulator")
+parser.add_argument(
+    "--trace",
+    metavar="DIRECTORY",
+    help="record the monitored cycles for offline replay (use_cases/trace.py)",
+)
+args = parser.parse_args()
 
+feature_model = NumericalFM("use_cases/swim/swim_fm.json", cache_dir=CACHE_DIR)
 
-feature_model = NumericalFM("use_cases/swim/swim_fm.json")
-cmab_epsilon_greedy = EpsilonGreedy(feature_model, epsilon=0.9, learning_rate=0.1)
-swim_simulator_interface = SWIMSimulatorInterface(feature_model)
+# warm start from the arm statistics learned in earlier runs
+arm_store = None
+if os.path.exists(CHECKPOINT):
+    try:
+        arm_store = ArmStore.load(CHECKPOINT, feature_model.structure_hash())
+    except ValueError as err:
+        # swim_fm.json changed since the checkpoint, overwritten by this run
+        log.warning("checkpoint_not_loaded", error=err, action="starting cold")
+
+cmab_epsilon_greedy = EpsilonGreedy(
+    feature_model, epsilon=0.9, learning_rate=0.1, arm_store=arm_store
+)
+trace_writer = None
+if args.trace is not None:
+    trace_writer = TraceWriter(args.trace, feature_model.structure_hash())
+swim_simulator_interface = SWIMSimulatorInterface(
+    feature_model, trace_writer=trace_writer
+)
 
 swim_adaptation_logic = SWIMAdapatationLogic(
     swim_simulator_interface, cmab_epsilon_greedy, feature_model
 )
 
-swim_adaptation_logic.run(num_runs=100, adaptation_loop_interval=60)
+swim_adaptation_logic.run(
+    num_runs=100, adaptation_loop_interval=60, checkpoint_path=CHECKPOINT
+)
@@ -0,0 +1,20 @@
+from use_cases.experiment import run_experiments
+
+# epsilon greedy hyperparameters and interval sizes against the in-process SWIM model,
+# 5 seeds per combination in parallel worker processes
+grid = {
+    "policy": ["epsilon_greedy"],
+    "epsilon": [0.1, 0.3, 0.9],
+    "learning_rate": [0.1, None],
+    "dimmer_interval": [0.2, 0.1],
+}
+
+results = run_experiments(
+    grid, seeds=range(5), num_runs=500, simulator_options={"noise": 0.05}
+)
+results.to_csv("swim_experiments.csv", index=False)
+
+final = results.groupby(list(grid), dropna=False).last()
+print(
+    final[["cumulative_reward_mean", "cumulative_regret_mean", "seeds"]].to_string()
+)
@@ -0,0 +1,25 @@
+from models.feature_model import CACHE_DIR, NumericalFM
+from models.cmab import EpsilonGreedy
+from use_cases.clock import VirtualClock
+from use_cases.swim.swim_adaptation_logic import (
+    SWIMAdapatationLogic,
+    SWIMSimulatorInterface,
+)
+from use_cases.swim.swim_simulator import LocalSwimClient, SwimModel
+
+# swim_eval.py against the in-process SWIM model instead of the docker container,
+# the virtual clock runs the 60 second intervals without waiting
+clock = VirtualClock()
+swim_model = SwimModel(clock=clock, noise=0.05, seed=0)
+
+feature_model = NumericalFM("use_cases/swim/swim_fm.json", cache_dir=CACHE_DIR)
+cmab_epsilon_greedy = EpsilonGreedy(feature_model, epsilon=0.9, learning_rate=0.1)
+swim_simulator_interface = SWIMSimulatorInterface(
+    feature_model, swim_client=LocalSwimClient(swim_model), clock=clock
+)
+
+swim_adaptation_logic = SWIMAdapatationLogic(
+    swim_simulator_interface, cmab_epsilon_greedy, feature_model
+)
+
+swim_adaptation_logic.run(num_runs=1000, adaptation_loop_interval=60)
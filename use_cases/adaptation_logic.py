@@ -1,8 +1,43 @@
+import asyncio
+import contextlib
+import functools
+import inspect
+import time
+
+import numpy as np
 import pandas
+from models.checkpoint import CheckpointWriter
 from models.cmab import CMAB
+from models.configuration_space import ArmMapping
+from models.event_log import DEBUG, log
 from models.feature_model import NumericalFM
+from use_cases.clock import WallClock
+from use_cases.metrics import (
+    ADAPTED,
+    ANALYSIS_AND_PLAN,
+    BANDIT_DECISIONS,
+    BANDIT_UPDATES,
+    CYCLE_SECONDS,
+    CYCLES,
+    EXECUTE,
+    FAILED,
+    FEEDBACK,
+    LATENESS_SECONDS,
+    MISSED_TICKS,
+    MONITOR,
+    NO_FEEDBACK,
+    OVERRUNS,
+    PHASE_SECONDS,
+    REWARDS_NOT_LEARNED,
+    Metrics,
+)
+from use_cases.scheduler import DeadlineScheduler, SKIP
 
-import time
+
+class StopAdaptation(Exception):
+    # raised by a sensor interface when the managed system has ended (e.g. a replayed
+    # trace), ends the adaptation loop like its last run
+    pass
 
 
 class AdaptationLogic:
@@ -12,49 +47,293 @@ class AdaptationLogic:
         simulation_interface: "SimulatorInterface",
         cmab: CMAB,
         feature_model: NumericalFM,
+        metrics: Metrics | None = None,
     ) -> None:
+        """
+        metrics: Metrics
+            registry of the phase timings, cycle and bandit counters (default: a new
+            one), shared with the simulator interface (e.g. SWIM command latency)
+        """
         self.simulation_interface = simulation_interface
         self.cmab = cmab
 
         self.feature_model = feature_model
-        self.valid_configurations = self.feature_model.generate_numerical_truth_table()
+        self.configuration_space = self.feature_model.configuration_space
         self.context_features = self.feature_model.context_feature_names
         self.system_features = self.feature_model.system_feature_names
+        # cycles aborted by connection errors / timeouts
+        self.failed_cycles = 0
+        # seconds of the MAPE-K phases of the current cycle
+        self.phase_seconds = {}
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.simulation_interface.attach_metrics(self.metrics)
 
-    def run(self, num_runs=1, adaptation_loop_interval=1):
+    def run(
+        self,
+        num_runs=1,
+        adaptation_loop_interval=1,
+        checkpoint_path=None,
+        checkpoint_interval=10,
+        overrun_policy=SKIP,
+        clock=None,
+        metrics_path=None,
+        metrics_interval=10,
+    ):
+        """
+        adaptation_loop_interval: float
+            period of the loop in seconds, cycles start on fixed deadlines
+        overrun_policy: str
+            SKIP or CATCH_UP, see DeadlineScheduler
+        clock: WallClock, AcceleratedClock or VirtualClock
+            time source of the loop, the clock of the simulation interface if None.
+            A VirtualClock shared with a simulator (e.g. SwimModel) runs the cycles
+            without waiting.
+        checkpoint_path: str
+            if given, the learned arm statistics are written to this .npz file every
+            checkpoint_interval runs and at the end (without blocking the loop)
+        metrics_path: str
+            if given, self.metrics is exported to this file every metrics_interval
+            runs and at the end, a JSON snapshot (.json) or Prometheus text
+        """
+        steps = self.cycles(
+            num_runs,
+            adaptation_loop_interval,
+            checkpoint_path,
+            checkpoint_interval,
+            overrun_policy,
+            clock,
+            metrics_path,
+            metrics_interval,
+        )
+        result = error = None
+        while True:
+            try:
+                call = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration:
+                return
+            result = error = None
+            try:
+                result = call()
+            except BaseException as err:
+                # also KeyboardInterrupt, the loop disconnects before it ends
+                error = err
 
-        self.simulation_interface.connect_to_simulator()
+    def cycles(
+        self,
+        num_runs,
+        adaptation_loop_interval,
+        checkpoint_path,
+        checkpoint_interval,
+        overrun_policy,
+        clock,
+        metrics_path,
+        metrics_interval,
+    ):
+        """
+        The MAPE-K loop of AdaptationLogic.run and AsyncAdaptationLogic.run, as a
+        generator of the calls that may block (simulator interface, waiting for the
+        next cycle). run calls (or awaits) every yielded call and sends its result
+        back, or throws its exception into the loop. The simulator is disconnected and
+        the checkpoint writer closed also when the loop raises.
+        """
+        if clock is None:
+            clock = self.simulation_interface.clock
+        checkpoint_writer = None
+        if checkpoint_path is not None:
+            checkpoint_writer = CheckpointWriter(
+                checkpoint_path, self.feature_model.structure_hash()
+            )
 
-        for run in range(num_runs):
-            print(f"--- Run: {run}")
-            # 1 Monitor
+        yield self.simulation_interface.connect_to_simulator
+        try:
+            yield from self.loop(
+                num_runs,
+                adaptation_loop_interval,
+                checkpoint_writer,
+                checkpoint_interval,
+                overrun_policy,
+                clock,
+                metrics_path,
+                metrics_interval,
+            )
+            if checkpoint_writer is not None:
+                checkpoint_writer.submit(self.cmab.arm_store)
+        finally:
+            # also after an uncaught exception
             try:
-                current_configuration, reward = self.monitor()
-            except ValueError as err:
-                print(err, "Exiting adpation logic")
-                break
-            # print(f"--- Monitoring: \n{current_configuration}, \nreward: {reward}")
+                yield self.simulation_interface.disconnect_from_simulator
+            finally:
+                self.simulation_interface.flush_trace()
+                if checkpoint_writer is not None:
+                    yield functools.partial(
+                        self.close_checkpoint_writer, checkpoint_writer
+                    )
 
-            if self.delayed_feedback_available():
+        log.info(
+            "loop_finished",
+            overruns=self.scheduler.overruns,
+            missed_ticks=self.scheduler.missed_ticks,
+            failed_cycles=self.failed_cycles,
+        )
+        if metrics_path is not None:
+            self.metrics.export(metrics_path)
 
-                # 2 Analysis and Plan
-                selected_configuration = self.analysis_and_plan(
-                    current_configuration, reward, run
+    def loop(
+        self,
+        num_runs,
+        adaptation_loop_interval,
+        checkpoint_writer,
+        checkpoint_interval,
+        overrun_policy,
+        clock,
+        metrics_path,
+        metrics_interval,
+    ):
+        # the cycles between connect and disconnect, see cycles
+        self.scheduler = DeadlineScheduler(
+            adaptation_loop_interval, overrun_policy, clock
+        )
+        self.scheduler.start()
+        for run in range(num_runs):
+            if self.configuration_space is not self.feature_model.configuration_space:
+                raise RuntimeError(
+                    "Feature model edited without AdaptationLogic.migrate, the arms of "
+                    "the CMAB and the simulator interface are out of date"
                 )
+            log.debug("cycle_start", run=run)
+            cycle_start = time.perf_counter()
+            outcome = NO_FEEDBACK
+            self.phase_seconds = {}
+            current_configuration = reward = selected_configuration = None
+            try:
+                # 1 Monitor
+                try:
+                    with self.phase(MONITOR):
+                        current_configuration, reward = yield self.monitor
+                except StopAdaptation as err:
+                    log.info("loop_stopped", reason=err)
+                    break
+                except ValueError as err:
+                    log.error("monitor_failed", error=err, action="exiting")
+                    break
+
+                with self.phase(FEEDBACK):
+                    feedback_available = yield self.delayed_feedback_available
+                if feedback_available:
 
-                # 3 Execute
-                self.execute(selected_configuration)
-            print(
-                f"Waiting for adaptation loop interval: {adaptation_loop_interval} secs"
+                    # 2 Analysis and Plan
+                    with self.phase(ANALYSIS_AND_PLAN):
+                        selected_configuration = self.analysis_and_plan(
+                            current_configuration, reward, run
+                        )
+
+                    # 3 Execute
+                    with self.phase(EXECUTE):
+                        yield functools.partial(self.execute, selected_configuration)
+                    outcome = ADAPTED
+            except OSError as err:
+                # lost connection / timeout, the simulator interface reconnects
+                self.failed_cycles += 1
+                outcome = FAILED
+                log.warning("cycle_failed", error=err, action="skipping cycle")
+            self.record_cycle(
+                run,
+                cycle_start,
+                outcome,
+                current_configuration,
+                reward,
+                selected_configuration,
             )
-            time.sleep(adaptation_loop_interval)
 
-            # Function for timing the AL to the given interval
+            if checkpoint_writer is not None and (run + 1) % checkpoint_interval == 0:
+                checkpoint_writer.submit(self.cmab.arm_store)
+            if metrics_path is not None and (run + 1) % metrics_interval == 0:
+                self.metrics.export(metrics_path)
+            log.debug("waiting", seconds=adaptation_loop_interval)
+            missed_ticks = self.scheduler.missed_ticks
+            yield functools.partial(self.wait_for_next_cycle, clock)
+            self.record_schedule(missed_ticks)
+
+    def wait_for_next_cycle(self, clock) -> None:
+        clock.sleep(self.scheduler.next_delay())
+
+    def close_checkpoint_writer(self, checkpoint_writer: CheckpointWriter) -> None:
+        checkpoint_writer.close()
 
-        self.simulation_interface.disconnect_from_simulator()
+    def migrate(self, arm_mapping: ArmMapping) -> None:
+        """
+        Follows an edit of the feature model (NumericalFM.set_interval_size,
+        add_constraint, remove_constraint): the CMAB keeps its learned statistics
+        through arm_mapping, the simulator interface rebuilds its configuration
+        encoder and effector plan. Edits while the loop runs must go through this
+        method, the loop stops at the next cycle otherwise.
+        """
+        self.simulation_interface.feature_model_changed()
+        self.cmab.migrate(arm_mapping)
+        self.configuration_space = self.feature_model.configuration_space
+        self.context_features = self.feature_model.context_feature_names
+        self.system_features = self.feature_model.system_feature_names
+
+    @contextlib.contextmanager
+    def phase(self, phase: str):
+        # times one MAPE-K phase of the current cycle
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phase_seconds[phase] = seconds
+            self.metrics.observe(PHASE_SECONDS, seconds, phase=phase)
+
+    def record_cycle(
+        self,
+        run: int,
+        cycle_start: float,
+        outcome: str,
+        configuration: pandas.Series | None,
+        reward: float | None,
+        selected_configuration: pandas.Series | None,
+    ) -> None:
+        seconds = time.perf_counter() - cycle_start
+        self.metrics.observe(CYCLE_SECONDS, seconds)
+        self.metrics.increment(CYCLES, outcome=outcome)
+        if log.enabled(DEBUG):
+            # configurations of the ConfigurationEncoder / CMAB are named by row id,
+            # the context id is the one of the ArmIndex
+            row_id = None if configuration is None else configuration.name
+            if not isinstance(row_id, (int, np.integer)) or row_id < 0:
+                row_id = None
+            context = None
+            row_contexts = getattr(self.cmab.arm_index, "row_contexts", None)
+            if row_id is not None and row_contexts is not None:
+                context = int(row_contexts[row_id])
+            log.debug(
+                "cycle",
+                run=run,
+                outcome=outcome,
+                configuration=row_id,
+                context=context,
+                arm=(
+                    None
+                    if selected_configuration is None
+                    else selected_configuration.name
+                ),
+                reward=reward,
+                seconds=seconds,
+                phases=self.phase_seconds,
+            )
+
+    def record_schedule(self, missed_ticks: int) -> None:
+        # overrun of the finished cycle, missed_ticks: count before its deadline
+        if self.scheduler.last_lateness > 0:
+            self.metrics.increment(OVERRUNS)
+            self.metrics.observe(LATENESS_SECONDS, self.scheduler.last_lateness)
+            self.metrics.increment(
+                MISSED_TICKS, self.scheduler.missed_ticks - missed_ticks
+            )
 
     def monitor(self) -> tuple[pandas.Series, float]:
-        pass
+        return self.simulation_interface.sensor_interface()
 
     def delayed_feedback_available(self) -> bool:
         return True
@@ -62,13 +341,22 @@ class AdaptationLogic:
     def analysis_and_plan(
         self, current_configuration: pandas.Series, reward: float, run: int
     ) -> pandas.Series:
-        print("-A- and -P-")
+        policy = type(self.cmab).__name__
         if run != 0:
-            self.cmab.update_arm(current_configuration, reward)
+            try:
+                self.cmab.update_arm(current_configuration, reward)
+                self.metrics.increment(BANDIT_UPDATES, policy=policy)
+            except ValueError as err:
+                # monitored system configuration pruned by a cross tree constraint
+                self.metrics.increment(REWARDS_NOT_LEARNED, policy=policy)
+                log.warning("reward_not_learned", error=err)
+        self.metrics.increment(BANDIT_DECISIONS, policy=policy)
         return self.cmab.select_arm(current_configuration)
 
     def execute(self, system_configuration: pandas.Series) -> None:
-        pass
+        self.simulation_interface.effector_interface(
+            self.get_only_system(system_configuration)
+        )
 
     def get_only_context(self, config: pandas.Series) -> pandas.Series:
         return config.loc[self.context_features]
@@ -79,8 +367,59 @@ class AdaptationLogic:
 
 class SimulatorInterface:
 
-    def __init__(self, feature_model: NumericalFM) -> None:
+    def __init__(
+        self, feature_model: NumericalFM, clock=None, trace_writer=None
+    ) -> None:
+        """
+        trace_writer: TraceWriter
+            if given, the raw sensor values, configuration and reward of every cycle
+            are logged (see record), e.g. for a ReplaySimulatorInterface
+        """
         self.feature_model = feature_model
+        # time of the simulator, also used by the adaptation loop
+        self.clock = clock if clock is not None else WallClock()
+        self.trace_writer = trace_writer
+        self.metrics = None
+
+    def attach_metrics(self, metrics: Metrics) -> None:
+        # called by the AdaptationLogic, the interface records into its metrics
+        self.metrics = metrics
+
+    def record(
+        self, sensor_values: dict, configuration: pandas.Series, reward: float
+    ) -> None:
+        # called by the sensor interface once per cycle
+        if self.trace_writer is not None:
+            # configurations of ConfigurationEncoder / decode are named by row id
+            row_id = configuration.name
+            if not isinstance(row_id, (int, np.integer)):
+                try:
+                    row_id = self.feature_model.configuration_space.encode(
+                        configuration
+                    )
+                except ValueError:
+                    # pruned by a cross tree constraint, not an arm
+                    row_id = -1
+            self.trace_writer.append(
+                self.clock.monotonic(), sensor_values, row_id, reward
+            )
+
+    def flush_trace(self) -> None:
+        if self.trace_writer is not None:
+            self.trace_writer.flush()
+
+    def feature_model_changed(self) -> None:
+        # called by AdaptationLogic.migrate, rebuilds what was derived from the
+        # configuration space of the feature model
+        if (
+            self.trace_writer is not None
+            and self.trace_writer.structure_hash != self.feature_model.structure_hash()
+        ):
+            raise ValueError(
+                "Row ids of the trace belong to the previous feature model, set a "
+                "new trace_writer first",
+                self.trace_writer.path,
+            )
 
     def sensor_interface(self) -> tuple[pandas.Series, float]:
         # Translate simulator values to pandas.Series Feature Model configuration
@@ -95,3 +434,161 @@ class SimulatorInterface:
 
     def disconnect_from_simulator(self) -> None:
         pass
+
+
+class AsyncSimulatorInterface(SimulatorInterface):
+    """
+    asyncio version of SimulatorInterface, sensor / effector calls do not block the
+    event loop so one process can drive many simulators
+    """
+
+    async def sensor_interface(self) -> tuple[pandas.Series, float]:
+        pass
+
+    async def effector_interface(self, configuration: pandas.Series) -> None:
+        pass
+
+    async def connect_to_simulator(self) -> None:
+        pass
+
+    async def disconnect_from_simulator(self) -> None:
+        pass
+
+
+class ThreadedSimulatorInterface(AsyncSimulatorInterface):
+    """
+    Thin async wrapper running the calls of a synchronous SimulatorInterface in
+    worker threads
+    """
+
+    def __init__(self, simulator_interface: SimulatorInterface) -> None:
+        super().__init__(
+            simulator_interface.feature_model, simulator_interface.clock
+        )
+        self.simulator_interface = simulator_interface
+
+    async def sensor_interface(self) -> tuple[pandas.Series, float]:
+        return await asyncio.to_thread(self.simulator_interface.sensor_interface)
+
+    async def effector_interface(self, configuration: pandas.Series) -> None:
+        await asyncio.to_thread(
+            self.simulator_interface.effector_interface, configuration
+        )
+
+    async def connect_to_simulator(self) -> None:
+        await asyncio.to_thread(self.simulator_interface.connect_to_simulator)
+
+    async def disconnect_from_simulator(self) -> None:
+        await asyncio.to_thread(self.simulator_interface.disconnect_from_simulator)
+
+    def attach_metrics(self, metrics: Metrics) -> None:
+        super().attach_metrics(metrics)
+        self.simulator_interface.attach_metrics(metrics)
+
+    def flush_trace(self) -> None:
+        self.simulator_interface.flush_trace()
+
+    def feature_model_changed(self) -> None:
+        self.simulator_interface.feature_model_changed()
+
+
+class AsyncAdaptationLogic(AdaptationLogic):
+    """
+    MAPE-K loop as a coroutine, many loops with their own intervals can run in one
+    event loop (see run_adaptation_loops)
+    """
+
+    def __init__(
+        self,
+        simulation_interface: AsyncSimulatorInterface,
+        cmab: CMAB,
+        feature_model: NumericalFM,
+        metrics: Metrics | None = None,
+    ) -> None:
+        super().__init__(simulation_interface, cmab, feature_model, metrics)
+
+    async def run(
+        self,
+        num_runs=1,
+        adaptation_loop_interval=1,
+        checkpoint_path=None,
+        checkpoint_interval=10,
+        overrun_policy=SKIP,
+        clock=None,
+        metrics_path=None,
+        metrics_interval=10,
+    ):
+        # see AdaptationLogic.run, the calls of the loop are awaited
+        if clock is None:
+            clock = self.simulation_interface.clock
+        steps = self.cycles(
+            num_runs,
+            adaptation_loop_interval,
+            checkpoint_path,
+            checkpoint_interval,
+            overrun_policy,
+            clock,
+            metrics_path,
+            metrics_interval,
+        )
+        clock.attach()
+        try:
+            # loops started together attach before the (virtual) time advances
+            await asyncio.sleep(0)
+            result = error = None
+            while True:
+                try:
+                    call = steps.send(result) if error is None else steps.throw(error)
+                except StopIteration:
+                    return
+                result = error = None
+                try:
+                    result = call()
+                    if inspect.isawaitable(result):
+                        result = await result
+                except BaseException as err:
+                    error = err
+        finally:
+            clock.detach()
+
+    async def wait_for_next_cycle(self, clock) -> None:
+        await clock.async_sleep(self.scheduler.next_delay())
+
+    async def close_checkpoint_writer(
+        self, checkpoint_writer: CheckpointWriter
+    ) -> None:
+        # the last write may take a while, the other loops keep running
+        await asyncio.to_thread(checkpoint_writer.close)
+
+    async def monitor(self) -> tuple[pandas.Series, float]:
+        return await self.simulation_interface.sensor_interface()
+
+    async def delayed_feedback_available(self) -> bool:
+        return True
+
+    async def execute(self, system_configuration: pandas.Series) -> None:
+        await self.simulation_interface.effector_interface(
+            self.get_only_system(system_configuration)
+        )
+
+
+async def run_adaptation_loops(
+    adaptation_logics: list[AsyncAdaptationLogic],
+    num_runs: int = 1,
+    adaptation_loop_intervals: float | list[float] = 1,
+    clock=None,
+) -> None:
+    """
+    Runs independent adaptation loops concurrently, each with its own interval.
+    With a shared VirtualClock the loops run in simulated time.
+    """
+    if not isinstance(adaptation_loop_intervals, list):
+        adaptation_loop_intervals = [adaptation_loop_intervals] * len(adaptation_logics)
+    await asyncio.gather(
+        *[
+            adaptation_logic.run(num_runs, interval, clock=clock)
+            for adaptation_logic, interval in zip(
+                adaptation_logics, adaptation_loop_intervals
+            )
+        ]
+    )
@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class WallClock:
+    """
+    Class used to represent the real (monotonic) time
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+    async def async_sleep(self, seconds: float) -> None:
+        await asyncio.sleep(max(seconds, 0))
+
+    # tasks sharing the clock, only used by the VirtualClock
+    def attach(self) -> None:
+        pass
+
+    def detach(self) -> None:
+        pass
+
+
+class AcceleratedClock(WallClock):
+    """
+    Class used to represent real time running speedup times faster, e.g. to run a
+    simulator and the adaptation loop with shorter real intervals
+    """
+
+    def __init__(self, speedup: float, start: float = 0.0) -> None:
+        if speedup <= 0:
+            raise ValueError("Invalid speedup", speedup)
+        self.speedup = speedup
+        self.start = start
+        self.real_start = time.monotonic()
+
+    def monotonic(self) -> float:
+        return self.start + (time.monotonic() - self.real_start) * self.speedup
+
+    def sleep(self, seconds: float) -> None:
+        super().sleep(seconds / self.speedup)
+
+    async def async_sleep(self, seconds: float) -> None:
+        await super().async_sleep(seconds / self.speedup)
+
+
+class VirtualClock(WallClock):
+    """
+    Class used to represent simulated time, sleep() advances the time instantly.
+    A simulator sharing the clock with the adaptation loop sees the elapsed time of
+    every cycle without waiting for it.
+
+    Event driven in asyncio: while all attached tasks wait in async_sleep, the time
+    jumps to the earliest wake up time and that task is resumed, so concurrent
+    adaptation loops interleave as in real time.
+    """
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.now = start
+        self.participants = 0
+        # heap of (wake up time, sequence number, future)
+        self.sleepers = []
+        self.sequence = itertools.count()
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.now += seconds
+
+    async def async_sleep(self, seconds: float) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self.sleepers, (self.now + max(seconds, 0), next(self.sequence), future)
+        )
+        self._wake_up()
+        await future
+
+    def attach(self) -> None:
+        self.participants += 1
+
+    def detach(self) -> None:
+        self.participants -= 1
+        self._wake_up()
+
+    def _wake_up(self) -> None:
+        # a task doing anything but sleeping holds the time
+        if self.sleepers and len(self.sleepers) >= self.participants:
+            wake_up_time, _, future = heapq.heappop(self.sleepers)
+            self.now = max(self.now, wake_up_time)
+            future.set_result(None)
@@ -0,0 +1,326 @@
+import asyncio
+import codecs
+import json
+import socket
+import time
+
+from models.event_log import log
+
+# request of the DeltaIoT simulator server, one JSON object per line
+REQUEST = "request"
+QOS = "QoS"
+# fields of the QoS response, one object per period: {"0": {...}, "1": {...}}
+ENERGY_CONSUMPTION = "EnergyConsumption"
+PACKET_LOSS = "PacketLoss"
+
+# metrics of the DeltaIoT clients, see use_cases.metrics
+ROUND_TRIP_SECONDS = "deltaiot_round_trip_seconds"
+REQUESTS = "deltaiot_requests_total"
+RETRIES = "deltaiot_retries_total"
+RECONNECTS = "deltaiot_reconnects_total"
+
+
+def qos_request() -> dict:
+    # packet loss and energy consumption of the simulated periods
+    return {REQUEST: QOS}
+
+
+def latest_qos(response: dict) -> tuple[float, float]:
+    # packet loss and energy consumption of the last period of a QoS response
+    period = response[max(response, key=int)]
+    return period[PACKET_LOSS], period[ENERGY_CONSUMPTION]
+
+
+def encode_requests(requests: list[dict]) -> bytes:
+    return "".join(json.dumps(request) + "\n" for request in requests).encode("utf-8")
+
+
+def record_round_trip(metrics, requests, seconds):
+    # latency of one pipelined batch, labelled by its request name ("batch" if mixed)
+    if metrics is None:
+        return
+    names = [request.get(REQUEST, "") for request in requests]
+    label = names[0] if len(set(names)) == 1 else "batch"
+    metrics.observe(ROUND_TRIP_SECONDS, seconds, request=label)
+    for name in names:
+        metrics.increment(REQUESTS, request=name)
+
+
+class JSONStreamDecoder:
+    """
+    Class used to represent an incremental decoder of a stream of newline delimited
+    JSON values. Bytes are fed as they arrive, every complete line is decoded once,
+    a partial line stays buffered (undecoded) until its newline arrives.
+    """
+
+    def __init__(self) -> None:
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        # text of the partial line
+        self.pending = []
+        # decoded values not yet taken
+        self.values = []
+
+    def feed(self, data: bytes) -> None:
+        text = self.text_decoder.decode(data)
+        newline = text.rfind("\n")
+        if newline < 0:
+            self.pending.append(text)
+            return
+        lines = "".join(self.pending) + text[: newline + 1]
+        self.pending = [text[newline + 1 :]]
+        position = 0
+        while True:
+            # skip the delimiters between values
+            while position < len(lines) and lines[position].isspace():
+                position += 1
+            if position == len(lines):
+                break
+            try:
+                value, position = self.decoder.raw_decode(lines, position)
+            except json.JSONDecodeError:
+                line = lines[position : lines.find("\n", position)]
+                raise ValueError("Invalid JSON response", line)
+            self.values.append(value)
+
+    def take(self, count: int) -> list:
+        values, self.values = self.values[:count], self.values[count:]
+        return values
+
+    def reset(self) -> None:
+        self.text_decoder.reset()
+        self.pending = []
+        self.values = []
+
+
+def feed(decoder: JSONStreamDecoder, chunk: bytes) -> None:
+    # a malformed response leaves the stream out of sync, like a broken connection
+    try:
+        decoder.feed(chunk)
+    except ValueError as err:
+        raise ConnectionError(f"Invalid DeltaIoT response: {err}")
+
+
+class DeltaIoTClient:
+    """
+    Client of the DeltaIoT simulator server over one persistent connection: requests
+    and responses are JSON objects, one per line. Requests of a batch are pipelined
+    (all written, then all responses read) so a batch needs one round trip.
+    """
+
+    def __init__(
+        self,
+        sock=None,
+        timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        metrics=None,
+    ):
+        # see SwimClient
+        self.sock = sock
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+
+        self.address = None
+        self.connected = False
+        self.reconnects = 0
+        self.decoder = JSONStreamDecoder()
+
+    def connect(self, host, port):
+        self.address = (host, port)
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.address)
+        self.connected = True
+
+    def disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.connected = False
+        self.decoder.reset()
+
+    def is_connected(self):
+        return self.connected
+
+    def reconnect(self):
+        # retries with exponential backoff, raises the last error
+        if self.address is None:
+            raise ConnectionError("not connected")
+        self.disconnect()
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.connect(*self.address)
+                self.reconnects += 1
+                if self.metrics is not None:
+                    self.metrics.increment(RECONNECTS)
+                return
+            except OSError as err:
+                self.disconnect()
+                if attempt == self.max_retries:
+                    raise ConnectionError(f"Reconnect to DeltaIoT failed: {err}")
+                log.warning("deltaiot_reconnect_failed", error=err, retry_in=delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def send_request(self, request, idempotent=True):
+        return self.send_requests([request], idempotent)[0]
+
+    def send_requests(self, requests, idempotent=True):
+        """
+        Pipelined: writes all requests, then decodes one response per request. A
+        broken connection or timeout triggers a reconnect, idempotent requests are
+        then sent again, otherwise the ConnectionError is raised.
+        """
+        data = encode_requests(requests)
+        for attempt in range(self.max_retries + 1):
+            if not self.connected:
+                self.reconnect()
+            try:
+                start = time.perf_counter()
+                deadline = time.monotonic() + self.timeout
+                self.sock.sendall(data)
+                responses = self.read_responses(len(requests), deadline)
+                record_round_trip(self.metrics, requests, time.perf_counter() - start)
+                return responses
+            except OSError as err:
+                # the stream may be out of sync, start from a fresh connection
+                self.disconnect()
+                if attempt == self.max_retries or not idempotent:
+                    raise ConnectionError(f"DeltaIoT request failed: {err}")
+                if self.metrics is not None:
+                    self.metrics.increment(RETRIES)
+                log.warning("deltaiot_request_failed", error=err, action="retrying")
+
+    def read_responses(self, count, deadline):
+        while len(self.decoder.values) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("DeltaIoT response timed out")
+            self.sock.settimeout(remaining)
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("socket connection broken")
+            feed(self.decoder, chunk)
+        return self.decoder.take(count)
+
+    def get_qos(self):
+        return self.send_request(qos_request())
+
+
+class AsyncDeltaIoTClient:
+    """
+    asyncio version of DeltaIoTClient, many clients can share one event loop
+    """
+
+    def __init__(
+        self,
+        timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        metrics=None,
+    ):
+        # see SwimClient
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+
+        self.address = None
+        self.reconnects = 0
+        self.reader = None
+        self.writer = None
+        self.decoder = JSONStreamDecoder()
+        # one batch at a time per connection
+        self.lock = asyncio.Lock()
+
+    async def connect(self, host, port):
+        self.address = (host, port)
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), self.timeout
+        )
+
+    async def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = None
+            self.writer = None
+        self.decoder.reset()
+
+    def is_connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def reconnect(self):
+        if self.address is None:
+            raise ConnectionError("not connected")
+        await self.disconnect()
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.connect(*self.address)
+                self.reconnects += 1
+                if self.metrics is not None:
+                    self.metrics.increment(RECONNECTS)
+                return
+            except OSError as err:
+                await self.disconnect()
+                if attempt == self.max_retries:
+                    raise ConnectionError(f"Reconnect to DeltaIoT failed: {err}")
+                log.warning("deltaiot_reconnect_failed", error=err, retry_in=delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    async def send_request(self, request, idempotent=True):
+        return (await self.send_requests([request], idempotent))[0]
+
+    async def send_requests(self, requests, idempotent=True):
+        # see DeltaIoTClient.send_requests
+        data = encode_requests(requests)
+        async with self.lock:
+            for attempt in range(self.max_retries + 1):
+                if not self.is_connected():
+                    await self.reconnect()
+                try:
+                    start = time.perf_counter()
+                    responses = await asyncio.wait_for(
+                        self._exchange(data, len(requests)), self.timeout
+                    )
+                    record_round_trip(
+                        self.metrics, requests, time.perf_counter() - start
+                    )
+                    return responses
+                except TimeoutError:
+                    error = TimeoutError("DeltaIoT response timed out")
+                except OSError as err:
+                    error = err
+                await self.disconnect()
+                if attempt == self.max_retries or not idempotent:
+                    raise ConnectionError(f"DeltaIoT request failed: {error}")
+                if self.metrics is not None:
+                    self.metrics.increment(RETRIES)
+                log.warning("deltaiot_request_failed", error=error, action="retrying")
+
+    async def _exchange(self, data, count):
+        self.writer.write(data)
+        await self.writer.drain()
+        while len(self.decoder.values) < count:
+            chunk = await self.reader.read(65536)
+            if not chunk:
+                raise ConnectionError("socket connection broken")
+            feed(self.decoder, chunk)
+        return self.decoder.take(count)
+
+    async def get_qos(self):
+        return await self.send_request(qos_request())
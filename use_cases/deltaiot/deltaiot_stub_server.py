@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import json
+
+import numpy as np
+
+from use_cases.deltaiot.deltaiot_client import (
+    ENERGY_CONSUMPTION,
+    PACKET_LOSS,
+    QOS,
+    REQUEST,
+)
+
+
+class DeltaIoTStubServer:
+    """
+    Local stand-in for the DeltaIoT simulator server: answers every QoS request
+    (one JSON object per line) with the QoS of all periods so far, one new period
+    per request. Responses are written in chunks of chunk_size bytes, so a client
+    decodes responses split over many reads. Other requests close the connection.
+    """
+
+    def __init__(self, chunk_size: int | None = None, seed: int | None = None) -> None:
+        """
+        chunk_size: int
+            bytes per write, None writes every response at once
+        """
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+        # period -> {EnergyConsumption, PacketLoss}
+        self.periods = {}
+
+    def qos(self) -> dict:
+        self.periods[str(len(self.periods))] = {
+            ENERGY_CONSUMPTION: 30.0 + 10.0 * self.rng.random(),
+            PACKET_LOSS: 0.05 + 0.05 * self.rng.random(),
+        }
+        return self.periods
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                if request.get(REQUEST) != QOS:
+                    break
+                data = (json.dumps(self.qos()) + "\n").encode("utf-8")
+                chunk_size = self.chunk_size or len(data)
+                for start in range(0, len(data), chunk_size):
+                    writer.write(data[start : start + chunk_size])
+                    await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "localhost", port: int = 9999):
+        # port 0 picks a free port, see server.sockets[0].getsockname()
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host: str = "localhost", port: int = 9999) -> None:
+        server = await self.start(host, port)
+        print(f"DeltaIoT stub server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local DeltaIoT stub server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--chunk-size", type=int, help="bytes per write")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    asyncio.run(
+        DeltaIoTStubServer(args.chunk_size, args.seed).serve(args.host, args.port)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas
+
+from models.cmab import UCB1, AdaptiveEpsilonGreedy, EpsilonGreedy, ThompsonSampling
+from models.event_log import WARNING, log
+from models.feature_model import CACHE_DIR, NumericalFM
+from use_cases.clock import VirtualClock
+from use_cases.swim.swim_adaptation_logic import (
+    SENSOR_FEATURES,
+    SWIMAdapatationLogic,
+    SWIMSimulatorInterface,
+    utility,
+)
+from use_cases.swim.swim_simulator import LocalSwimClient, SwimModel
+from use_cases.trace import TraceReader, replay_policy
+
+SWIM_FM = os.path.join("use_cases", "swim", "swim_fm.json")
+
+POLICIES = {
+    "epsilon_greedy": EpsilonGreedy,
+    "adaptive_epsilon_greedy": AdaptiveEpsilonGreedy,
+    "thompson_sampling": ThompsonSampling,
+    "ucb1": UCB1,
+}
+# grid parameters which are not arguments of the policy
+POLICY = "policy"
+DIMMER_INTERVAL = "dimmer_interval"
+ARRIVAL_RATE_INTERVAL = "arrival_rate_interval"
+
+# compiled feature models by (dimmer, arrival rate) interval size, filled before the
+# worker processes are forked so they share them instead of compiling their own
+_feature_models = {}
+
+
+def swim_fm_variant(
+    dimmer_interval: float | None = None,
+    arrival_rate_interval: float | None = None,
+    cache_dir: str | None = CACHE_DIR,
+) -> NumericalFM:
+    # SWIM feature model with other interval sizes, None keeps the size of the file
+    with open(SWIM_FM) as file:
+        fm_json = json.load(file)
+    if dimmer_interval is not None:
+        fm_json["interval size"]["dimmer"] = dimmer_interval
+    if arrival_rate_interval is not None:
+        fm_json["interval size"]["requestArrivalRate"] = arrival_rate_interval
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+        json.dump(fm_json, file)
+    try:
+        return NumericalFM(file.name, cache_dir=cache_dir)
+    finally:
+        os.remove(file.name)
+
+
+def _feature_model(key: tuple) -> NumericalFM:
+    if key not in _feature_models:
+        _feature_models[key] = swim_fm_variant(*key)
+    return _feature_models[key]
+
+
+def parameter_grid(grid: dict) -> list[dict]:
+    """
+    grid: dict
+        parameter name -> list of values, e.g.
+        {"policy": ["epsilon_greedy"], "epsilon": [0.1, 0.5], "learning_rate": [0.1]}
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+class _ExperimentAdaptationLogic(SWIMAdapatationLogic):
+    """
+    Records reward and regret of every cycle. The regret compares against the best
+    system configuration for the monitored arrival rate in the steady state of the
+    SwimModel.
+    """
+
+    def __init__(self, simulation_interface, cmab, feature_model, swim_model) -> None:
+        super().__init__(simulation_interface, cmab, feature_model)
+        self.swim_model = swim_model
+        # system configurations of the arms, without those pruned by constraints
+        self.system_values = [
+            (servers, dimmer)
+            for servers, dimmer in set(
+                zip(
+                    simulation_interface.target_servers.tolist(),
+                    simulation_interface.target_dimmers.tolist(),
+                )
+            )
+            if servers <= swim_model.max_servers
+        ]
+        self.rewards = []
+        self.regrets = []
+
+    def monitor(self):
+        configuration, reward = super().monitor()
+        arrival_rate = self.swim_model.get_arrival_rate()
+        best_reward = max(
+            utility(
+                arrival_rate,
+                dimmer,
+                self.swim_model.steady_state_response_time(
+                    arrival_rate, servers, dimmer
+                ),
+            )
+            for servers, dimmer in self.system_values
+        )
+        self.rewards.append(reward)
+        self.regrets.append(best_reward - reward)
+        return configuration, reward
+
+
+def run_experiment(
+    params: dict,
+    seed: int,
+    num_runs: int,
+    adaptation_loop_interval: float = 60,
+    simulator_options: dict | None = None,
+    trace_path: str | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    One run of one parameter combination, returns the reward and regret of every
+    cycle. Against the in-process SwimModel on a virtual clock, or with trace_path
+    the replay method on a recorded trace (regret unknown, NaN).
+    """
+    params = dict(params)
+    policy = POLICIES[params.pop(POLICY, "epsilon_greedy")]
+    feature_model = _feature_model(
+        (params.pop(DIMMER_INTERVAL, None), params.pop(ARRIVAL_RATE_INTERVAL, None))
+    )
+    np.random.seed(seed)
+    cmab = policy(feature_model, **params)
+
+    if trace_path is not None:
+        trace = TraceReader(trace_path)
+        row_ids = None
+        if trace.structure_hash != feature_model.structure_hash():
+            # recorded with other interval sizes
+            row_ids = trace.discretize(feature_model, SENSOR_FEATURES)
+        rewards = replay_policy(cmab, trace, row_ids=row_ids)["rewards"][:num_runs]
+        return rewards, np.full(len(rewards), np.nan)
+
+    clock = VirtualClock()
+    swim_model = SwimModel(clock=clock, seed=seed, **(simulator_options or {}))
+    simulator_interface = SWIMSimulatorInterface(
+        feature_model, swim_client=LocalSwimClient(swim_model), clock=clock
+    )
+    adaptation_logic = _ExperimentAdaptationLogic(
+        simulator_interface, cmab, feature_model, swim_model
+    )
+    with log.at_level(WARNING):
+        adaptation_logic.run(num_runs, adaptation_loop_interval)
+    return np.array(adaptation_logic.rewards), np.array(adaptation_logic.regrets)
+
+
+def _run_task(task: tuple) -> tuple:
+    index, params, seed, kwargs = task
+    try:
+        return index, seed, run_experiment(params, seed, **kwargs)
+    finally:
+        # pool workers exit without atexit, the events of the task would be lost
+        log.close()
+
+
+def run_experiments(
+    grid: dict,
+    seeds: list[int],
+    num_runs: int,
+    adaptation_loop_interval: float = 60,
+    simulator_options: dict | None = None,
+    trace_path: str | None = None,
+    max_workers: int | None = None,
+    num_points: int = 100,
+) -> pandas.DataFrame:
+    """
+    Runs every parameter combination of the grid with every seed in a process pool
+    (see run_experiment) and aggregates the cumulative reward and regret curves over
+    the seeds.
+
+    num_points: int
+        cycles of the curves in the result table, evenly spaced
+
+    Returns one row per parameter combination and curve point with the mean and
+    standard deviation of cumulative reward and regret over the seeds.
+    """
+    combinations = parameter_grid(grid)
+    # compile the feature models once, forked workers inherit them
+    for params in combinations:
+        _feature_model(
+            (params.get(DIMMER_INTERVAL), params.get(ARRIVAL_RATE_INTERVAL))
+        )
+
+    kwargs = {
+        "num_runs": num_runs,
+        "adaptation_loop_interval": adaptation_loop_interval,
+        "simulator_options": simulator_options,
+        "trace_path": trace_path,
+    }
+    tasks = [
+        (index, params, seed, kwargs)
+        for index, params in enumerate(combinations)
+        for seed in seeds
+    ]
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        # workers load the feature models from the compiled feature model cache
+        context = None
+
+    curves = {}
+    with ProcessPoolExecutor(max_workers, mp_context=context) as executor:
+        for index, seed, (rewards, regrets) in executor.map(_run_task, tasks):
+            curves.setdefault(index, []).append(
+                (np.cumsum(rewards), np.cumsum(regrets))
+            )
+
+    rows = []
+    for index, params in enumerate(combinations):
+        length = min(len(rewards) for rewards, _ in curves[index])
+        cumulative_rewards = np.array([rewards[:length] for rewards, _ in curves[index]])
+        cumulative_regrets = np.array([regrets[:length] for _, regrets in curves[index]])
+        points = np.unique(np.linspace(1, length, min(num_points, length), dtype=int))
+        for cycle in points:
+            rows.append(
+                {
+                    **params,
+                    "cycle": int(cycle),
+                    "cumulative_reward_mean": cumulative_rewards[:, cycle - 1].mean(),
+                    "cumulative_reward_std": cumulative_rewards[:, cycle - 1].std(),
+                    "cumulative_regret_mean": cumulative_regrets[:, cycle - 1].mean(),
+                    "cumulative_regret_std": cumulative_regrets[:, cycle - 1].std(),
+                    "seeds": len(curves[index]),
+                }
+            )
+    return pandas.DataFrame(rows)
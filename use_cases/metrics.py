@@ -0,0 +1,190 @@
+import bisect
+import contextlib
+import json
+import math
+import os
+import time
+
+# upper bounds in seconds of the latency histogram buckets, +Inf is implicit
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# metrics of the adaptation loop
+PHASE_SECONDS = "cascada_phase_seconds"
+CYCLE_SECONDS = "cascada_cycle_seconds"
+CYCLES = "cascada_cycles_total"
+OVERRUNS = "cascada_overruns_total"
+MISSED_TICKS = "cascada_missed_ticks_total"
+LATENESS_SECONDS = "cascada_lateness_seconds"
+BANDIT_DECISIONS = "cascada_bandit_decisions_total"
+BANDIT_UPDATES = "cascada_bandit_updates_total"
+REWARDS_NOT_LEARNED = "cascada_rewards_not_learned_total"
+
+# phases of the adaptation loop (label phase of PHASE_SECONDS)
+MONITOR = "monitor"
+FEEDBACK = "delayed_feedback_available"
+ANALYSIS_AND_PLAN = "analysis_and_plan"
+EXECUTE = "execute"
+
+# outcomes of a cycle (label outcome of CYCLES)
+ADAPTED = "adapted"
+NO_FEEDBACK = "no_feedback"
+FAILED = "failed"
+
+
+class Histogram:
+    """
+    Class used to represent the distribution of observed values in fixed buckets,
+    as Prometheus histograms
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS) -> None:
+        """
+        buckets: tuple of float
+            increasing upper bounds, values above the last one count as +Inf
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list[tuple[float, int]]:
+        # (upper bound, number of values <= bound), the last bound is inf
+        cumulative = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + [math.inf], self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+class Metrics:
+    """
+    Class used to represent counters and latency histograms of the adaptation loop,
+    identified by name and labels (e.g. phase="monitor"). Recording is a dict lookup
+    and an addition, the export to a Prometheus text file or JSON snapshot happens
+    only on request.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # (name, labels) -> value / Histogram, labels as sorted tuple of pairs
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        # observes the seconds spent in the with block, also if it raises
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name: str, **labels) -> float:
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name: str, **labels) -> Histogram | None:
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def to_prometheus(self) -> str:
+        # Prometheus text exposition format
+        lines = []
+        for kind, metrics in (
+            ("counter", self.counters),
+            ("histogram", self.histograms),
+        ):
+            typed = set()
+            for (name, labels), value in sorted(metrics.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {kind}")
+                    typed.add(name)
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                for bound, count in value.cumulative_counts():
+                    bucket_labels = labels + (("le", _format_bound(bound)),)
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} {count}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {value.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        # JSON snapshot: name -> list of {labels, value} / {labels, buckets, sum, count}
+        snapshot = {"counters": {}, "histograms": {}}
+        for (name, labels), value in sorted(self.counters.items()):
+            snapshot["counters"].setdefault(name, []).append(
+                {"labels": dict(labels), "value": value}
+            )
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            snapshot["histograms"].setdefault(name, []).append(
+                {
+                    "labels": dict(labels),
+                    "buckets": {
+                        _format_bound(bound): count
+                        for bound, count in histogram.cumulative_counts()
+                    },
+                    "sum": histogram.sum,
+                    "count": histogram.count,
+                }
+            )
+        return snapshot
+
+    def export(self, path: str) -> None:
+        """
+        Writes a JSON snapshot (.json) or a Prometheus text file (any other
+        extension, e.g. .prom for the node exporter textfile collector). The file is
+        replaced atomically, readers never see a partial export.
+        """
+        if path.endswith(".json"):
+            content = json.dumps(self.to_dict(), indent=4)
+        else:
+            content = self.to_prometheus()
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as file:
+            file.write(content)
+        os.replace(temporary_path, path)
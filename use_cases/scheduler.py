@@ -0,0 +1,85 @@
+from models.event_log import log
+from use_cases.clock import WallClock
+
+# overrun policies
+SKIP = "skip"
+CATCH_UP = "catch_up"
+
+
+class DeadlineScheduler:
+    """
+    Class used to run cycles on fixed deadlines start + k * interval of a monotonic
+    clock, so the period does not drift by the duration of the cycles
+    """
+
+    def __init__(self, interval: float, overrun_policy: str = SKIP, clock=None) -> None:
+        """
+        interval: float
+            period of the cycles in seconds
+        overrun_policy: str
+            what to do when a cycle ends after its deadline
+            SKIP: drop the missed ticks and start the next cycle on the next tick
+            CATCH_UP: start the next cycles immediately until the schedule is met
+        clock: WallClock
+            clock providing monotonic() and sleep()
+        """
+        if overrun_policy not in (SKIP, CATCH_UP):
+            raise ValueError("Invalid overrun policy", overrun_policy)
+        self.interval = interval
+        self.overrun_policy = overrun_policy
+        self.clock = clock if clock is not None else WallClock()
+
+        self.next_deadline = None
+        self.overruns = 0
+        self.missed_ticks = 0
+        self.max_lateness = 0.0
+        self.last_lateness = 0.0
+
+    def start(self) -> None:
+        self.next_deadline = self.clock.monotonic() + self.interval
+
+    def next_delay(self) -> float:
+        """
+        Called at the end of a cycle, returns how many seconds to wait before the next
+        one. The overrun of the finished cycle is stored in last_lateness.
+        """
+        if self.next_deadline is None:
+            self.start()
+        now = self.clock.monotonic()
+        self.last_lateness = 0.0
+
+        if self.interval <= 0:
+            return 0.0
+        if now <= self.next_deadline:
+            delay = self.next_deadline - now
+            self.next_deadline += self.interval
+            return delay
+
+        lateness = now - self.next_deadline
+        self.last_lateness = lateness
+        self.overruns += 1
+        self.max_lateness = max(self.max_lateness, lateness)
+        if self.overrun_policy == SKIP:
+            skipped = int(lateness // self.interval) + 1
+            self.missed_ticks += skipped
+            self.next_deadline += skipped * self.interval
+            delay = self.next_deadline - now
+        else:
+            # run the next cycle now, its deadline stays on the schedule
+            delay = 0.0
+        self.next_deadline += self.interval
+        log.warning(
+            "overrun",
+            lateness=lateness,
+            overruns=self.overruns,
+            missed_ticks=self.missed_ticks,
+        )
+        return delay
+
+    def wait_for_next_cycle(self) -> float:
+        """
+        Sleeps until the deadline of the next cycle. Returns by how many seconds the
+        finished cycle overran its deadline (0 if it was on time).
+        """
+        self.clock.sleep(self.next_delay())
+        return self.last_lateness
@@ -1,114 +1,202 @@
+import numpy as np
 import pandas
 
-from use_cases.swim.swim_client import SwimClient
-from use_cases.adaptation_logic import AdaptationLogic
+from use_cases.swim.swim_client import AsyncSwimClient, SwimClient
+from use_cases.adaptation_logic import AdaptationLogic, AsyncAdaptationLogic
 from models.feature_model import NumericalFM
 from models.cmab import CMAB
-from use_cases.adaptation_logic import SimulatorInterface
+from models.event_log import DEBUG, log
+from use_cases.adaptation_logic import AsyncSimulatorInterface, SimulatorInterface
+from use_cases.metrics import Metrics
 
-import time
 
+# monitoring values of the numerical features, see TraceReader.discretize
+SENSOR_FEATURES = {
+    "arrival_rate": "requestArrivalRate",
+    "servers": "servers",
+    "dimmer": "dimmer",
+}
 
-class SWIMSimulatorInterface(SimulatorInterface):
 
-    def __init__(self, feature_model: NumericalFM) -> None:
-        super().__init__(feature_model)
-        self.swim_client = SwimClient()
+def utility(
+    arrival_rate: float, dimmer: float, average_response_time: float
+) -> float:
+    # SWIM utility of one adaptation interval
+    maximum_response_time = 0.75  # T
+    tau = 60  # adaptation_interval
+    r_m = 1
+    r_o = 1.5
+    kappa = 67.4
+    if average_response_time <= maximum_response_time:
+        return tau * arrival_rate * (dimmer * r_o + (1 - dimmer) * r_m)
+    return tau * min(0, arrival_rate - kappa) * r_o
 
-        self.servers = None
-        self.dimmer = None
 
-    def sensor_interface(self) -> tuple[pandas.Series, float]:
+class SWIMTranslation:
+    """
+    Translation between SWIM values and Feature Model configurations, shared by the
+    synchronous and the asynchronous SWIM interface
+    """
 
-        arrival_rate = self.swim_client.get_arrival_rate()
+    def configuration_and_reward(
+        self, monitoring_values: dict
+    ) -> tuple[pandas.Series, float]:
+        # monitoring_values: see SwimClient.get_monitoring_values
+        arrival_rate = monitoring_values["arrival_rate"]
         if arrival_rate == None:
             raise ValueError("Simulator not connected?")
 
-        servers = self.swim_client.get_servers()
+        servers = monitoring_values["servers"]
         self.servers = servers
-        dimmer = round(self.swim_client.get_dimmer(), 2)
+        self.active_servers = monitoring_values["active_servers"]
+        dimmer = round(monitoring_values["dimmer"], 2)
         self.dimmer = dimmer
+        average_response_time = monitoring_values["average_response_time"]
 
-        arrival_rate_feature = (
-            self.feature_model.numerical_feature_value_to_numerical_name(
-                "requestArrivalRate", arrival_rate
-            )
-        )
-        servers_feature = self.feature_model.numerical_feature_value_to_numerical_name(
-            "servers", servers
+        configuration = self.configuration_encoder.configuration(
+            (arrival_rate, servers, dimmer)
         )
-        dimmer_feature = self.feature_model.numerical_feature_value_to_numerical_name(
-            "dimmer", dimmer
+
+        reward = utility(arrival_rate, dimmer, average_response_time)
+
+        log.debug("monitor", arrival_rate=arrival_rate, reward=reward)
+        self.record(monitoring_values, configuration, reward)
+        return configuration, reward
+
+    def feature_model_changed(self) -> None:
+        super().feature_model_changed()
+        self.build_configuration_encoder()
+        self.build_effector_plan()
+
+    def build_configuration_encoder(self) -> None:
+        # monitored (arrival rate, servers, dimmer) -> configuration
+        self.configuration_encoder = self.feature_model.configuration_encoder(
+            ["requestArrivalRate", "servers", "dimmer"]
         )
 
-        configuration = pandas.Series(
-            pandas.Series(
-                0,
-                index=self.feature_model.valid_configurations_numerical.drop(
-                    columns=["R", "N"]
-                ).columns,
-            )
+    def build_effector_plan(self) -> None:
+        """
+        Target servers and dimmer of every arm (configuration row), computed once
+        from the feature model so the execute phase is a table lookup
+        """
+        sub_features = self.feature_model.numerical_sub_features
+        space = self.feature_model.configuration_space
+        feature_names = list(self.feature_model.features)
+        numerical_names = [
+            feature_names[feature_index] for feature_index, _ in space.numerical_features
+        ]
+        _, digits = space.digits(np.arange(len(space)))
+
+        server_values = np.array(
+            [sub_feature.get_value() for sub_feature in sub_features["servers"]]
         )
-        for feature in ["root", "system", "context", "servers", "dimmer"]:
-            configuration[feature] = 1
-        configuration["requestArrivalRate"] = 1
-        configuration[arrival_rate_feature] = 1
-        configuration[servers_feature] = 1
-        configuration[dimmer_feature] = 1
-
-        # Utility
-        maximum_response_time = 0.75  # T
-        average_response_time = self.swim_client.get_average_response_time()
-        tau = 60  # adaptation_interval
-        r_m = 1
-        r_o = 1.5
-        kappa = 67.4
-        if average_response_time <= maximum_response_time:
-            reward = tau * arrival_rate * (dimmer * r_o + (1 - dimmer) * r_m)
+        dimmer_values = np.array(
+            [round(sub_feature.get_value(), 2) for sub_feature in sub_features["dimmer"]]
+        )
+        self.target_servers = server_values[digits[:, numerical_names.index("servers")]]
+        self.target_dimmers = dimmer_values[digits[:, numerical_names.index("dimmer")]]
+
+        # configurations without row id: sub feature name -> (feature, value)
+        self.sub_feature_targets = {
+            sub_feature.name: (feature_name, value)
+            for feature_name, values in [
+                ("servers", server_values),
+                ("dimmer", dimmer_values),
+            ]
+            for sub_feature, value in zip(sub_features[feature_name], values)
+        }
+
+    def target_values(self, configuration: pandas.Series) -> tuple[int, float]:
+        # servers and dimmer of a system configuration, the name of configurations
+        # selected by the CMAB is their row id (see ConfigurationSpace.decode)
+        row_id = configuration.name
+        if isinstance(row_id, (int, np.integer)) and 0 <= row_id < len(
+            self.target_servers
+        ):
+            return int(self.target_servers[row_id]), float(self.target_dimmers[row_id])
+
+        targets = {}
+        for index in configuration.index[configuration.to_numpy() == 1]:
+            if index in self.sub_feature_targets:
+                feature_name, value = self.sub_feature_targets[index]
+                targets[feature_name] = value
+        return int(targets["servers"]), float(targets["dimmer"])
+
+    def effector_commands(self, new_servers: int, new_dimmer: float) -> list[str]:
+        server_delta = new_servers - self.servers
+        if server_delta > 0:
+            commands = ["add_server\n"] * server_delta
         else:
-            reward = tau * min(0, arrival_rate - kappa) * r_o
+            commands = ["remove_server\n"] * -server_delta
+        if new_dimmer != self.dimmer:
+            commands.append("set_dimmer {}\n".format(new_dimmer))
+        return commands
 
-        print(f"-M-onitor: arrival rate: {arrival_rate}, reward: {reward}")
-        return configuration, reward
+    def print_execution(self, new_servers: int, new_dimmer: float) -> None:
+        if log.enabled(DEBUG):
+            log.debug(
+                "execute",
+                servers=self.servers,
+                new_servers=new_servers,
+                dimmer=self.dimmer,
+                new_dimmer=new_dimmer,
+            )
+
+
+class SWIMSimulatorInterface(SWIMTranslation, SimulatorInterface):
+
+    def __init__(
+        self,
+        feature_model: NumericalFM,
+        host: str = "localhost",
+        port: int = 4242,
+        swim_client: SwimClient | None = None,
+        clock=None,
+        trace_writer=None,
+    ) -> None:
+        """
+        swim_client: SwimClient
+            e.g. a LocalSwimClient to run against the in-process SwimModel
+        clock: WallClock, AcceleratedClock or VirtualClock
+            time of the simulator (e.g. the clock of the SwimModel)
+        trace_writer: TraceWriter
+            logs the monitoring values of every cycle
+        """
+        super().__init__(feature_model, clock, trace_writer)
+        self.swim_client = swim_client if swim_client is not None else SwimClient()
+        self.host = host
+        self.port = port
+
+        self.servers = None
+        self.active_servers = None
+        self.dimmer = None
+        self.build_configuration_encoder()
+        self.build_effector_plan()
+
+    def sensor_interface(self) -> tuple[pandas.Series, float]:
+        # all probes in one pipelined round trip
+        return self.configuration_and_reward(self.swim_client.get_monitoring_values())
 
     def effector_interface(self, configuration: pandas.Series) -> None:
-        for index, value in configuration.items():
-            numerical_sub_features = [
-                sub_feature.name
-                for _, sub_features in self.feature_model.numerical_sub_features.items()
-                for sub_feature in sub_features
-            ]
-            if value == 1:
-                if index in numerical_sub_features:
-                    sub_feature = self.feature_model.numerical_feature_name_to_feature(
-                        index
-                    )
-
-                    if sub_feature.parent.name == "servers":
-                        new_servers = sub_feature.get_value()
-                    if sub_feature.parent.name == "dimmer":
-                        new_dimmer = round(sub_feature.get_value(), 2)
-
-        if new_servers < self.servers:
-            # remove servers
-            for _ in range(self.servers - new_servers):
-                self.swim_client.remove_server()
-        elif new_servers > self.servers:
-            # add servers
-            for _ in range(new_servers - self.servers):
-                self.swim_client.add_server()
-        if new_dimmer != self.dimmer:
-            self.swim_client.set_dimmer(new_dimmer)
+        new_servers, new_dimmer = self.target_values(configuration)
 
-        if new_servers == self.servers and new_dimmer == self.dimmer:
-            print("-E-xecute: No reconfiguration")
-        else:
-            print(
-                f"-E-xecute: Servers: Server-Delta: {new_servers - self.servers}\t Dimmer-Delta: {round(new_dimmer - self.dimmer, 2)}\tServers: {self.servers} -> {new_servers}, Dimmer: {self.dimmer} -> {new_dimmer}"
+        commands = self.effector_commands(new_servers, new_dimmer)
+        if commands:
+            # server delta and dimmer change in one round trip
+            self.swim_client.send_commands(
+                commands, idempotent=new_servers == self.servers
             )
 
+        self.print_execution(new_servers, new_dimmer)
+
+    def attach_metrics(self, metrics: Metrics) -> None:
+        # the SWIM client records its command latency there unless it has metrics
+        super().attach_metrics(metrics)
+        if self.swim_client.metrics is None:
+            self.swim_client.metrics = metrics
+
     def connect_to_simulator(self):
-        self.swim_client.connect("localhost", 4242)
+        self.swim_client.connect(self.host, self.port)
 
     def disconnect_from_simulator(self):
         self.swim_client.disconnect()
@@ -121,8 +209,9 @@ class SWIMAdapatationLogic(AdaptationLogic):
         simulation_interface: SimulatorInterface,
         cmab: CMAB,
         feature_model: NumericalFM,
+        metrics: Metrics | None = None,
     ) -> None:
-        super().__init__(simulation_interface, cmab, feature_model)
+        super().__init__(simulation_interface, cmab, feature_model, metrics)
 
     def monitor(self) -> tuple[pandas.Series, float]:
         try:
@@ -131,11 +220,12 @@ class SWIMAdapatationLogic(AdaptationLogic):
             raise
 
     def delayed_feedback_available(self) -> bool:
+        # servers / active servers were probed in the monitor phase
         if (
-            self.simulation_interface.swim_client.get_active_servers()
-            != self.simulation_interface.swim_client.get_servers()
+            self.simulation_interface.active_servers
+            != self.simulation_interface.servers
         ):
-            print("Adding server")
+            log.debug("adding_server")
             return False
         return True
 
@@ -143,3 +233,80 @@ class SWIMAdapatationLogic(AdaptationLogic):
         self.simulation_interface.effector_interface(
             self.get_only_system(system_configuration)
         )
+
+
+class AsyncSWIMSimulatorInterface(SWIMTranslation, AsyncSimulatorInterface):
+
+    def __init__(
+        self,
+        feature_model: NumericalFM,
+        host: str = "localhost",
+        port: int = 4242,
+        swim_client: AsyncSwimClient | None = None,
+        clock=None,
+        trace_writer=None,
+    ) -> None:
+        # see SWIMSimulatorInterface
+        super().__init__(feature_model, clock, trace_writer)
+        self.swim_client = (
+            swim_client if swim_client is not None else AsyncSwimClient()
+        )
+        self.host = host
+        self.port = port
+
+        self.servers = None
+        self.active_servers = None
+        self.dimmer = None
+        self.build_configuration_encoder()
+        self.build_effector_plan()
+
+    async def sensor_interface(self) -> tuple[pandas.Series, float]:
+        # all probes in one pipelined round trip
+        return self.configuration_and_reward(
+            await self.swim_client.get_monitoring_values()
+        )
+
+    async def effector_interface(self, configuration: pandas.Series) -> None:
+        new_servers, new_dimmer = self.target_values(configuration)
+
+        commands = self.effector_commands(new_servers, new_dimmer)
+        if commands:
+            await self.swim_client.send_commands(
+                commands, idempotent=new_servers == self.servers
+            )
+
+        self.print_execution(new_servers, new_dimmer)
+
+    def attach_metrics(self, metrics: Metrics) -> None:
+        # see SWIMSimulatorInterface.attach_metrics
+        super().attach_metrics(metrics)
+        if self.swim_client.metrics is None:
+            self.swim_client.metrics = metrics
+
+    async def connect_to_simulator(self):
+        await self.swim_client.connect(self.host, self.port)
+
+    async def disconnect_from_simulator(self):
+        await self.swim_client.disconnect()
+
+
+class AsyncSWIMAdaptationLogic(AsyncAdaptationLogic):
+
+    def __init__(
+        self,
+        simulation_interface: AsyncSWIMSimulatorInterface,
+        cmab: CMAB,
+        feature_model: NumericalFM,
+        metrics: Metrics | None = None,
+    ) -> None:
+        super().__init__(simulation_interface, cmab, feature_model, metrics)
+
+    async def delayed_feedback_available(self) -> bool:
+        # servers / active servers were probed in the monitor phase
+        if (
+            self.simulation_interface.active_servers
+            != self.simulation_interface.servers
+        ):
+            log.debug("adding_server")
+            return False
+        return True
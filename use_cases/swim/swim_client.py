@@ -1,52 +1,208 @@
+import asyncio
 import socket
+import time
+
+from models.event_log import log
+
+# probes of one monitor phase, sent as one pipelined batch: (name, command, type)
+MONITORING_PROBES = [
+    ("arrival_rate", "get_arrival_rate\n", float),
+    ("servers", "get_servers\n", int),
+    ("active_servers", "get_active_servers\n", int),
+    ("dimmer", "get_dimmer\n", float),
+    ("basic_throughput", "get_basic_throughput\n", float),
+    ("optional_throughput", "get_opt_throughput\n", float),
+    ("basic_response_time", "get_basic_rt\n", float),
+    ("optional_response_time", "get_opt_rt\n", float),
+]
+
+# metrics of the SWIM clients, see use_cases.metrics
+ROUND_TRIP_SECONDS = "swim_round_trip_seconds"
+COMMANDS = "swim_commands_total"
+RETRIES = "swim_retries_total"
+RECONNECTS = "swim_reconnects_total"
+
+
+def parse_probe(resp, value_type):
+    try:
+        return value_type(resp)
+    except ValueError as err:
+        log.warning("swim_probe_invalid", error=err, type=value_type.__name__)
+        return None
+
+
+def average_response_time(
+    basic_throughput, opt_throughput, basic_response_time, opt_response_time
+):
+    return (
+        basic_throughput * basic_response_time
+        + opt_throughput * opt_response_time / (basic_throughput + opt_throughput)
+    )
+
+
+def record_round_trip(metrics, commands, seconds):
+    # latency of one pipelined batch, labelled by its command name ("batch" if mixed)
+    if metrics is None:
+        return
+    names = [(command.split() or [""])[0] for command in commands]
+    label = names[0] if len(set(names)) == 1 else "batch"
+    metrics.observe(ROUND_TRIP_SECONDS, seconds, command=label)
+    for name in names:
+        metrics.increment(COMMANDS, command=name)
+
+
+def monitoring_values(responses):
+    values = {
+        name: parse_probe(resp, value_type)
+        for (name, _, value_type), resp in zip(MONITORING_PROBES, responses)
+    }
+    if None in values.values():
+        values["average_response_time"] = None
+    else:
+        values["average_response_time"] = average_response_time(
+            values["basic_throughput"],
+            values["optional_throughput"],
+            values["basic_response_time"],
+            values["optional_response_time"],
+        )
+    return values
 
 
 class SwimClient:
 
-    def __init__(self, sock=None):
-        if sock is None:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        else:
-            self.sock = sock
+    def __init__(
+        self,
+        sock=None,
+        timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        metrics=None,
+    ):
+        """
+        timeout: float
+            seconds a command (batch) may take until all responses are read
+        max_retries: int
+            reconnect attempts after a broken connection or timeout
+        backoff, max_backoff: float
+            seconds to wait before the first reconnect, doubled per attempt
+        metrics: Metrics
+            records round trip latency, commands, retries and reconnects (default:
+            the metrics of the AdaptationLogic, see attach_metrics)
+        """
+        self.sock = sock
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+
+        self.address = None
+        self.connected = False
+        self.reconnects = 0
+        # received bytes not yet consumed as a response line
+        self.buffer = b""
 
     def connect(self, host, port):
-        self.sock.connect((host, port))
+        self.address = (host, port)
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.address)
+        self.connected = True
 
     def disconnect(self):
-        self.sock.close()
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.connected = False
+        self.buffer = b""
 
     def is_connected(self):
-        pass
+        return self.connected
 
-    def send_command(self, command):
-        # socket write command
+    def reconnect(self):
+        # retries with exponential backoff, raises the last error
+        if self.address is None:
+            raise ConnectionError("not connected")
+        self.disconnect()
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.connect(*self.address)
+                self.reconnects += 1
+                if self.metrics is not None:
+                    self.metrics.increment(RECONNECTS)
+                return
+            except OSError as err:
+                self.disconnect()
+                if attempt == self.max_retries:
+                    raise ConnectionError(f"Reconnect to SWIM failed: {err}")
+                log.warning("swim_reconnect_failed", error=err, retry_in=delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def send_command(self, command, idempotent=True):
+        return self.send_commands([command], idempotent)[0]
+
+    def send_commands(self, commands, idempotent=True):
+        """
+        Pipelined: writes all commands, then reads one response line per command.
+        A broken connection or timeout triggers a reconnect, idempotent commands
+        (probes) are then sent again. Others (add / remove server) may already have
+        been applied, so the ConnectionError is raised instead.
+        """
+        for attempt in range(self.max_retries + 1):
+            if not self.connected:
+                self.reconnect()
+            try:
+                start = time.perf_counter()
+                deadline = time.monotonic() + self.timeout
+                self.write("".join(commands).encode("utf-8"))
+                responses = [self.read_line(deadline) for _ in commands]
+                record_round_trip(self.metrics, commands, time.perf_counter() - start)
+                return responses
+            except OSError as err:
+                # the stream may be out of sync, start from a fresh connection
+                self.disconnect()
+                if attempt == self.max_retries or not idempotent:
+                    raise ConnectionError(f"SWIM command failed: {err}")
+                if self.metrics is not None:
+                    self.metrics.increment(RETRIES)
+                log.warning("swim_command_failed", error=err, action="retrying")
+
+    def write(self, data):
         total_sent = 0
-        while total_sent < len(command):
-            sent = self.sock.send(command[total_sent:].encode("utf-8"))
+        while total_sent < len(data):
+            sent = self.sock.send(data[total_sent:])
             if sent == 0:
-                raise RuntimeError("socket connection broken")
+                raise ConnectionError("socket connection broken")
             total_sent = total_sent + sent
 
-        # socket read response
-        resp = self.sock.recv(2048)
-        return resp.decode("utf-8")
-        # error checking
+    def read_line(self, deadline):
+        while b"\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("SWIM response timed out")
+            self.sock.settimeout(remaining)
+            chunk = self.sock.recv(2048)
+            if not chunk:
+                raise ConnectionError("socket connection broken")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return line.decode("utf-8")
 
     def probe_float(self, command):
-        resp = self.send_command(command)
-        try:
-            return float(resp)
-        except ValueError as err:
-            print(err, "SWIM Client probe_float")
-            return None
+        return parse_probe(self.send_command(command), float)
 
     def probe_int(self, command):
-        resp = self.send_command(command)
-        try:
-            return int(resp)
-        except ValueError as err:
-            print(err, "SWIM Client probe_int")
-            return None
+        return parse_probe(self.send_command(command), int)
+
+    def get_monitoring_values(self):
+        # all MONITORING_PROBES in one round trip
+        return monitoring_values(
+            self.send_commands([command for _, command, _ in MONITORING_PROBES])
+        )
 
     # probes
     def get_dimmer(self):
@@ -81,31 +237,209 @@ class SwimClient:
 
     # effectors
     def add_server(self):
-        return self.send_command("add_server\n")
+        return self.send_command("add_server\n", idempotent=False)
 
     def remove_server(self):
-        return self.send_command("remove_server\n")
+        return self.send_command("remove_server\n", idempotent=False)
 
     def set_dimmer(self, dimmer):
         return self.send_command("set_dimmer {}\n".format(dimmer))
 
     # helper methods
     def get_total_utilization(self):
-        utilization = 0
         active_servers = self.get_active_servers()
         # server id starts at 1
-        for server_id in range(1, active_servers + 1):
-            utilization += self.get_utilization(server_id)
-        return utilization
+        responses = self.send_commands(
+            [
+                "get_utilization server{}\n".format(server_id)
+                for server_id in range(1, active_servers + 1)
+            ]
+        )
+        return sum(parse_probe(resp, float) for resp in responses)
 
     def get_average_response_time(self):
-        basic_throughput = self.get_basic_throughput()
-        opt_throughput = self.get_optional_throughput()
-
-        avg_response_time = (
-            basic_throughput * self.get_basic_response_time()
-            + opt_throughput
-            * self.get_optional_response_time()
-            / (basic_throughput + opt_throughput)
+        responses = self.send_commands(
+            [
+                "get_basic_throughput\n",
+                "get_opt_throughput\n",
+                "get_basic_rt\n",
+                "get_opt_rt\n",
+            ]
+        )
+        return average_response_time(
+            *[parse_probe(resp, float) for resp in responses]
+        )
+
+
+class AsyncSwimClient:
+    """
+    asyncio version of SwimClient, many clients can share one event loop
+    """
+
+    def __init__(
+        self,
+        timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        metrics=None,
+    ):
+        # see SwimClient
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+
+        self.address = None
+        self.reconnects = 0
+        self.reader = None
+        self.writer = None
+        # one request / response at a time per connection
+        self.lock = asyncio.Lock()
+
+    async def connect(self, host, port):
+        self.address = (host, port)
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), self.timeout
+        )
+
+    async def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = None
+            self.writer = None
+
+    def is_connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def reconnect(self):
+        if self.address is None:
+            raise ConnectionError("not connected")
+        await self.disconnect()
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.connect(*self.address)
+                self.reconnects += 1
+                if self.metrics is not None:
+                    self.metrics.increment(RECONNECTS)
+                return
+            except OSError as err:
+                await self.disconnect()
+                if attempt == self.max_retries:
+                    raise ConnectionError(f"Reconnect to SWIM failed: {err}")
+                log.warning("swim_reconnect_failed", error=err, retry_in=delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    async def send_command(self, command, idempotent=True):
+        return (await self.send_commands([command], idempotent))[0]
+
+    async def send_commands(self, commands, idempotent=True):
+        # see SwimClient.send_commands
+        async with self.lock:
+            for attempt in range(self.max_retries + 1):
+                if not self.is_connected():
+                    await self.reconnect()
+                try:
+                    start = time.perf_counter()
+                    responses = await asyncio.wait_for(
+                        self._exchange(commands), self.timeout
+                    )
+                    record_round_trip(
+                        self.metrics, commands, time.perf_counter() - start
+                    )
+                    return responses
+                except TimeoutError:
+                    error = TimeoutError("SWIM response timed out")
+                except OSError as err:
+                    error = err
+                await self.disconnect()
+                if attempt == self.max_retries or not idempotent:
+                    raise ConnectionError(f"SWIM command failed: {error}")
+                if self.metrics is not None:
+                    self.metrics.increment(RETRIES)
+                log.warning("swim_command_failed", error=error, action="retrying")
+
+    async def _exchange(self, commands):
+        self.writer.write("".join(commands).encode("utf-8"))
+        await self.writer.drain()
+        responses = []
+        for _ in commands:
+            resp = await self.reader.readline()
+            if not resp.endswith(b"\n"):
+                raise ConnectionError("socket connection broken")
+            responses.append(resp[:-1].decode("utf-8"))
+        return responses
+
+    async def probe_float(self, command):
+        return parse_probe(await self.send_command(command), float)
+
+    async def probe_int(self, command):
+        return parse_probe(await self.send_command(command), int)
+
+    async def get_monitoring_values(self):
+        # all MONITORING_PROBES in one round trip
+        return monitoring_values(
+            await self.send_commands([command for _, command, _ in MONITORING_PROBES])
+        )
+
+    # probes
+    async def get_dimmer(self):
+        return await self.probe_float("get_dimmer\n")
+
+    async def get_servers(self):
+        return await self.probe_int("get_servers\n")
+
+    async def get_active_servers(self):
+        return await self.probe_int("get_active_servers\n")
+
+    async def get_max_servers(self):
+        return await self.probe_int("get_max_servers\n")
+
+    async def get_utilization(self, server_id):
+        return await self.probe_float("get_utilization server{}\n".format(server_id))
+
+    async def get_basic_response_time(self):
+        return await self.probe_float("get_basic_rt\n")
+
+    async def get_optional_response_time(self):
+        return await self.probe_float("get_opt_rt\n")
+
+    async def get_basic_throughput(self):
+        return await self.probe_float("get_basic_throughput\n")
+
+    async def get_optional_throughput(self):
+        return await self.probe_float("get_opt_throughput\n")
+
+    async def get_arrival_rate(self):
+        return await self.probe_float("get_arrival_rate\n")
+
+    # effectors
+    async def add_server(self):
+        return await self.send_command("add_server\n", idempotent=False)
+
+    async def remove_server(self):
+        return await self.send_command("remove_server\n", idempotent=False)
+
+    async def set_dimmer(self, dimmer):
+        return await self.send_command("set_dimmer {}\n".format(dimmer))
+
+    # helper methods
+    async def get_average_response_time(self):
+        responses = await self.send_commands(
+            [
+                "get_basic_throughput\n",
+                "get_opt_throughput\n",
+                "get_basic_rt\n",
+                "get_opt_rt\n",
+            ]
+        )
+        return average_response_time(
+            *[parse_probe(resp, float) for resp in responses]
         )
-        return avg_response_time
@@ -0,0 +1,396 @@
+import argparse
+import asyncio
+import collections
+import math
+import time
+
+import numpy as np
+
+from use_cases.clock import AcceleratedClock, VirtualClock, WallClock
+from use_cases.swim.swim_client import (
+    AsyncSwimClient,
+    SwimClient,
+    average_response_time,
+    record_round_trip,
+)
+
+OK = "OK"
+# utilization used for the queueing delay of an overloaded system, the backlog of
+# requests adds the rest of the response time
+MAX_UTILIZATION = 0.95
+
+
+class ArrivalTrace:
+    """
+    Class used to represent the request arrival rate (requests / sec) over time,
+    linearly interpolated between the given points
+    """
+
+    def __init__(self, times, rates, loop: bool = True) -> None:
+        """
+        times: list of float
+            increasing points in time in seconds since the start of the simulation
+        rates: list of float
+            arrival rate at every point in time
+        loop: bool
+            whether the trace repeats after its last point, otherwise the last rate
+            is kept
+        """
+        self.times = np.asarray(times, dtype=float)
+        self.rates = np.asarray(rates, dtype=float)
+        if len(self.times) == 0 or len(self.times) != len(self.rates):
+            raise ValueError("Arrival trace needs one rate per point in time")
+        if np.any(np.diff(self.times) <= 0):
+            raise ValueError("Arrival trace times must be increasing")
+        self.loop = loop
+
+    def rate(self, time: float) -> float:
+        duration = self.times[-1] - self.times[0]
+        if self.loop and duration > 0:
+            time = self.times[0] + (time - self.times[0]) % duration
+        return float(np.interp(time, self.times, self.rates))
+
+    @classmethod
+    def from_csv(cls, path: str, loop: bool = True) -> "ArrivalTrace":
+        # two columns: time in seconds, arrival rate
+        data = np.loadtxt(path, delimiter=",", ndmin=2)
+        return cls(data[:, 0], data[:, 1], loop)
+
+    @classmethod
+    def sinusoidal(
+        cls,
+        mean: float = 40.0,
+        amplitude: float = 30.0,
+        period: float = 6300.0,
+        num_points: int = 64,
+    ) -> "ArrivalTrace":
+        # one load peak per period, default period is the 105 minutes of the SWIM
+        # world cup traces
+        times = np.linspace(0, period, num_points + 1)
+        rates = mean - amplitude * np.cos(2 * np.pi * times / period)
+        return cls(times, rates)
+
+
+class SwimModel:
+    """
+    Class used to represent a fluid queueing model of SWIM, a stand-in for the SWIM
+    simulator in offline experiments.
+
+    Requests arrive following an ArrivalTrace and are served by the active servers,
+    a request gets the optional content with probability dimmer. Added servers
+    become active after boot_delay, an overloaded system builds up a backlog of
+    requests. Probes report averages over the last window seconds. The model is
+    advanced lazily to the time of its clock whenever a command is executed.
+    """
+
+    def __init__(
+        self,
+        arrival_trace: ArrivalTrace | None = None,
+        clock=None,
+        max_servers: int = 3,
+        servers: int = 1,
+        dimmer: float = 1.0,
+        boot_delay: float = 60.0,
+        basic_service_time: float = 0.01,
+        optional_service_time: float = 0.04,
+        window: float = 60.0,
+        step: float = 1.0,
+        noise: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        """
+        arrival_trace: ArrivalTrace
+            arrival rate over time, ArrivalTrace.sinusoidal() if None
+        clock: WallClock, AcceleratedClock or VirtualClock
+            time of the simulation, VirtualClock() if None (in-process mode)
+        basic_service_time, optional_service_time: float
+            mean seconds a server needs for a request without / with optional content
+        window: float
+            seconds the probes average over (the SWIM evaluation period)
+        step: float
+            seconds per simulation step
+        noise: float
+            relative standard deviation of the arrival rate of every step
+        """
+        if servers < 1 or servers > max_servers:
+            raise ValueError("Invalid number of servers", servers)
+        self.arrival_trace = (
+            arrival_trace if arrival_trace is not None else ArrivalTrace.sinusoidal()
+        )
+        self.clock = clock if clock is not None else VirtualClock()
+        self.max_servers = max_servers
+        self.dimmer = dimmer
+        self.boot_delay = boot_delay
+        self.basic_service_time = basic_service_time
+        self.optional_service_time = optional_service_time
+        self.step = step
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+        self.start = self.clock.monotonic()
+        self.time = self.start
+        # time every server is (or will be) active, initial servers are active
+        self.server_ready_times = [self.start] * servers
+        self.backlog = 0.0
+        self.samples = collections.deque(maxlen=max(1, round(window / step)))
+
+        self.commands = {
+            "get_dimmer": self.get_dimmer,
+            "get_servers": self.get_servers,
+            "get_active_servers": self.get_active_servers,
+            "get_max_servers": self.get_max_servers,
+            "get_utilization": self.get_utilization,
+            "get_basic_rt": self.get_basic_rt,
+            "get_opt_rt": self.get_opt_rt,
+            "get_basic_throughput": self.get_basic_throughput,
+            "get_opt_throughput": self.get_opt_throughput,
+            "get_arrival_rate": self.get_arrival_rate,
+            "add_server": self.add_server,
+            "remove_server": self.remove_server,
+            "set_dimmer": self.set_dimmer,
+        }
+
+    def execute(self, command: str) -> str:
+        """
+        Executes one SWIM command line (e.g. "set_dimmer 0.5") and returns the
+        response without the line break
+        """
+        self.advance_to(self.clock.monotonic())
+        name, *args = command.split() or [""]
+        if name not in self.commands:
+            return f"error: unknown command {name}"
+        try:
+            return str(self.commands[name](*args))
+        except (TypeError, ValueError) as err:
+            return f"error: {err}"
+
+    def advance_to(self, time: float) -> None:
+        while self.time + self.step <= time:
+            sample, self.backlog = self._evaluate(self.time, self.step)
+            self.samples.append(sample)
+            self.time += self.step
+
+    def _active_servers(self, time: float) -> int:
+        return sum(ready_time <= time for ready_time in self.server_ready_times)
+
+    def _evaluate(self, time: float, step: float) -> tuple[tuple, float]:
+        # measurements of one step and the backlog after it
+        rate = self.arrival_trace.rate(time - self.start)
+        if self.noise > 0:
+            rate *= max(0.0, self.rng.normal(1.0, self.noise))
+        # the newest server is removed first, so one server is always active
+        capacity = self._active_servers(time) / self._service_time(self.dimmer)
+
+        demand = self.backlog + rate * step
+        served = min(demand, capacity * step)
+        throughput = served / step
+        utilization = min(rate / capacity, MAX_UTILIZATION)
+        waiting_time = (demand - served) / capacity
+        sample = (
+            rate,
+            (1 - self.dimmer) * throughput,
+            self.dimmer * throughput,
+            self.basic_service_time / (1 - utilization) + waiting_time,
+            self.optional_service_time / (1 - utilization) + waiting_time,
+            served / (capacity * step),
+        )
+        return sample, demand - served
+
+    def _service_time(self, dimmer: float) -> float:
+        return (
+            dimmer * self.optional_service_time
+            + (1 - dimmer) * self.basic_service_time
+        )
+
+    def steady_state_response_time(
+        self, rate: float, servers: int, dimmer: float
+    ) -> float:
+        """
+        Average response time (as computed from the probes by the SwimClient) with
+        all servers active and no backlog, inf if the servers are overloaded
+        """
+        capacity = servers / self._service_time(dimmer)
+        if rate <= 0:
+            return 0.0
+        if rate >= capacity:
+            return math.inf
+        utilization = min(rate / capacity, MAX_UTILIZATION)
+        return average_response_time(
+            (1 - dimmer) * rate,
+            dimmer * rate,
+            self.basic_service_time / (1 - utilization),
+            self.optional_service_time / (1 - utilization),
+        )
+
+    def _average(self, index: int) -> float:
+        if not self.samples:
+            # nothing simulated yet, report the current state
+            return self._evaluate(self.time, self.step)[0][index]
+        return sum(sample[index] for sample in self.samples) / len(self.samples)
+
+    # probes
+    def get_dimmer(self):
+        return self.dimmer
+
+    def get_servers(self):
+        return len(self.server_ready_times)
+
+    def get_active_servers(self):
+        return self._active_servers(self.time)
+
+    def get_max_servers(self):
+        return self.max_servers
+
+    def get_utilization(self, server):
+        # server ids start at 1, e.g. "server1"
+        server_id = int(server.removeprefix("server"))
+        if server_id < 1 or server_id > len(self.server_ready_times):
+            raise ValueError(f"unknown server {server}")
+        if self.server_ready_times[server_id - 1] > self.time:
+            return 0.0
+        return self._average(5)
+
+    def get_basic_rt(self):
+        return self._average(3)
+
+    def get_opt_rt(self):
+        return self._average(4)
+
+    def get_basic_throughput(self):
+        return self._average(1)
+
+    def get_opt_throughput(self):
+        return self._average(2)
+
+    def get_arrival_rate(self):
+        return self._average(0)
+
+    # effectors
+    def add_server(self):
+        if len(self.server_ready_times) >= self.max_servers:
+            raise ValueError("maximum number of servers reached")
+        self.server_ready_times.append(self.time + self.boot_delay)
+        return OK
+
+    def remove_server(self):
+        if len(self.server_ready_times) <= 1:
+            raise ValueError("minimum number of servers reached")
+        self.server_ready_times.pop()
+        return OK
+
+    def set_dimmer(self, dimmer):
+        dimmer = float(dimmer)
+        if dimmer < 0 or dimmer > 1:
+            raise ValueError(f"invalid dimmer {dimmer}")
+        self.dimmer = dimmer
+        return OK
+
+
+class LocalSwimClient(SwimClient):
+    """
+    SwimClient executing the commands on an in-process SwimModel, no simulator
+    process or socket needed
+    """
+
+    def __init__(self, model: SwimModel) -> None:
+        super().__init__()
+        self.model = model
+
+    def connect(self, host=None, port=None):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def send_commands(self, commands, idempotent=True):
+        start = time.perf_counter()
+        responses = [self.model.execute(command) for command in commands]
+        record_round_trip(self.metrics, commands, time.perf_counter() - start)
+        return responses
+
+
+class AsyncLocalSwimClient(AsyncSwimClient):
+    """
+    AsyncSwimClient executing the commands on an in-process SwimModel, with a shared
+    VirtualClock many adaptation loops run in simulated time
+    """
+
+    def __init__(self, model: SwimModel) -> None:
+        super().__init__()
+        self.model = model
+        self.connected = False
+
+    async def connect(self, host=None, port=None):
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def send_commands(self, commands, idempotent=True):
+        start = time.perf_counter()
+        responses = [self.model.execute(command) for command in commands]
+        record_round_trip(self.metrics, commands, time.perf_counter() - start)
+        return responses
+
+
+class SwimSimulatorServer:
+    """
+    TCP server speaking the SWIM command protocol (one command / response per line)
+    on top of a SwimModel, used in place of the SWIM docker container
+    """
+
+    def __init__(self, model: SwimModel) -> None:
+        self.model = model
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                response = self.model.execute(line.decode("utf-8"))
+                writer.write((response + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "localhost", port: int = 4242) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"SWIM simulator listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SWIM simulator")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=4242)
+    parser.add_argument("--trace", help="csv file: time (secs), arrival rate")
+    parser.add_argument("--max-servers", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=1.0,
+        help="simulated seconds per real second, the adaptation loop needs an "
+        "AcceleratedClock with the same speedup",
+    )
+    args = parser.parse_args()
+
+    arrival_trace = ArrivalTrace.from_csv(args.trace) if args.trace else None
+    clock = AcceleratedClock(args.speedup) if args.speedup != 1 else WallClock()
+    model = SwimModel(
+        arrival_trace,
+        clock=clock,
+        max_servers=args.max_servers,
+        noise=args.noise,
+        seed=args.seed,
+    )
+    asyncio.run(SwimSimulatorServer(model).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
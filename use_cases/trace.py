@@ -0,0 +1,280 @@
+import json
+import os
+
+import numpy as np
+import pandas
+
+from models.cmab import CMAB
+from models.feature_model import NumericalFM
+from use_cases.adaptation_logic import SimulatorInterface, StopAdaptation
+from use_cases.clock import VirtualClock
+
+# columns of every trace, the sensor values follow as SENSOR + name
+TIME = "time"
+ROW_ID = "row_id"
+REWARD = "reward"
+SENSOR = "sensor."
+META_FILE = "trace.json"
+
+
+class EndOfTrace(StopAdaptation):
+    # a ReplaySimulatorInterface replayed all cycles of its trace
+    pass
+
+
+def _column_file(path: str, column: str) -> str:
+    return os.path.join(path, column + ".bin")
+
+
+class TraceWriter:
+    """
+    Class used to represent an append-only columnar log of adaptation cycles: time,
+    raw sensor values, row id of the monitored configuration and reward.
+
+    Every column is a raw binary file of one numpy dtype in the trace directory, the
+    layout is described in trace.json. Rows are buffered and appended every
+    flush_every cycles. Reopening a trace continues it.
+    """
+
+    def __init__(self, path: str, structure_hash: str, flush_every: int = 64) -> None:
+        """
+        path: str
+            trace directory, created if missing
+        structure_hash: str
+            structure hash of the feature model the row ids belong to
+        """
+        self.path = path
+        self.structure_hash = structure_hash
+        self.flush_every = flush_every
+        self.sensors = None
+        self.buffer = []
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, META_FILE)):
+            meta = _read_meta(path, structure_hash)
+            self.sensors = meta["sensors"]
+            # drop a partially written last row
+            length = _num_rows(path, meta)
+            for column, dtype in meta["columns"].items():
+                os.truncate(
+                    _column_file(path, column), length * np.dtype(dtype).itemsize
+                )
+
+    def append(
+        self, time: float, sensor_values: dict, row_id: int, reward: float
+    ) -> None:
+        """
+        sensor_values: dict
+            raw sensor values (numbers or None), the keys of the first cycle define
+            the sensor columns
+        """
+        if self.sensors is None:
+            self.sensors = list(sensor_values)
+            self._write_meta()
+        self.buffer.append((time, row_id, reward, sensor_values))
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        times, row_ids, rewards, sensor_values = zip(*self.buffer)
+        columns = {
+            TIME: np.array(times, dtype=np.float64),
+            ROW_ID: np.array(row_ids, dtype=np.int64),
+            REWARD: np.array(rewards, dtype=np.float64),
+        }
+        for sensor in self.sensors:
+            columns[SENSOR + sensor] = np.array(
+                [values.get(sensor) for values in sensor_values], dtype=np.float64
+            )
+        for column, values in columns.items():
+            with open(_column_file(self.path, column), "ab") as file:
+                values.tofile(file)
+        self.buffer = []
+
+    def close(self) -> None:
+        self.flush()
+
+    def _write_meta(self) -> None:
+        columns = {TIME: "float64", ROW_ID: "int64", REWARD: "float64"}
+        for sensor in self.sensors:
+            columns[SENSOR + sensor] = "float64"
+        meta = {
+            "structure_hash": self.structure_hash,
+            "sensors": self.sensors,
+            "columns": columns,
+        }
+        with open(os.path.join(self.path, META_FILE), "w") as file:
+            json.dump(meta, file, indent=4)
+
+
+def _read_meta(path: str, structure_hash: str | None) -> dict:
+    with open(os.path.join(path, META_FILE)) as file:
+        meta = json.load(file)
+    if structure_hash is not None and meta["structure_hash"] != structure_hash:
+        raise ValueError("Trace belongs to a different feature model", path)
+    return meta
+
+
+def _num_rows(path: str, meta: dict) -> int:
+    return min(
+        os.path.getsize(_column_file(path, column)) // np.dtype(dtype).itemsize
+        for column, dtype in meta["columns"].items()
+    )
+
+
+class TraceReader:
+    """
+    Class used to represent a trace written by TraceWriter, the columns are memory
+    mapped so traces larger than the memory can be replayed
+    """
+
+    def __init__(self, path: str, structure_hash: str | None = None) -> None:
+        meta = _read_meta(path, structure_hash)
+        self.path = path
+        self.structure_hash = meta["structure_hash"]
+        self.sensors = meta["sensors"]
+        self.num_rows = _num_rows(path, meta)
+
+        self.columns = {}
+        for column, dtype in meta["columns"].items():
+            if self.num_rows == 0:
+                self.columns[column] = np.zeros(0, dtype=dtype)
+            else:
+                self.columns[column] = np.memmap(
+                    _column_file(path, column),
+                    dtype=dtype,
+                    mode="r",
+                    shape=(self.num_rows,),
+                )
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def discretize(
+        self, feature_model: NumericalFM, sensor_features: dict
+    ) -> np.ndarray:
+        """
+        Row ids of the recorded sensor values in another feature model, e.g. one with
+        other interval sizes
+
+        sensor_features: dict
+            sensor name -> numerical feature name
+        """
+        return feature_model.values_to_row_ids(
+            {
+                feature: self.columns[SENSOR + sensor]
+                for sensor, feature in sensor_features.items()
+            }
+        )
+
+    def sensor_values(self, index: int) -> dict:
+        values = {}
+        for sensor in self.sensors:
+            value = float(self.columns[SENSOR + sensor][index])
+            values[sensor] = None if np.isnan(value) else value
+        return values
+
+
+class ReplaySimulatorInterface(SimulatorInterface):
+    """
+    Feeds a recorded trace back through an AdaptationLogic one cycle per loop
+    iteration. Runs on a VirtualClock by default, so the loop does not wait for its
+    interval. The end of the trace ends AdaptationLogic.run (EndOfTrace).
+    """
+
+    def __init__(
+        self, feature_model: NumericalFM, trace: TraceReader | str, clock=None
+    ) -> None:
+        """
+        trace: TraceReader or str
+            trace (directory) recorded with the same feature model
+        """
+        super().__init__(
+            feature_model, clock if clock is not None else VirtualClock()
+        )
+        if isinstance(trace, str):
+            trace = TraceReader(trace, feature_model.structure_hash())
+        self.trace = trace
+        self.position = 0
+        # selected system configurations equal to the logged next one
+        self.matched = 0
+
+    def sensor_interface(self) -> tuple[pandas.Series, float]:
+        # cycles without arm (row id -1) are skipped
+        row_ids = self.trace.columns[ROW_ID]
+        while self.position < len(self.trace) and row_ids[self.position] < 0:
+            self.position += 1
+        if self.position >= len(self.trace):
+            raise EndOfTrace("End of trace", self.trace.path)
+        row_id = int(row_ids[self.position])
+        reward = float(self.trace.columns[REWARD][self.position])
+        self.position += 1
+        return self.feature_model.configuration_space.decode(row_id), reward
+
+    def effector_interface(self, configuration: pandas.Series) -> None:
+        # the next logged configuration shows the action of the recording policy
+        if (
+            self.position < len(self.trace)
+            and self.trace.columns[ROW_ID][self.position] >= 0
+        ):
+            logged = self.feature_model.configuration_space.decode(
+                int(self.trace.columns[ROW_ID][self.position])
+            )
+            if (logged.loc[configuration.index] == configuration).all():
+                self.matched += 1
+
+    def feature_model_changed(self) -> None:
+        # the logged row ids cannot be replayed on other arms
+        if self.trace.structure_hash != self.feature_model.structure_hash():
+            raise ValueError(
+                "Trace recorded with another feature model", self.trace.path
+            )
+
+
+def replay_policy(
+    cmab: CMAB,
+    trace: TraceReader,
+    batch_size: int = 32,
+    row_ids: np.ndarray | None = None,
+) -> dict:
+    """
+    Offline evaluation of a bandit policy with the replay method: in the context of
+    every logged cycle the policy picks an arm, only cycles where it picks the
+    logged configuration count and the policy learns their reward. Unbiased for
+    traces of a uniformly random (logging) policy.
+
+    batch_size: int
+        cycles decided at once, the policy learns after every batch
+    row_ids: numpy.ndarray
+        logged configurations in the feature model of the policy, see
+        TraceReader.discretize (default: the recorded row ids)
+    """
+    if row_ids is None:
+        row_ids = trace.columns[ROW_ID]
+    row_contexts = cmab.arm_index.row_contexts
+    # reward of every cycle, 0 for cycles not matched
+    matched_rewards = np.zeros(len(trace), dtype=np.float64)
+    matched = 0
+    for start in range(0, len(trace), batch_size):
+        batch = np.asarray(row_ids[start : start + batch_size])
+        rewards = np.asarray(trace.columns[REWARD][start : start + batch_size])
+        # configurations without arm (row id -1) never match
+        chosen = cmab.choose_arms(
+            cmab.arm_index.arm_matrix[row_contexts[np.maximum(batch, 0)]]
+        )
+        hits = (chosen == batch) & (batch >= 0)
+        if np.any(hits):
+            cmab.update_arms(batch[hits], rewards[hits])
+        matched += int(np.count_nonzero(hits))
+        matched_rewards[start : start + len(hits)] = np.where(hits, rewards, 0.0)
+
+    cumulative_reward = float(matched_rewards.sum())
+    return {
+        "cycles": len(trace),
+        "matched": matched,
+        "cumulative_reward": cumulative_reward,
+        "mean_reward": cumulative_reward / matched if matched else float("nan"),
+        "rewards": matched_rewards,
+    }